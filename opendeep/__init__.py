@@ -30,7 +30,19 @@ def function(*args, **kwargs):
     A wrapper around theano.function that disables the on_unused_input error.
     Almost no part of OpenDeep can assume that an unused input is an error, so
     the default from theano is inappropriate for this project.
+
+    When the compiled function cache is on (see opendeep.utils.function_cache),
+    functions compiled before are loaded from disk instead of being optimized again.
+
+    When profiling is on (see opendeep.utils.profiling), functions are compiled
+    with theano profiling and collected for the profile report.
     """
+    # imported here because the cache uses opendeep.utils, which imports this module
+    from opendeep.utils import function_cache, profiling
+    if profiling.is_active() and not kwargs.get('profile'):
+        kwargs['profile'] = profiling.new_profile(kwargs.get('name'))
+    if function_cache.is_enabled():
+        return function_cache.compile_function(*args, on_unused_input='warn', **kwargs)
     return theano.function(*args, on_unused_input='warn', **kwargs)
 
 def grad(*args, **kwargs):
@@ -3,7 +3,7 @@
 
 Generic structure for a dataset, and common sub-classes to deal with files/urls or arrays from numpy/scipy (in memory).
 """
-# TODO: add large dataset support with database connections, numpy.memmap, h5py, pytables
+# TODO: add large dataset support with database connections
 # TODO: (and in the future grabbing from pipelines like spark)
 
 __authors__ = "Markus Beissinger"
@@ -17,8 +17,17 @@ __email__ = "opendeep-dev@googlegroups.com"
 import logging
 import os
 import shutil
+from collections import OrderedDict
 # third party libraries
 import numpy
+import theano
+import theano.tensor as T
+# check if h5py is installed (needed for the HDF5Dataset)
+try:
+    import h5py
+    has_h5py = True
+except ImportError:
+    has_h5py = False
 # internal imports
 from opendeep import sharedX
 from opendeep.utils.file_ops import mkdir_p, get_file_type, download_file
@@ -41,6 +50,112 @@ def get_subset_strings(subset):
     else:
         return str(subset)
 
+# storage formats for the example values of in-memory datasets
+STORAGE_FLOATX = 'floatX'  # theano.config.floatX, as given
+STORAGE_UINT8  = 'uint8'   # one byte per value, as round(value/scale)
+STORAGE_BITS   = 'bits'    # binary 0/1 values packed 8 to a byte with numpy.packbits along the last axis
+
+def compact_storage(array, storage, scale=1.):
+    """
+    Converts an array of example values into the compact storage format.
+
+    :param array: the example values
+    :type array: numpy.ndarray
+
+    :param storage: the storage format (STORAGE_FLOATX, STORAGE_UINT8, or STORAGE_BITS)
+    :type storage: String
+
+    :param scale: for STORAGE_UINT8, the value represented by one unit of the stored integers
+    (i.e. 1./255 for pixel intensities in [0, 1]).
+    :type scale: Float
+
+    :return: the values in the storage format
+    :rtype: numpy.ndarray
+    """
+    if storage == STORAGE_FLOATX:
+        return numpy.asarray(array, dtype=theano.config.floatX)
+    elif storage == STORAGE_UINT8:
+        return numpy.round(numpy.asarray(array) / scale).clip(0, 255).astype('uint8')
+    elif storage == STORAGE_BITS:
+        return numpy.packbits(numpy.asarray(array) > 0.5, axis=-1)
+    else:
+        log.error("Storage format %s not recognized, try STORAGE_FLOATX, STORAGE_UINT8, or STORAGE_BITS", str(storage))
+        raise NotImplementedError("Storage format %s not recognized!" % str(storage))
+
+def expand_storage(array, storage, scale=1., n_features=None):
+    """
+    Converts a batch of compactly stored example values back into floatX. This is the gather-time cast.
+
+    :param array: the stored values
+    :type array: numpy.ndarray
+
+    :param storage: the storage format (STORAGE_FLOATX, STORAGE_UINT8, or STORAGE_BITS)
+    :type storage: String
+
+    :param scale: for STORAGE_UINT8, the value represented by one unit of the stored integers
+    :type scale: Float
+
+    :param n_features: for STORAGE_BITS, the original length of the last axis (packing pads it to a multiple of 8)
+    :type n_features: Integer
+
+    :return: the floatX values
+    :rtype: numpy.ndarray
+    """
+    if storage == STORAGE_FLOATX:
+        return array
+    elif storage == STORAGE_UINT8:
+        values = numpy.asarray(array, dtype=theano.config.floatX)
+        if scale != 1.:
+            values *= numpy.cast[theano.config.floatX](scale)
+        return values
+    elif storage == STORAGE_BITS:
+        values = numpy.unpackbits(numpy.asarray(array), axis=-1)
+        if n_features is not None:
+            values = values[..., :n_features]
+        return values.astype(theano.config.floatX)
+    else:
+        log.error("Storage format %s not recognized, try STORAGE_FLOATX, STORAGE_UINT8, or STORAGE_BITS", str(storage))
+        raise NotImplementedError("Storage format %s not recognized!" % str(storage))
+
+def expand_symbolic_storage(variable, storage, scale=1.):
+    """
+    Converts compactly stored example values back into floatX inside a theano graph. This is the in-graph cast used
+    when the optimizer slices the dataset's shared variables directly.
+
+    :param variable: the symbolic stored values
+    :type variable: theano expression
+
+    :param storage: the storage format (STORAGE_FLOATX or STORAGE_UINT8 - bits can't be unpacked in the graph)
+    :type storage: String
+
+    :param scale: for STORAGE_UINT8, the value represented by one unit of the stored integers
+    :type scale: Float
+
+    :return: the symbolic floatX values
+    :rtype: theano expression
+    """
+    if storage == STORAGE_FLOATX:
+        return variable
+    elif storage == STORAGE_UINT8:
+        values = T.cast(variable, theano.config.floatX)
+        if scale != 1.:
+            values = values * numpy.cast[theano.config.floatX](scale)
+        return values
+    else:
+        log.error("Storage format %s can't be expanded inside the theano graph - use the data from "
+                  "getDataByIndices instead.", str(storage))
+        raise NotImplementedError("Storage format %s can't be expanded inside the theano graph!" % str(storage))
+
+def storage_dtype(storage):
+    """
+    :return: the numpy dtype used to hold values in the storage format
+    :rtype: String
+    """
+    if storage == STORAGE_FLOATX:
+        return theano.config.floatX
+    else:
+        return 'uint8'
+
 # TODO: I don't think this is very efficient implementation, especially with the iterators.
 # However, it is flexible. Need to look into it further to optimize.
 class Dataset(object):
@@ -53,8 +168,9 @@ class Dataset(object):
     def getDataByIndices(self, indices, subset):
         '''
         This method is used by an iterator to return data values at given indices.
-        :param indices: either integer or list of integers
-        The index (or indices) of values to return
+        :param indices: either integer, list of integers, or slice
+        The index (or indices) of values to return. A slice of contiguous indices returns a view without copying
+        (when the storage allows it).
         :param subset: integer
         The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
         :return: array
@@ -67,8 +183,9 @@ class Dataset(object):
     def getLabelsByIndices(self, indices, subset):
         '''
         This method is used by an iterator to return data label values at given indices.
-        :param indices: either integer or list of integers
-        The index (or indices) of values to return
+        :param indices: either integer, list of integers, or slice
+        The index (or indices) of values to return. A slice of contiguous indices returns a view without copying
+        (when the storage allows it).
         :param subset: integer
         The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
         :return: array
@@ -78,6 +195,36 @@ class Dataset(object):
         raise NotImplementedError()
 
 
+    def getSymbolicDataByIndices(self, indices, subset):
+        '''
+        This method is used by an optimizer to slice the data values at given indices inside a theano graph, for
+        datasets that keep their data in theano shared variables.
+        :param indices: theano integer vector
+        The symbolic indices of values to return
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: theano expression
+        The symbolic dataset values at the indices
+        '''
+        log.critical('No getSymbolicDataByIndices method implemented for %s!', str(type(self)))
+        raise NotImplementedError()
+
+
+    def getSymbolicLabelsByIndices(self, indices, subset):
+        '''
+        This method is used by an optimizer to slice the data label values at given indices inside a theano graph,
+        for datasets that keep their labels in theano shared variables.
+        :param indices: theano integer vector
+        The symbolic indices of values to return
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: theano expression
+        The symbolic dataset labels at the indices
+        '''
+        log.critical('No getSymbolicLabelsByIndices method implemented for %s!', str(type(self)))
+        raise NotImplementedError()
+
+
     def hasSubset(self, subset):
         '''
         :param subset: integer
@@ -216,15 +363,15 @@ class FileDataset(Dataset):
 
             # if the file wasn't found, download it if a source was provided. Otherwise, raise error.
             download_success = True
-            if self.source is not None:
-                if file_type is None:
+            if file_type is None:
+                if self.source is not None:
                     download_success = download_file(self.source, dataset_location)
                     file_type = get_file_type(dataset_location)
-            else:
-                log.error("Filename %s couldn't be found, and no URL source to download was provided.",
-                          str(self.filename))
-                raise RuntimeError("Filename %s couldn't be found, and no URL source to download was provided." %
-                                   str(self.filename))
+                else:
+                    log.error("Filename %s couldn't be found, and no URL source to download was provided.",
+                              str(self.filename))
+                    raise RuntimeError("Filename %s couldn't be found, and no URL source to download was provided." %
+                                       str(self.filename))
 
             # if the file type is a zip, unzip it.
             unzip_success = True
@@ -271,65 +418,568 @@ class MemoryDataset(Dataset):
     Dataset object wrapper for something given in memory (numpy matrix, theano matrix)
     '''
 
-    def __init__(self, train_X, train_Y=None, valid_X=None, valid_Y=None, test_X=None, test_Y=None):
+    def __init__(self, train_X, train_Y=None, valid_X=None, valid_Y=None, test_X=None, test_Y=None,
+                 storage=STORAGE_FLOATX, scale=1., label_dtype=None, subset_ranges=None):
+        '''
+        Arrays that are already in the storage dtype are wrapped without copying - changing them afterwards changes
+        the dataset.
+
+        :param storage: how to hold the example values in memory - STORAGE_FLOATX, or the compact STORAGE_UINT8 or
+        STORAGE_BITS. Compact values are cast back to floatX when a batch is gathered (or inside the graph).
+        :type storage: String
+
+        :param scale: for STORAGE_UINT8, the value represented by one unit of the stored integers
+        :type scale: Float
+
+        :param label_dtype: the dtype to hold the labels in (i.e. 'int32' for class labels). Defaults to floatX.
+        :type label_dtype: String
+
+        :param subset_ranges: the (start, stop) rows of each subset, i.e. {TRAIN: (0, 60000), VALID: (50000, 60000),
+        TEST: (60000, 70000)}. When given, train_X and train_Y hold the examples for every subset in one array and
+        each subset is a view of its rows, so ranges can overlap (like train+valid) without copying anything.
+        valid_X, valid_Y, test_X, and test_Y must not be given in this case.
+        :type subset_ranges: Dictionary
+        '''
         log.info('Wrapping matrix from memory')
         super(self.__class__, self).__init__()
 
-        # make sure the inputs are arrays
-        train_X = numpy.array(train_X)
-        self._train_shape = train_X.shape
-        self.train_X = sharedX(train_X)
-        if train_Y:
-            self.train_Y = sharedX(numpy.array(train_Y))
-
-        if valid_X:
-            valid_X = numpy.array(valid_X)
-            self._valid_shape = valid_X.shape
-            self.valid_X = sharedX(valid_X)
-        if valid_Y:
-            self.valid_Y = sharedX(numpy.array(valid_Y))
-
-        if test_X:
-            test_X = numpy.array(test_X)
-            self._test_shape = test_X.shape
-            self.test_X = sharedX(test_X)
-        if test_Y:
-            self.test_Y = sharedX(numpy.array(test_Y))
+        self.storage     = storage
+        self.scale       = scale
+        self.label_dtype = label_dtype or theano.config.floatX
+
+        if subset_ranges is not None:
+            if any(subset is not None for subset in [valid_X, valid_Y, test_X, test_Y]):
+                log.error("MemoryDataset takes either subset_ranges over train_X, or separate valid and test sets!")
+                raise AssertionError("MemoryDataset takes either subset_ranges over train_X, "
+                                     "or separate valid and test sets!")
+            # convert the backing arrays once, then hand out views of their rows
+            all_X = numpy.asarray(train_X)
+            example_shape = all_X.shape[1:]
+            all_X = compact_storage(all_X, storage, scale)
+            all_Y = numpy.asarray(train_Y, dtype=self.label_dtype) if train_Y is not None else None
+            train_X, train_Y = self._range_views(all_X, all_Y, subset_ranges.get(TRAIN, (0, all_X.shape[0])))
+            valid_X, valid_Y = self._range_views(all_X, all_Y, subset_ranges.get(VALID))
+            test_X, test_Y   = self._range_views(all_X, all_Y, subset_ranges.get(TEST))
+            shapes = [(X.shape[0],) + example_shape if X is not None else None for X in (train_X, valid_X, test_X)]
+        else:
+            # make sure the inputs are arrays (without copying the ones that already are)
+            train_X, valid_X, test_X = [numpy.asarray(X) if X is not None else None for X in (train_X, valid_X, test_X)]
+            shapes = [X.shape if X is not None else None for X in (train_X, valid_X, test_X)]
+            train_X, valid_X, test_X = [compact_storage(X, storage, scale) if X is not None else None
+                                        for X in (train_X, valid_X, test_X)]
+            train_Y, valid_Y, test_Y = [numpy.asarray(Y, dtype=self.label_dtype) if Y is not None else None
+                                        for Y in (train_Y, valid_Y, test_Y)]
+        self._train_shape, self._valid_shape, self._test_shape = shapes
+
+        self.train_X = sharedX(train_X, borrow=True, dtype=storage_dtype(storage))
+        if train_Y is not None:
+            self.train_Y = sharedX(train_Y, borrow=True, dtype=self.label_dtype)
+
+        if valid_X is not None:
+            self.valid_X = sharedX(valid_X, borrow=True, dtype=storage_dtype(storage))
+        if valid_Y is not None:
+            self.valid_Y = sharedX(valid_Y, borrow=True, dtype=self.label_dtype)
+
+        if test_X is not None:
+            self.test_X = sharedX(test_X, borrow=True, dtype=storage_dtype(storage))
+        if test_Y is not None:
+            self.test_Y = sharedX(test_Y, borrow=True, dtype=self.label_dtype)
+
+    @staticmethod
+    def _range_views(all_X, all_Y, subset_range):
+        '''
+        :return: the views of all_X and all_Y for the (start, stop) rows, or None if there is no range
+        :rtype: Tuple
+        '''
+        if subset_range is None:
+            return None, None
+        start, stop = subset_range
+        return all_X[start:stop], (all_Y[start:stop] if all_Y is not None else None)
+
+    def _expand(self, values):
+        return expand_storage(values, self.storage, self.scale, self._train_shape[-1])
 
     def getDataByIndices(self, indices, subset):
         '''
         This method is used by an iterator to return data values at given indices.
-        :param indices: either integer or list of integers
-        The index (or indices) of values to return
+        :param indices: either integer, list of integers, or slice
+        The index (or indices) of values to return. A slice of contiguous indices returns a view without copying
+        (when the storage allows it).
         :param subset: integer
         The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
         :return: array
         The dataset values at the index (indices)
         '''
         if subset is TRAIN:
-            return self.train_X.get_value(borrow=True)[indices]
-        elif subset is VALID and hasattr(self, 'valid_X') and self.valid_X:
-            return self.valid_X.get_value(borrow=True)[indices]
-        elif subset is TEST and hasattr(self, 'test_X') and self.test_X:
-            return self.test_X.get_value(borrow=True)[indices]
+            return self._expand(self.train_X.get_value(borrow=True)[indices])
+        elif subset is VALID and hasattr(self, 'valid_X') and self.valid_X is not None:
+            return self._expand(self.valid_X.get_value(borrow=True)[indices])
+        elif subset is TEST and hasattr(self, 'test_X') and self.test_X is not None:
+            return self._expand(self.test_X.get_value(borrow=True)[indices])
         else:
             return None
 
     def getLabelsByIndices(self, indices, subset):
         '''
         This method is used by an iterator to return data label values at given indices.
-        :param indices: either integer or list of integers
-        The index (or indices) of values to return
+        :param indices: either integer, list of integers, or slice
+        The index (or indices) of values to return. A slice of contiguous indices returns a view without copying
+        (when the storage allows it).
         :param subset: integer
         The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
         :return: array
         The dataset labels at the index (indices)
         '''
-        if subset is TRAIN and hasattr(self, 'train_Y') and self.train_Y:
+        if subset is TRAIN and hasattr(self, 'train_Y') and self.train_Y is not None:
             return self.train_Y.get_value(borrow=True)[indices]
-        elif subset is VALID and hasattr(self, 'valid_Y') and self.valid_Y:
+        elif subset is VALID and hasattr(self, 'valid_Y') and self.valid_Y is not None:
             return self.valid_Y.get_value(borrow=True)[indices]
-        elif subset is TEST and hasattr(self, 'test_Y') and self.test_Y:
+        elif subset is TEST and hasattr(self, 'test_Y') and self.test_Y is not None:
             return self.test_Y.get_value(borrow=True)[indices]
         else:
-            return None
\ No newline at end of file
+            return None
+
+    def getSymbolicDataByIndices(self, indices, subset):
+        '''
+        This method is used by an optimizer to slice the data values at given indices inside a theano graph.
+        :param indices: theano integer vector
+        The symbolic indices of values to return
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: theano expression
+        The symbolic dataset values at the indices
+        '''
+        if subset is TRAIN:
+            return expand_symbolic_storage(self.train_X[indices], self.storage, self.scale)
+        elif subset is VALID and hasattr(self, 'valid_X') and self.valid_X is not None:
+            return expand_symbolic_storage(self.valid_X[indices], self.storage, self.scale)
+        elif subset is TEST and hasattr(self, 'test_X') and self.test_X is not None:
+            return expand_symbolic_storage(self.test_X[indices], self.storage, self.scale)
+        else:
+            return None
+
+    def getSymbolicLabelsByIndices(self, indices, subset):
+        '''
+        This method is used by an optimizer to slice the data label values at given indices inside a theano graph.
+        :param indices: theano integer vector
+        The symbolic indices of values to return
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: theano expression
+        The symbolic dataset labels at the indices
+        '''
+        if subset is TRAIN and hasattr(self, 'train_Y') and self.train_Y is not None:
+            return self.train_Y[indices]
+        elif subset is VALID and hasattr(self, 'valid_Y') and self.valid_Y is not None:
+            return self.valid_Y[indices]
+        elif subset is TEST and hasattr(self, 'test_Y') and self.test_Y is not None:
+            return self.test_Y[indices]
+        else:
+            return None
+
+    def hasSubset(self, subset):
+        '''
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: boolean
+        Whether or not this dataset has the given subset split
+        '''
+        if subset not in [TRAIN, VALID, TEST]:
+            log.error('Subset %s not recognized!', get_subset_strings(subset))
+            return False
+        if subset is TRAIN:
+            return True
+        elif subset is VALID:
+            return hasattr(self, 'valid_X')
+        else:
+            return hasattr(self, 'test_X')
+
+    def getDataShape(self, subset):
+        '''
+        :return: tuple
+        Return the shape of this dataset's subset in a NxD tuple where N=#examples and D=dimensionality. This is the
+        shape of the floatX values handed out, not of the (possibly compact) stored array.
+        '''
+        if subset not in [TRAIN, VALID, TEST]:
+            log.error('Subset %s not recognized!', get_subset_strings(subset))
+            return None
+        if subset is TRAIN:
+            return self._train_shape
+        elif subset is VALID and hasattr(self, 'valid_X'):
+            return self._valid_shape
+        elif subset is TEST and hasattr(self, 'test_X'):
+            return self._test_shape
+        else:
+            log.error('Subset %s was not provided to %s!', get_subset_strings(subset), str(type(self)))
+            return None
+
+
+class MemmapDataset(Dataset):
+    '''
+    Dataset object wrapper for .npy files on disk that are too large to fit in memory. Each file is opened as a
+    read-only numpy.memmap, so only the rows asked for by an iterator are read from disk.
+    '''
+
+    def __init__(self, train_X, train_Y=None, valid_X=None, valid_Y=None, test_X=None, test_Y=None):
+        """
+        :param train_X: filesystem path to the .npy file for the training inputs
+        :type train_X: String
+
+        :param train_Y: filesystem path to the .npy file for the training labels (optional)
+        :type train_Y: String
+
+        :param valid_X: filesystem path to the .npy file for the validation inputs (optional)
+        :type valid_X: String
+
+        :param valid_Y: filesystem path to the .npy file for the validation labels (optional)
+        :type valid_Y: String
+
+        :param test_X: filesystem path to the .npy file for the testing inputs (optional)
+        :type test_X: String
+
+        :param test_Y: filesystem path to the .npy file for the testing labels (optional)
+        :type test_Y: String
+        """
+        log.info('Memory-mapping dataset from %s', str(train_X))
+        super(MemmapDataset, self).__init__()
+
+        # opening with mmap_mode only reads the .npy header - the shape comes from there without touching the data.
+        self.train_X = self._open(train_X)
+        self._train_shape = self.train_X.shape
+        self.train_Y = self._open(train_Y)
+
+        self.valid_X = self._open(valid_X)
+        if self.valid_X is not None:
+            self._valid_shape = self.valid_X.shape
+        self.valid_Y = self._open(valid_Y)
+
+        self.test_X = self._open(test_X)
+        if self.test_X is not None:
+            self._test_shape = self.test_X.shape
+        self.test_Y = self._open(test_Y)
+
+        log.debug('Train shape is: %s', str(self._train_shape))
+        if self.valid_X is not None:
+            log.debug('Valid shape is: %s', str(self._valid_shape))
+        if self.test_X is not None:
+            log.debug('Test shape is: %s', str(self._test_shape))
+
+    @staticmethod
+    def _open(filename):
+        '''
+        Opens a .npy file as a read-only memory map.
+        :param filename: String
+        Filesystem path to the .npy file, or None
+        :return: numpy.memmap
+        The memory-mapped array, or None if no filename was given
+        '''
+        if filename is None:
+            return None
+        filename = os.path.realpath(filename)
+        if get_file_type(filename) is not files.NPY:
+            log.error("File %s is not a .npy file that can be memory-mapped!", str(filename))
+            raise AssertionError("File %s is not a .npy file that can be memory-mapped!" % str(filename))
+        return numpy.load(filename, mmap_mode='r')
+
+    @staticmethod
+    def _gather(array, indices):
+        '''
+        Reads the given rows from a memory-mapped array into a regular in-memory array. A slice stays a view of the
+        memory map, so its rows are only read from disk when they are used.
+        '''
+        return numpy.asarray(array[indices])
+
+    def getDataByIndices(self, indices, subset):
+        '''
+        This method is used by an iterator to return data values at given indices.
+        :param indices: either integer, list of integers, or slice
+        The index (or indices) of values to return. A slice of contiguous indices returns a view without copying
+        (when the storage allows it).
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: array
+        The dataset values at the index (indices)
+        '''
+        if subset is TRAIN:
+            return self._gather(self.train_X, indices)
+        elif subset is VALID and self.valid_X is not None:
+            return self._gather(self.valid_X, indices)
+        elif subset is TEST and self.test_X is not None:
+            return self._gather(self.test_X, indices)
+        else:
+            return None
+
+    def getLabelsByIndices(self, indices, subset):
+        '''
+        This method is used by an iterator to return data label values at given indices.
+        :param indices: either integer, list of integers, or slice
+        The index (or indices) of values to return. A slice of contiguous indices returns a view without copying
+        (when the storage allows it).
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: array
+        The dataset labels at the index (indices)
+        '''
+        if subset is TRAIN and self.train_Y is not None:
+            return self._gather(self.train_Y, indices)
+        elif subset is VALID and self.valid_Y is not None:
+            return self._gather(self.valid_Y, indices)
+        elif subset is TEST and self.test_Y is not None:
+            return self._gather(self.test_Y, indices)
+        else:
+            return None
+
+    def hasSubset(self, subset):
+        '''
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: boolean
+        Whether or not this dataset has the given subset split
+        '''
+        if subset not in [TRAIN, VALID, TEST]:
+            log.error('Subset %s not recognized!', get_subset_strings(subset))
+            return False
+        if subset is TRAIN:
+            return True
+        elif subset is VALID:
+            return self.valid_X is not None
+        else:
+            return self.test_X is not None
+
+    def getDataShape(self, subset):
+        '''
+        :return: tuple
+        Return the shape of this dataset's subset in a NxD tuple where N=#examples and D=dimensionality
+        '''
+        if subset not in [TRAIN, VALID, TEST]:
+            log.error('Subset %s not recognized!', get_subset_strings(subset))
+            return None
+        if subset is TRAIN:
+            return self._train_shape
+        elif subset is VALID and self.valid_X is not None:
+            return self._valid_shape
+        elif subset is TEST and self.test_X is not None:
+            return self._test_shape
+        else:
+            log.error('Subset %s was not provided to %s!', get_subset_strings(subset), str(type(self)))
+            return None
+
+
+
+class HDF5Dataset(FileDataset):
+    '''
+    Dataset object wrapper for an HDF5 file on disk, with the TRAIN/VALID/TEST subsets stored as (optionally chunked and
+    compressed) HDF5 datasets inside the file.
+
+    Examples are never read one row at a time - every request is rounded out to the whole HDF5 chunks containing the
+    rows, and a small LRU cache of decompressed chunks is kept so the sequential and random iterators both get
+    near-sequential disk throughput.
+    '''
+    def __init__(self, filename, source=None, dataset_dir='../../datasets',
+                 train_X='train_X', train_Y='train_Y', valid_X='valid_X', valid_Y='valid_Y',
+                 test_X='test_X', test_Y='test_Y', cache_chunks=32, block_rows=1024):
+        """
+        :param filename: the HDF5 file (.h5, .hdf5, or .hdf) relative to the dataset_dir (or an absolute path)
+        :type filename: String
+
+        :param source: the URL to download the file from if it isn't found on disk
+        :type source: String
+
+        :param dataset_dir: the directory to look for (or download) the file
+        :type dataset_dir: String
+
+        :param train_X: the name of the HDF5 dataset inside the file holding the training inputs.
+        The same goes for train_Y, valid_X, valid_Y, test_X, and test_Y - any names missing from the file are ignored.
+        :type train_X: String
+
+        :param cache_chunks: the maximum number of decompressed chunks to keep in memory
+        :type cache_chunks: Integer
+
+        :param block_rows: the number of rows to read at once for HDF5 datasets that are stored contiguously
+        (not chunked)
+        :type block_rows: Integer
+        """
+        if not has_h5py:
+            log.critical("Please install h5py with 'pip install h5py' to use the HDF5Dataset.")
+            raise ImportError("Please install h5py with 'pip install h5py' to use the HDF5Dataset.")
+
+        super(HDF5Dataset, self).__init__(filename=filename, source=source, dataset_dir=dataset_dir)
+
+        if self.file_type is not files.HDF5:
+            log.error("File %s is not an HDF5 file (found file type %s)!",
+                      str(self.dataset_location), files.get_filetype_string(self.file_type))
+            raise AssertionError("File %s is not an HDF5 file!" % str(self.dataset_location))
+
+        log.info('Opening HDF5 dataset %s', str(self.dataset_location))
+        self.h5file = h5py.File(self.dataset_location, 'r')
+
+        # look up the on-disk datasets for each subset. None if they aren't in the file.
+        self.train_X = self._lookup(train_X)
+        self.train_Y = self._lookup(train_Y)
+        self.valid_X = self._lookup(valid_X)
+        self.valid_Y = self._lookup(valid_Y)
+        self.test_X  = self._lookup(test_X)
+        self.test_Y  = self._lookup(test_Y)
+        if self.train_X is None:
+            log.error("Couldn't find the training dataset %s in HDF5 file %s!", str(train_X), self.dataset_location)
+            raise AssertionError("Couldn't find the training dataset %s in HDF5 file %s!" %
+                                 (str(train_X), self.dataset_location))
+
+        self.block_rows = block_rows
+        self._cache = _ChunkCache(cache_chunks)
+
+        log.debug('Train shape is: %s', str(self.train_X.shape))
+        if self.valid_X is not None:
+            log.debug('Valid shape is: %s', str(self.valid_X.shape))
+        if self.test_X is not None:
+            log.debug('Test shape is: %s', str(self.test_X.shape))
+
+    def _lookup(self, name):
+        if name is not None and name in self.h5file:
+            return self.h5file[name]
+        return None
+
+    def _chunk_rows(self, h5data):
+        '''
+        :return: integer
+        The number of rows covered by one chunk along the example axis of the HDF5 dataset
+        '''
+        if h5data.chunks is not None:
+            return h5data.chunks[0]
+        return self.block_rows
+
+    def _get_chunk(self, h5data, chunk_id, rows):
+        '''
+        Returns the decompressed chunk (as a numpy array) from the LRU cache, reading it from disk if necessary.
+        '''
+        key = (h5data.name, chunk_id)
+        chunk = self._cache.get(key)
+        if chunk is None:
+            start = chunk_id*rows
+            chunk = h5data[start:min(start + rows, h5data.shape[0])]
+            self._cache.put(key, chunk)
+        return chunk
+
+    def _read_rows(self, h5data, indices):
+        '''
+        Reads the rows at the given indices from the HDF5 dataset by reading (or finding in the cache) every chunk
+        that contains them.
+        '''
+        rows = self._chunk_rows(h5data)
+        if isinstance(indices, (int, long, numpy.integer)):
+            return self._get_chunk(h5data, indices // rows, rows)[indices % rows]
+        if isinstance(indices, slice):
+            indices = numpy.arange(*indices.indices(h5data.shape[0]))
+
+        indices = numpy.asarray(indices, dtype='int64')
+        out = numpy.empty((indices.shape[0],) + h5data.shape[1:], dtype=h5data.dtype)
+        chunk_ids = indices // rows
+        # group the requested rows by chunk so each chunk is only looked up once
+        order = numpy.argsort(chunk_ids, kind='mergesort')
+        sorted_ids = chunk_ids[order]
+        boundaries = numpy.flatnonzero(numpy.diff(sorted_ids)) + 1
+        for group in numpy.split(order, boundaries):
+            if group.shape[0] == 0:
+                continue
+            chunk_id = chunk_ids[group[0]]
+            chunk = self._get_chunk(h5data, chunk_id, rows)
+            out[group] = chunk[indices[group] - chunk_id*rows]
+        return out
+
+    def getDataByIndices(self, indices, subset):
+        '''
+        This method is used by an iterator to return data values at given indices.
+        :param indices: either integer, list of integers, or slice
+        The index (or indices) of values to return. A slice of contiguous indices returns a view without copying
+        (when the storage allows it).
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: array
+        The dataset values at the index (indices)
+        '''
+        if subset is TRAIN:
+            return self._read_rows(self.train_X, indices)
+        elif subset is VALID and self.valid_X is not None:
+            return self._read_rows(self.valid_X, indices)
+        elif subset is TEST and self.test_X is not None:
+            return self._read_rows(self.test_X, indices)
+        else:
+            return None
+
+    def getLabelsByIndices(self, indices, subset):
+        '''
+        This method is used by an iterator to return data label values at given indices.
+        :param indices: either integer, list of integers, or slice
+        The index (or indices) of values to return. A slice of contiguous indices returns a view without copying
+        (when the storage allows it).
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: array
+        The dataset labels at the index (indices)
+        '''
+        if subset is TRAIN and self.train_Y is not None:
+            return self._read_rows(self.train_Y, indices)
+        elif subset is VALID and self.valid_Y is not None:
+            return self._read_rows(self.valid_Y, indices)
+        elif subset is TEST and self.test_Y is not None:
+            return self._read_rows(self.test_Y, indices)
+        else:
+            return None
+
+    def hasSubset(self, subset):
+        '''
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: boolean
+        Whether or not this dataset has the given subset split
+        '''
+        if subset not in [TRAIN, VALID, TEST]:
+            log.error('Subset %s not recognized!', get_subset_strings(subset))
+            return False
+        if subset is TRAIN:
+            return True
+        elif subset is VALID:
+            return self.valid_X is not None
+        else:
+            return self.test_X is not None
+
+    def getDataShape(self, subset):
+        '''
+        :return: tuple
+        Return the shape of this dataset's subset in a NxD tuple where N=#examples and D=dimensionality
+        '''
+        if subset not in [TRAIN, VALID, TEST]:
+            log.error('Subset %s not recognized!', get_subset_strings(subset))
+            return None
+        if subset is TRAIN:
+            return self.train_X.shape
+        elif subset is VALID and self.valid_X is not None:
+            return self.valid_X.shape
+        elif subset is TEST and self.test_X is not None:
+            return self.test_X.shape
+        else:
+            log.error('Subset %s was not found in %s!', get_subset_strings(subset), str(self.dataset_location))
+            return None
+
+
+class _ChunkCache(object):
+    '''
+    A small least-recently-used cache of decompressed HDF5 chunks.
+    '''
+    def __init__(self, max_chunks):
+        self.max_chunks = max_chunks
+        self._chunks = OrderedDict()
+
+    def get(self, key):
+        chunk = self._chunks.pop(key, None)
+        if chunk is not None:
+            # re-insert to mark it as the most recently used
+            self._chunks[key] = chunk
+        return chunk
+
+    def put(self, key, chunk):
+        if self.max_chunks < 1:
+            return
+        self._chunks[key] = chunk
+        while len(self._chunks) > self.max_chunks:
+            self._chunks.popitem(last=False)
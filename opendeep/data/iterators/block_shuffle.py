@@ -0,0 +1,102 @@
+'''
+.. module:: block_shuffle
+
+A block-shuffled dataset iterator - a random order that keeps disk reads mostly sequential, for memory-mapped or
+chunked datasets where a full per-example shuffle turns every batch into scattered reads.
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import time
+# third party libraries
+import numpy
+import numpy.random as random
+# internal references
+from opendeep.data.iterators.iterator import Iterator
+import opendeep.data.dataset as datasets
+from opendeep.utils.misc import make_time_units_string
+
+log = logging.getLogger(__name__)
+
+class BlockShuffleIterator(Iterator):
+    '''
+    An iterator that shuffles the order of contiguous blocks of examples, then shuffles the examples within
+    windows of consecutive (shuffled) blocks, and finally sorts the indices inside each batch before reading them.
+    Each batch only touches the few blocks in its window, so reads stay mostly sequential while the order is still
+    close to a full shuffle.
+    '''
+    def __init__(self, dataset, subset=datasets.TRAIN, batch_size=1, minimum_batch_size=1, rng=None,
+                 block_size=None, window_blocks=16, num_shards=1, shard_index=0):
+        '''
+        :param block_size: the number of contiguous examples in each block. Defaults to the batch size.
+        :type block_size: Integer
+
+        :param window_blocks: the number of blocks whose examples are shuffled together
+        :type window_blocks: Integer
+        '''
+        # initialize a numpy rng if one is not provided
+        if rng is None:
+            random.seed(123)
+            self.rng = random
+        else:
+            self.rng = rng
+
+        _t = time.time()
+        log.debug('Initializing a %s block shuffle iterator over %s',
+                  str(type(dataset)), datasets.get_subset_strings(subset))
+        super(BlockShuffleIterator, self).__init__(dataset, subset, batch_size, minimum_batch_size,
+                                                   num_shards=num_shards, shard_index=shard_index)
+
+        self.block_size = block_size or batch_size
+        self.window_blocks = window_blocks
+        assert self.block_size >= 1, "Block size needs to be at least 1, found %s" % str(self.block_size)
+        assert self.window_blocks >= 1, "Window needs to be at least 1 block, found %s" % str(self.window_blocks)
+
+        # randomize the indices to access
+        self.indices = self._shard(self._block_shuffle())
+        log.debug('iterator took %s to make' % make_time_units_string(time.time() - _t))
+
+    def _block_shuffle(self):
+        '''
+        :return: array
+        A permutation of the dataset indices, shuffled block-wise and then within each window of blocks
+        '''
+        n_blocks = int(numpy.ceil(float(self.total_len) / self.block_size))
+        block_order = numpy.arange(n_blocks)
+        self.rng.shuffle(block_order)
+
+        windows = []
+        for window_start in range(0, n_blocks, self.window_blocks):
+            window = [numpy.arange(block*self.block_size, min((block + 1)*self.block_size, self.total_len))
+                      for block in block_order[window_start:window_start + self.window_blocks]]
+            window = numpy.concatenate(window)
+            self.rng.shuffle(window)
+            windows.append(window)
+        if len(windows) == 0:
+            return numpy.arange(0)
+        return numpy.concatenate(windows)
+
+    def next_indices(self):
+        '''
+        Gets the dataset indices for the next batch based on the batch size
+        :return: array
+        Indices into the dataset subset for the next batch, sorted so the read is as sequential as possible
+
+        :raises: StopIteration
+        When there are no more batches that meet the minimum requirement to return
+        '''
+        if self.iteration_index < len(self.iterations):
+            # convert the iteration index into the start and end indices for the batch in the dataset
+            _start_index = self.iteration_index*self.batch_size
+            _end_index   = _start_index + self.iterations[self.iteration_index]
+            # increment the iteration index
+            self.iteration_index += 1
+            return numpy.sort(self.indices[_start_index:_end_index])
+        else:
+            raise StopIteration()
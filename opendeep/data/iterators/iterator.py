@@ -23,22 +23,46 @@ log = logging.getLogger(__name__)
 SEQUENTIAL = 0
 RANDOM     = 1
 
+def shard_bounds(n_examples, num_shards, shard_index):
+    '''
+    :return: the (start, stop) positions of a shard when n_examples are split into num_shards balanced, contiguous
+    shards - their sizes differ by at most one
+    :rtype: Tuple
+    '''
+    return n_examples * shard_index // num_shards, n_examples * (shard_index + 1) // num_shards
+
 class Iterator(object):
     '''
     Default interface for a Dataset iterator
+
+    For multi-worker training, each worker can iterate over only its own shard - give every worker the same
+    num_shards and its own shard_index. The shards are disjoint and balanced, and together they cover the subset
+    exactly once per epoch. Iterators with a random order shuffle the whole subset and then take their shard's
+    positions of the permutation, so as long as every worker's rng is in the same state (i.e. seeded with the same
+    seed) they all draw the same permutation each epoch without talking to each other.
     '''
-    def __init__(self, dataset=None, subset=None, batch_size=1, minimum_batch_size=1, rng=None):
+    def __init__(self, dataset=None, subset=None, batch_size=1, minimum_batch_size=1, rng=None,
+                 num_shards=1, shard_index=0):
         # make sure the subset is recognized
         if subset not in [datasets.TRAIN, datasets.VALID, datasets.TEST]:
             log.error('Dataset subset %s not recognized, try TRAIN, VALID, or TEST',
                       datasets.get_subset_strings(subset))
+        if num_shards < 1 or not 0 <= shard_index < num_shards:
+            log.error("Shard index %s needs to be in [0, %s)", str(shard_index), str(num_shards))
+            raise AssertionError("Shard index %s needs to be in [0, %s)" % (str(shard_index), str(num_shards)))
         self.dataset = dataset
         self.subset = subset
         self.batch_size = batch_size
         self.minimum_batch_size = minimum_batch_size
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+
+        # the size of the whole subset, and the positions of this iterator's shard of it
+        self.total_len = self.dataset.getDataShape(self.subset)[0]
+        self.shard_start, self.shard_stop = shard_bounds(self.total_len, self.num_shards, self.shard_index)
 
         # determine the number of possible iterations given the batch size, minimum batch size, dataset, and subset
-        self.data_len = self.dataset.getDataShape(self.subset)[0]
+        self.data_len = self.shard_stop - self.shard_start
         batches = self.data_len/self.batch_size
         self.iterations = batches*[batch_size]
 
@@ -51,6 +75,29 @@ class Iterator(object):
     def __iter__(self):
         return self
 
+    def _shard(self, order):
+        '''
+        :param order: an order (permutation) of every index in the subset
+        :type order: numpy.ndarray
+
+        :return: this iterator's shard of the order
+        :rtype: numpy.ndarray
+        '''
+        return order[self.shard_start:self.shard_stop]
+
+    def next_indices(self):
+        '''
+        Gets the dataset indices for the next batch based on the batch size, and advances the iterator.
+        Subclasses decide the order the dataset is visited in by implementing this method.
+        :return: list of integers
+        Indices into the dataset subset for the next batch
+
+        :raises: StopIteration
+        When there are no more batches that meet the minimum requirement to return
+        '''
+        log.critical('Iterator %s doesn\'t have a next_indices() method', str(type(self)))
+        raise NotImplementedError()
+
     def next(self):
         '''
         Gets the next examples(s) based on the batch size
@@ -63,7 +110,17 @@ class Iterator(object):
         The intention of the protocol is that once an iterator's next() method raises StopIteration, it will continue
         to do so on subsequent calls. Implementations that do not obey this property are deemed broken.
         '''
-        log.critical('Iterator %s doesn\'t have a next() method', str(type(self)))
-        raise NotImplementedError()
-
+        indices_this_step = self.next_indices()
+        # grab the data and labels to return
+        data = self.dataset.getDataByIndices(indices=indices_this_step,
+                                             subset=self.subset)
+        labels = self.dataset.getLabelsByIndices(indices=indices_this_step,
+                                                 subset=self.subset)
+        return data, labels
 
+    def close(self):
+        '''
+        Releases any resources (threads, processes, file handles) held by the iterator. Iterators that don't hold any
+        resources don't need to override this.
+        '''
+        pass
@@ -0,0 +1,163 @@
+'''
+.. module:: prefetch
+
+A prefetching dataset iterator - wraps another iterator and loads its batches on a background thread, so the data
+loading overlaps with the computation done on the previous batches.
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import sys
+import threading
+import Queue
+# third party libraries
+import theano.compat.six as six
+# internal references
+from opendeep.data.iterators.iterator import Iterator
+
+log = logging.getLogger(__name__)
+
+# markers put on the queue by the background thread
+_END   = object()
+_ERROR = object()
+
+# how long (in seconds) to block on the queue before checking for shutdown. Blocking forever on a Queue
+# can't be interrupted by KeyboardInterrupt in python 2.
+_POLL_INTERVAL = 0.1
+
+class PrefetchIterator(Iterator):
+    '''
+    An iterator that fills a bounded queue of ready (data, labels) batches from another iterator on a background thread.
+    '''
+    def __init__(self, iterator, depth=2):
+        '''
+        :param iterator: the iterator to prefetch batches from
+        :type iterator: Iterator
+
+        :param depth: the maximum number of ready batches to keep in the queue
+        :type depth: Integer
+        '''
+        # the wrapped iterator already did the work of figuring out the batch schedule, so don't call the
+        # Iterator constructor again - just mirror its attributes.
+        self.iterator           = iterator
+        self.dataset            = iterator.dataset
+        self.subset             = iterator.subset
+        self.batch_size         = iterator.batch_size
+        self.minimum_batch_size = iterator.minimum_batch_size
+        self.data_len           = iterator.data_len
+        self.iterations         = iterator.iterations
+        self.iteration_index    = 0
+
+        assert depth >= 1, "PrefetchIterator depth needs to be at least 1, found %s" % str(depth)
+        self.depth = depth
+        self._queue = Queue.Queue(maxsize=depth)
+        self._stop  = threading.Event()
+        self._done  = False
+        # the wrapped iterator gets closed exactly once - by close() or by the thread on its way out
+        self._close_lock = threading.Lock()
+        self._iterator_closed = False
+
+        self._thread = threading.Thread(target=self._fill, name='opendeep_prefetch')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _put(self, item):
+        '''
+        Puts an item on the queue, giving up if the iterator was closed while waiting for room.
+        :return: boolean
+        Whether the item was put on the queue
+        '''
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except Queue.Full:
+                continue
+        return False
+
+    def _fill(self):
+        '''
+        Runs on the background thread - pulls batches from the wrapped iterator until it is exhausted or closed.
+        '''
+        try:
+            for batch in self.iterator:
+                if not self._put(batch):
+                    return
+            self._put(_END)
+        except Exception:
+            log.exception("Exception in the prefetching thread for %s", str(type(self.iterator)))
+            self._put((_ERROR, sys.exc_info()))
+        finally:
+            # close() leaves the wrapped iterator to this thread if it was still running
+            if self._stop.is_set():
+                self._close_iterator()
+
+    def _close_iterator(self):
+        '''
+        Closes the wrapped iterator if it isn't closed already.
+        '''
+        with self._close_lock:
+            if self._iterator_closed:
+                return
+            self._iterator_closed = True
+        self.iterator.close()
+
+    def next(self):
+        '''
+        Gets the next ready batch from the queue, waiting for the background thread if it is behind.
+        :return: tuple
+        Batch of data values and labels from the dataset
+
+        :raises: StopIteration
+        When the wrapped iterator is exhausted
+        '''
+        if self._done:
+            raise StopIteration()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=_POLL_INTERVAL)
+                    break
+                except Queue.Empty:
+                    # the thread always puts a marker before finishing unless it was closed
+                    if not self._thread.is_alive() and self._queue.empty():
+                        self._done = True
+                        raise StopIteration()
+        except KeyboardInterrupt:
+            self.close()
+            raise
+
+        if item is _END:
+            self.close()
+            raise StopIteration()
+        if isinstance(item, tuple) and len(item) == 2 and item[0] is _ERROR:
+            self.close()
+            six.reraise(*item[1])
+
+        self.iteration_index += 1
+        return item
+
+    def close(self):
+        '''
+        Stops the background thread and throws away any batches left in the queue. The wrapped iterator is closed
+        once the thread has exited.
+        '''
+        self._done = True
+        self._stop.set()
+        # drain the queue so a thread blocked on put() sees the stop flag
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Queue.Empty:
+                break
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        # the thread could still be inside the wrapped iterator's next() - then it closes the iterator on its way out
+        if not self._thread.is_alive():
+            self._close_iterator()
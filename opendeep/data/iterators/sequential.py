@@ -24,37 +24,32 @@ class SequentialIterator(Iterator):
     '''
     An iterator that goes through a dataset in its stored sequence
     '''
-    def __init__(self, dataset, subset=datasets.TRAIN, batch_size=1, minimum_batch_size=1, rng=None):
+    def __init__(self, dataset, subset=datasets.TRAIN, batch_size=1, minimum_batch_size=1, rng=None,
+                 num_shards=1, shard_index=0):
         _t = time.time()
         log.debug('Initializing a %s sequential iterator over %s',
                   str(type(dataset)), datasets.get_subset_strings(subset))
-        super(self.__class__, self).__init__(dataset, subset, batch_size, minimum_batch_size, rng)
+        super(self.__class__, self).__init__(dataset, subset, batch_size, minimum_batch_size, rng,
+                                             num_shards=num_shards, shard_index=shard_index)
         log.debug('iterator took %s to make' % make_time_units_string(time.time()-_t))
 
-    def next(self):
+    def next_indices(self):
         '''
-        Gets the next examples(s) based on the batch size
-        :return: tuple
-        Batch of data values and labels from the dataset
+        Gets the dataset indices for the next batch based on the batch size
+        :return: slice
+        Indices into the dataset subset for the next batch, in stored order (within this iterator's shard, which is
+        a contiguous range of the subset). The rows are contiguous, so this is a slice - datasets can return a view
+        for it instead of copying the batch with fancy indexing.
 
         :raises: StopIteration
         When there are no more batches that meet the minimum requirement to return
-
-        The intention of the protocol is that once an iterator's next() method raises StopIteration, it will continue
-        to do so on subsequent calls. Implementations that do not obey this property are deemed broken.
         '''
         if self.iteration_index < len(self.iterations):
             # convert the iteration index into the start and end indices for the batch in the dataset
-            _start_index = self.iteration_index*self.batch_size
+            _start_index = self.shard_start + self.iteration_index*self.batch_size
             _end_index   = _start_index + self.iterations[self.iteration_index]
             # increment the iteration index
             self.iteration_index += 1
-            # grab the data and labels to return
-            data = self.dataset.getDataByIndices(indices=list(range(_start_index, _end_index)),
-                                                 subset=self.subset)
-            labels = self.dataset.getLabelsByIndices(indices=list(range(_start_index, _end_index)),
-                                                     subset=self.subset)
-
-            return data, labels
+            return slice(_start_index, _end_index)
         else:
-            raise StopIteration()
\ No newline at end of file
+            raise StopIteration()
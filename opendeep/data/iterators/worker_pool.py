@@ -0,0 +1,219 @@
+'''
+.. module:: worker_pool
+
+A multi-process dataset iterator - a pool of worker processes produce the batches (which can involve CPU-heavy work
+like decompression, decoding, or augmentation in the dataset) into shared memory ring buffers, sidestepping the GIL.
+
+To select it for training, pass it (with any extra options bound) as the optimizer's iterator_class:
+    SGD(model, dataset, iterator_class=functools.partial(WorkerPoolIterator, n_workers=4, order=iterators.RANDOM))
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import multiprocessing
+import time
+# third party libraries
+import numpy
+# internal references
+from opendeep.data.iterators.iterator import Iterator, SEQUENTIAL, RANDOM
+from opendeep.data.iterators.sequential import SequentialIterator
+from opendeep.data.iterators.random import RandomIterator
+import opendeep.data.dataset as datasets
+from opendeep.utils.misc import make_time_units_string
+from opendeep.utils.shared_memory import shared_ndarray
+
+log = logging.getLogger(__name__)
+
+# how long (in seconds) to block on a semaphore before checking on the other processes.
+_POLL_INTERVAL = 0.1
+
+class WorkerPoolIterator(Iterator):
+    '''
+    An iterator where N worker processes each produce the batches for a disjoint slice of the batch schedule
+    (worker i makes batches i, i+N, i+2N, ...) and write them into their own preallocated shared memory ring buffer.
+    Batches are returned in the same deterministic order as the plain sequential or random iterators.
+    '''
+    def __init__(self, dataset, subset=datasets.TRAIN, batch_size=1, minimum_batch_size=1, rng=None,
+                 n_workers=None, order=SEQUENTIAL, buffer_slots=2, num_shards=1, shard_index=0):
+        '''
+        :param n_workers: the number of worker processes. Defaults to the number of CPUs.
+        :type n_workers: Integer
+
+        :param order: the order to visit the dataset in - iterator.SEQUENTIAL or iterator.RANDOM
+        :type order: Integer
+
+        :param buffer_slots: the number of batches each worker can have ready in its ring buffer
+        :type buffer_slots: Integer
+        '''
+        _t = time.time()
+        log.debug('Initializing a %s worker pool iterator over %s',
+                  str(type(dataset)), datasets.get_subset_strings(subset))
+        super(WorkerPoolIterator, self).__init__(dataset, subset, batch_size, minimum_batch_size, rng,
+                                                 num_shards=num_shards, shard_index=shard_index)
+
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.buffer_slots = buffer_slots
+        assert self.n_workers >= 1, "Need at least 1 worker process, found %s" % str(self.n_workers)
+        assert self.buffer_slots >= 1, "Need at least 1 buffer slot per worker, found %s" % str(self.buffer_slots)
+
+        # the batch schedule is decided up front in this process, so the order is deterministic regardless of
+        # how fast each worker is.
+        if order is SEQUENTIAL:
+            source = SequentialIterator(dataset, subset, batch_size, minimum_batch_size, rng,
+                                        num_shards=num_shards, shard_index=shard_index)
+        elif order is RANDOM:
+            source = RandomIterator(dataset, subset, batch_size, minimum_batch_size, rng,
+                                    num_shards=num_shards, shard_index=shard_index)
+        else:
+            log.error("Iteration order %s not recognized, try SEQUENTIAL or RANDOM", str(order))
+            raise NotImplementedError("Iteration order %s not recognized, try SEQUENTIAL or RANDOM" % str(order))
+        self.schedule = []
+        while True:
+            try:
+                self.schedule.append(source.next_indices())
+            except StopIteration:
+                break
+        source.close()
+
+        self._workers = []
+        self._closed = False
+        if len(self.schedule) > 0:
+            self._allocate_buffers()
+            self._start_workers()
+        log.debug('iterator took %s to make' % make_time_units_string(time.time() - _t))
+
+    def _allocate_buffers(self):
+        '''
+        Looks at the first batch to find the example shapes and dtypes, and allocates each worker's ring buffer.
+        '''
+        data = numpy.asarray(self.dataset.getDataByIndices(indices=self.schedule[0], subset=self.subset))
+        labels = self.dataset.getLabelsByIndices(indices=self.schedule[0], subset=self.subset)
+        slots = (self.n_workers, self.buffer_slots, self.batch_size)
+        self._data_buffer = shared_ndarray(slots + data.shape[1:], data.dtype)
+        if labels is not None:
+            labels = numpy.asarray(labels)
+            self._labels_buffer = shared_ndarray(slots + labels.shape[1:], labels.dtype)
+        else:
+            self._labels_buffer = None
+        # the actual number of examples written to each slot (the last batch can be smaller)
+        self._lengths = shared_ndarray((self.n_workers, self.buffer_slots), 'int64')
+        # semaphores counting the empty and filled slots of each worker's ring buffer
+        self._empty = [multiprocessing.Semaphore(self.buffer_slots) for _ in range(self.n_workers)]
+        self._full  = [multiprocessing.Semaphore(0) for _ in range(self.n_workers)]
+        self._stop  = multiprocessing.Event()
+        self._errors = multiprocessing.Queue()
+
+    def _start_workers(self):
+        for worker_index in range(min(self.n_workers, len(self.schedule))):
+            worker = multiprocessing.Process(target=self._work, args=(worker_index,),
+                                             name='opendeep_iterator_worker_%d' % worker_index)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self, worker_index):
+        '''
+        Runs in each worker process - produces every n_workers-th batch of the schedule into the ring buffer.
+        '''
+        try:
+            for k, batch_index in enumerate(range(worker_index, len(self.schedule), self.n_workers)):
+                slot = k % self.buffer_slots
+                # wait for the trainer to free up the slot
+                while not self._empty[worker_index].acquire(True, _POLL_INTERVAL):
+                    if self._stop.is_set():
+                        return
+                if self._stop.is_set():
+                    return
+                indices = self.schedule[batch_index]
+                data = self.dataset.getDataByIndices(indices=indices, subset=self.subset)
+                n = len(data)
+                self._data_buffer[worker_index, slot, :n] = data
+                if self._labels_buffer is not None:
+                    self._labels_buffer[worker_index, slot, :n] = self.dataset.getLabelsByIndices(indices=indices,
+                                                                                                subset=self.subset)
+                self._lengths[worker_index, slot] = n
+                self._full[worker_index].release()
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            log.exception("Exception in iterator worker %d", worker_index)
+            self._errors.put((worker_index, repr(e)))
+
+    def next_indices(self):
+        '''
+        Gets the dataset indices for the next batch in the schedule.
+        '''
+        if self.iteration_index < len(self.schedule):
+            indices = self.schedule[self.iteration_index]
+            self.iteration_index += 1
+            return indices
+        else:
+            raise StopIteration()
+
+    def next(self):
+        '''
+        Gets the next examples(s) from the worker that produced them.
+        :return: tuple
+        Batch of data values and labels from the dataset
+
+        :raises: StopIteration
+        When there are no more batches that meet the minimum requirement to return
+        '''
+        if self._closed or self.iteration_index >= len(self.schedule):
+            self.close()
+            raise StopIteration()
+
+        batch_index = self.iteration_index
+        worker_index = batch_index % self.n_workers
+        slot = (batch_index // self.n_workers) % self.buffer_slots
+        try:
+            while not self._full[worker_index].acquire(True, _POLL_INTERVAL):
+                self._check_workers()
+        except KeyboardInterrupt:
+            self.close()
+            raise
+
+        n = self._lengths[worker_index, slot]
+        # copy out of the slot so it can be handed back to the worker right away
+        data = numpy.array(self._data_buffer[worker_index, slot, :n])
+        labels = None
+        if self._labels_buffer is not None:
+            labels = numpy.array(self._labels_buffer[worker_index, slot, :n])
+        self._empty[worker_index].release()
+        self.iteration_index += 1
+        return data, labels
+
+    def _check_workers(self):
+        '''
+        Raises an error if any worker failed, instead of waiting on it forever.
+        '''
+        if not self._errors.empty():
+            worker_index, error = self._errors.get()
+            self.close()
+            raise RuntimeError("Iterator worker %d failed: %s" % (worker_index, error))
+        for worker in self._workers:
+            if not worker.is_alive() and worker.exitcode not in (0, None):
+                self.close()
+                raise RuntimeError("Iterator worker %s died with exit code %s" % (worker.name, str(worker.exitcode)))
+
+    def close(self):
+        '''
+        Stops and cleans up the worker processes.
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        if len(self._workers) > 0:
+            self._stop.set()
+            for worker in self._workers:
+                worker.join(timeout=1)
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+        self._workers = []
@@ -12,25 +12,65 @@ __email__ = "opendeep-dev@googlegroups.com"
 
 # standard libraries
 import logging
+import os
+import re
+import tempfile
 import cPickle
 import gzip
 import numpy
 # internal imports
-from opendeep import make_shared_variables
+from opendeep import sharedX
 import opendeep.data.dataset as datasets
-from opendeep.data.dataset import FileDataset
+from opendeep.data.dataset import FileDataset, STORAGE_FLOATX, STORAGE_UINT8, STORAGE_BITS, compact_storage, \
+    expand_storage, expand_symbolic_storage, storage_dtype
 from opendeep.utils import file_ops
 
 log = logging.getLogger(__name__)
 
+# bump the cache version whenever the layout of the converted .npy files changes
+_CACHE_VERSION = 3
+_CACHE_NAMES   = ['all_X', 'all_Y']
+# the converted cache files (and interrupted writes of them, with or without a unique temporary part), by fingerprint
+_CACHE_FILE    = re.compile(r'^mnist_([0-9a-f]{16})_(%s)\.npy((\.\w+)?\.tmp)?$' % '|'.join(_CACHE_NAMES))
+# 28x28 images
+_N_PIXELS = 784
+# the rows of each subset in the one array holding all of the examples - train includes valid.
+_RANGES = {datasets.TRAIN: (0, 60000),
+           datasets.VALID: (50000, 60000),
+           datasets.TEST:  (60000, 70000)}
+
 class MNIST(FileDataset):
     '''
     Object for the MNIST handwritten digit dataset. Pickled file provided by Montreal's LISA lab into
     train, valid, and test sets.
     '''
-    def __init__(self, binary=False, dataset_dir='../../datasets'):
+    def __init__(self, binary=False, dataset_dir='../../datasets', cache=True, storage=STORAGE_FLOATX):
+        """
+        :param binary: whether to threshold the pixel values to 0/1
+        :type binary: Boolean
+
+        :param dataset_dir: the directory to look for (or download) mnist.pkl.gz
+        :type dataset_dir: String
+
+        :param cache: whether to convert the pickled dataset into .npy files next to it on the first load, and
+        memory-map those files on every load after that (skipping the gunzip, unpickle, and binarization).
+        :type cache: Boolean
+
+        :param storage: how to hold the pixel values in memory - dataset.STORAGE_FLOATX, or the compact
+        dataset.STORAGE_UINT8 (1 byte per pixel) or dataset.STORAGE_BITS (1 bit per pixel, only for binary=True).
+        Compact pixels are cast back to floatX when a batch is gathered (or inside the graph), and the labels are
+        kept as int32 instead of floatX.
+        :type storage: String
+        """
         # instantiate the Dataset class to install the dataset from the url
-        log.info('Loading MNIST with binary=%s', str(binary))
+        log.info('Loading MNIST with binary=%s, storage=%s', str(binary), str(storage))
+        if storage == datasets.STORAGE_BITS and not binary:
+            log.error("MNIST can only be stored as bits when binary=True!")
+            raise AssertionError("MNIST can only be stored as bits when binary=True!")
+        self.storage = storage
+        # the pickled pixels are multiples of 1/256, so uint8 holds them exactly
+        self.scale   = 1. if binary else 1./256
+        self.label_dtype = 'int32' if storage != STORAGE_FLOATX else None
 
         filename = 'mnist.pkl.gz'
         source = 'http://www.iro.umontreal.ca/~lisa/deep/data/mnist/mnist.pkl.gz'
@@ -39,66 +79,194 @@ class MNIST(FileDataset):
 
         # self.dataset_location now contains the os path to the dataset file
         # self.file_type tells how to load the dataset
-        # load the dataset into memory
+        # load the dataset into memory (or memory-map it from the converted cache)
+        subsets = None
+        if cache:
+            fingerprint = self._fingerprint(binary, storage)
+            subsets = self._load_cache(fingerprint)
+        if subsets is None:
+            subsets = self._compact(self._load_pickle(binary))
+            if cache:
+                self._write_cache(fingerprint, subsets)
+        all_X, all_Y = subsets
+
+        # each subset is a view of its rows in the one backing array (so train+valid doesn't need a copy)
+        (train_X, train_Y), (valid_X, valid_Y), (test_X, test_Y) = [
+            (all_X[start:stop], all_Y[start:stop])
+            for start, stop in [_RANGES[datasets.TRAIN], _RANGES[datasets.VALID], _RANGES[datasets.TEST]]
+        ]
+
+        self._train_shape = (train_X.shape[0], _N_PIXELS)
+        self._valid_shape = (valid_X.shape[0], _N_PIXELS)
+        self._test_shape  = (test_X.shape[0], _N_PIXELS)
+        log.debug('Train shape is: %s', str(self._train_shape))
+        log.debug('Valid shape is: %s', str(self._valid_shape))
+        log.debug('Test shape is: %s', str(self._test_shape))
+        # transfer the datasets into theano shared variables
+        log.debug('Loading MNIST into theano shared variables')
+        (self.train_X, self.valid_X, self.test_X) = [sharedX(X, borrow=True, dtype=storage_dtype(storage))
+                                                     for X in (train_X, valid_X, test_X)]
+        (self.train_Y, self.valid_Y, self.test_Y) = [sharedX(Y, borrow=True, dtype=self.label_dtype)
+                                                     for Y in (train_Y, valid_Y, test_Y)]
+
+    def _load_pickle(self, binary):
+        """
+        Loads the original pickled dataset into memory, stacked into one array of examples (train, valid, test).
+
+        :return: the arrays all_X, all_Y
+        :rtype: Tuple
+        """
         if self.file_type is file_ops.GZ:
-            (train_X, train_Y), (valid_X, valid_Y), (test_X, test_Y) = cPickle.load(
-                gzip.open(self.dataset_location, 'rb')
-            )
+            subsets = list(cPickle.load(gzip.open(self.dataset_location, 'rb')))
         else:
-            (train_X, train_Y), (valid_X, valid_Y), (test_X, test_Y) = cPickle.load(
-                open(self.dataset_location, 'r')
-            )
+            subsets = list(cPickle.load(open(self.dataset_location, 'r')))
+
+        # copy the train, valid, and test sets into one preallocated array, freeing each one as soon as it is copied -
+        # so the pixels are only held about once, instead of twice with numpy.concatenate
+        log.debug('Stacking the train, valid, and test sets together...')
+        n_examples = sum(len(X) for X, _ in subsets)
+        all_X = numpy.empty((n_examples,) + subsets[0][0].shape[1:], dtype=subsets[0][0].dtype)
+        all_Y = numpy.empty((n_examples,), dtype=subsets[0][1].dtype)
+        start = 0
+        while len(subsets) > 0:
+            X, Y = subsets.pop(0)
+            all_X[start:start + len(X)] = X
+            all_Y[start:start + len(X)] = Y
+            start += len(X)
+            del X, Y
 
         # make optional binary
         if binary:
             _binary_cutoff = 0.5
             log.debug('Making MNIST X values binary with cutoff %s', str(_binary_cutoff))
-            train_X = (train_X > _binary_cutoff).astype('float32')
-            valid_X = (valid_X > _binary_cutoff).astype('float32')
-            test_X  = (test_X > _binary_cutoff).astype('float32')
+            # in place, to avoid another copy of the pixels
+            all_X[...] = all_X > _binary_cutoff
 
-        log.debug('Concatenating train and valid sets together...')
-        train_X = numpy.concatenate((train_X, valid_X))
-        train_Y = numpy.concatenate((train_Y, valid_Y))
+        return all_X, all_Y
 
-        self._train_shape = train_X.shape
-        self._valid_shape = valid_X.shape
-        self._test_shape  = test_X.shape
-        log.debug('Train shape is: %s', str(self._train_shape))
-        log.debug('Valid shape is: %s', str(self._valid_shape))
-        log.debug('Test shape is: %s', str(self._test_shape))
-        # transfer the datasets into theano shared variables
-        log.debug('Loading MNIST into theano shared variables')
-        (self.train_X, self.train_Y,
-         self.valid_X, self.valid_Y,
-         self.test_X, self.test_Y) = make_shared_variables((train_X, train_Y, valid_X, valid_Y, test_X, test_Y),
-                                                           borrow=True)
+    def _compact(self, subsets):
+        """
+        Converts the loaded arrays into the storage format.
+
+        :return: the arrays all_X, all_Y in the storage format
+        :rtype: Tuple
+        """
+        if self.storage == STORAGE_FLOATX:
+            return subsets
+        all_X, all_Y = subsets
+        log.debug('Compacting MNIST pixels to storage %s', str(self.storage))
+        return compact_storage(all_X, self.storage, self.scale), all_Y.astype('int32')
+
+    def _expand(self, values):
+        return expand_storage(values, self.storage, self.scale, _N_PIXELS)
+
+    def _fingerprint(self, binary, storage):
+        """
+        :return: the fingerprint keying the converted cache of the dataset file with these options
+        :rtype: String
+        """
+        return file_ops.file_fingerprint(self.dataset_location,
+                                         'binary=%s' % str(binary),
+                                         'storage=%s' % str(storage),
+                                         _CACHE_VERSION)
 
+    def _cache_paths(self, fingerprint):
+        """
+        :return: the .npy filenames for the all_X and all_Y arrays in the converted cache
+        :rtype: List(String)
+        """
+        base = os.path.dirname(self.dataset_location)
+        return [os.path.join(base, 'mnist_%s_%s.npy' % (fingerprint, name)) for name in _CACHE_NAMES]
+
+    def _load_cache(self, fingerprint):
+        """
+        Memory-maps the converted .npy files for this fingerprint, if they exist.
+
+        :return: the arrays all_X, all_Y or None if not cached
+        :rtype: Tuple or None
+        """
+        if fingerprint is None:
+            return None
+        paths = self._cache_paths(fingerprint)
+        if not all(os.path.exists(path) for path in paths):
+            return None
+        log.debug('Memory-mapping MNIST from the converted cache %s', os.path.dirname(paths[0]))
+        try:
+            return tuple(numpy.load(path, mmap_mode='r') for path in paths)
+        except Exception:
+            log.exception("Couldn't load the MNIST cache, falling back to the pickled dataset.")
+            return None
+
+    def _write_cache(self, fingerprint, subsets):
+        """
+        Writes the all_X and all_Y arrays to their own .npy files. Each file is written to a unique temporary name and
+        renamed into place, so an interrupted write never leaves a partial cache behind, and processes building the
+        cache at the same time don't write over each other's files.
+        """
+        if fingerprint is None:
+            return
+        log.debug('Writing the converted MNIST cache...')
+        tmp_path = None
+        try:
+            for path, array in zip(self._cache_paths(fingerprint), subsets):
+                fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                                dir=os.path.dirname(path))
+                with os.fdopen(fd, 'wb') as f:
+                    numpy.save(f, array)
+                # mkstemp makes the file private to this user, but the cache is readable like the dataset
+                os.chmod(tmp_path, 0o644)
+                os.rename(tmp_path, path)
+                tmp_path = None
+        except Exception:
+            log.exception("Couldn't write the MNIST cache - it will be converted again next time.")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._remove_stale_caches()
+
+    def _remove_stale_caches(self):
+        """
+        Deletes the converted caches that can't be loaded anymore - the ones for an older version of the dataset file
+        or of the cache layout. The caches for the other binary and storage options of the current file are kept.
+        """
+        current = set(self._fingerprint(binary, storage)
+                      for binary in [True, False]
+                      for storage in [STORAGE_FLOATX, STORAGE_UINT8, STORAGE_BITS])
+        base = os.path.dirname(self.dataset_location)
+        try:
+            for name in os.listdir(base):
+                match = _CACHE_FILE.match(name)
+                if match is not None and match.group(1) not in current:
+                    log.debug('Removing the stale MNIST cache file %s', name)
+                    os.remove(os.path.join(base, name))
+        except OSError:
+            log.exception("Couldn't remove the stale MNIST caches in %s", base)
 
     def getDataByIndices(self, indices, subset):
         '''
         This method is used by an iterator to return data values at given indices.
-        :param indices: either integer or list of integers
-        The index (or indices) of values to return
+        :param indices: either integer, list of integers, or slice
+        The index (or indices) of values to return. A slice of contiguous indices returns a view without copying
+        (when the storage allows it).
         :param subset: integer
         The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
         :return: array
         The dataset values at the index (indices)
         '''
         if subset is datasets.TRAIN:
-            return self.train_X.get_value(borrow=True)[indices]
+            return self._expand(self.train_X.get_value(borrow=True)[indices])
         elif subset is datasets.VALID and hasattr(self, 'valid_X') and self.valid_X:
-            return self.valid_X.get_value(borrow=True)[indices]
+            return self._expand(self.valid_X.get_value(borrow=True)[indices])
         elif subset is datasets.TEST and hasattr(self, 'test_X') and self.test_X:
-            return self.test_X.get_value(borrow=True)[indices]
+            return self._expand(self.test_X.get_value(borrow=True)[indices])
         else:
             return None
 
     def getLabelsByIndices(self, indices, subset):
         '''
         This method is used by an iterator to return data label values at given indices.
-        :param indices: either integer or list of integers
-        The index (or indices) of values to return
+        :param indices: either integer, list of integers, or slice
+        The index (or indices) of values to return. A slice of contiguous indices returns a view without copying
+        (when the storage allows it).
         :param subset: integer
         The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
         :return: array
@@ -113,6 +281,44 @@ class MNIST(FileDataset):
         else:
             return None
 
+    def getSymbolicDataByIndices(self, indices, subset):
+        '''
+        This method is used by an optimizer to slice the data values at given indices inside a theano graph.
+        :param indices: theano integer vector
+        The symbolic indices of values to return
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: theano expression
+        The symbolic dataset values at the indices
+        '''
+        if subset is datasets.TRAIN:
+            return expand_symbolic_storage(self.train_X[indices], self.storage, self.scale)
+        elif subset is datasets.VALID and hasattr(self, 'valid_X') and self.valid_X is not None:
+            return expand_symbolic_storage(self.valid_X[indices], self.storage, self.scale)
+        elif subset is datasets.TEST and hasattr(self, 'test_X') and self.test_X is not None:
+            return expand_symbolic_storage(self.test_X[indices], self.storage, self.scale)
+        else:
+            return None
+
+    def getSymbolicLabelsByIndices(self, indices, subset):
+        '''
+        This method is used by an optimizer to slice the data label values at given indices inside a theano graph.
+        :param indices: theano integer vector
+        The symbolic indices of values to return
+        :param subset: integer
+        The integer representing the subset of the data to consider dataset.(TRAIN, VALID, or TEST)
+        :return: theano expression
+        The symbolic dataset labels at the indices
+        '''
+        if subset is datasets.TRAIN and hasattr(self, 'train_Y') and self.train_Y is not None:
+            return self.train_Y[indices]
+        elif subset is datasets.VALID and hasattr(self, 'valid_Y') and self.valid_Y is not None:
+            return self.valid_Y[indices]
+        elif subset is datasets.TEST and hasattr(self, 'test_Y') and self.test_Y is not None:
+            return self.test_Y[indices]
+        else:
+            return None
+
     def hasSubset(self, subset):
         '''
         :param subset: integer
@@ -0,0 +1,81 @@
+'''
+Unit testing for the chunked HDF5 dataset
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import logging
+import os
+import shutil
+import tempfile
+# third party libraries
+import numpy
+# internal references
+from opendeep.data.dataset import HDF5Dataset, has_h5py
+import opendeep.data.dataset as dataset
+import opendeep.log.logger as logger
+from opendeep.data.iterators.sequential import SequentialIterator
+from opendeep.data.iterators.random import RandomIterator
+
+
+@unittest.skipIf(not has_h5py, "h5py is not installed")
+class TestHDF5Dataset(unittest.TestCase):
+
+    def setUp(self):
+        import h5py
+        # configure the root logger
+        logger.config_root_logger()
+        # get a logger for this session
+        self.log = logging.getLogger(__name__)
+        # write a small compressed, chunked file
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'data.h5')
+        self.train_X = numpy.arange(1000*10, dtype='float32').reshape((1000, 10))
+        self.train_Y = numpy.arange(1000, dtype='int32')
+        with h5py.File(self.filename, 'w') as f:
+            f.create_dataset('train_X', data=self.train_X, chunks=(64, 10), compression='gzip')
+            f.create_dataset('train_Y', data=self.train_Y, chunks=(64,), compression='gzip')
+        self.h5 = HDF5Dataset(filename=self.filename, cache_chunks=4)
+
+    def testSizes(self):
+        assert self.h5.getDataShape(dataset.TRAIN) == (1000, 10)
+        assert not self.h5.hasSubset(dataset.VALID)
+        assert not self.h5.hasSubset(dataset.TEST)
+
+    def testIndices(self):
+        indices = [999, 3, 64, 65, 3, 500]
+        assert numpy.array_equal(self.h5.getDataByIndices(indices, dataset.TRAIN), self.train_X[indices])
+        assert numpy.array_equal(self.h5.getLabelsByIndices(indices, dataset.TRAIN), self.train_Y[indices])
+        assert numpy.array_equal(self.h5.getDataByIndices(130, dataset.TRAIN), self.train_X[130])
+        # the cache never grows past its maximum number of chunks
+        assert len(self.h5._cache._chunks) <= 4
+
+    def testSequentialIterator(self):
+        i = 0
+        for x, y in SequentialIterator(self.h5, dataset.TRAIN, 100, 100):
+            assert numpy.array_equal(x, self.train_X[i*100:(i+1)*100])
+            assert numpy.array_equal(y, self.train_Y[i*100:(i+1)*100])
+            i += 1
+        assert i == 10
+
+    def testRandomIterator(self):
+        seen = []
+        for x, y in RandomIterator(self.h5, dataset.TRAIN, 128, 1):
+            assert numpy.array_equal(x, self.train_X[y])
+            seen.extend(y)
+        assert sorted(seen) == list(range(1000))
+
+    def tearDown(self):
+        self.h5.h5file.close()
+        del self.h5
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
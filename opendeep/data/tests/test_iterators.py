@@ -0,0 +1,176 @@
+'''
+Unit testing for the dataset iterators
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import logging
+import threading
+# third party libraries
+import numpy
+import theano
+# internal references
+from opendeep.data.dataset import MemoryDataset
+import opendeep.data.dataset as dataset
+import opendeep.log.logger as logger
+from opendeep.data.iterators.sequential import SequentialIterator
+from opendeep.data.iterators.random import RandomIterator
+from opendeep.data.iterators.prefetch import PrefetchIterator
+from opendeep.data.iterators.worker_pool import WorkerPoolIterator
+from opendeep.data.iterators.block_shuffle import BlockShuffleIterator
+import opendeep.data.iterators.iterator as iterators
+
+
+class TestIterators(unittest.TestCase):
+
+    def setUp(self):
+        # configure the root logger
+        logger.config_root_logger()
+        # get a logger for this session
+        self.log = logging.getLogger(__name__)
+        # a small in-memory dataset where each row is filled with its own index
+        self.data = numpy.repeat(numpy.arange(1000, dtype='float32')[:, None], 5, axis=1)
+        self.memory = MemoryDataset(self.data)
+
+    def testSequentialViews(self):
+        stored = self.memory.train_X.get_value(borrow=True)
+        for x, _ in SequentialIterator(self.memory, dataset.TRAIN, 64, 1):
+            # contiguous batches come back as views of the stored data, not copies
+            assert numpy.may_share_memory(x, stored)
+
+    def testPrefetchSequential(self):
+        plain = [x for x, _ in SequentialIterator(self.memory, dataset.TRAIN, 64, 1)]
+        prefetched = [x for x, _ in PrefetchIterator(SequentialIterator(self.memory, dataset.TRAIN, 64, 1), depth=3)]
+        assert len(plain) == len(prefetched) == 16
+        for a, b in zip(plain, prefetched):
+            assert numpy.array_equal(a, b)
+
+    def testPrefetchRandom(self):
+        rows = []
+        for x, _ in PrefetchIterator(RandomIterator(self.memory, dataset.TRAIN, 100, 1)):
+            rows.extend(x[:, 0])
+        assert sorted(rows) == list(range(1000))
+
+    def testPrefetchClose(self):
+        iterator = PrefetchIterator(SequentialIterator(self.memory, dataset.TRAIN, 10, 1), depth=2)
+        iterator.next()
+        iterator.close()
+        self.assertRaises(StopIteration, iterator.next)
+        assert not iterator._thread.is_alive()
+
+    def testPrefetchCloseBusy(self):
+        class _Blocking(object):
+            # stands in for an iterator whose next() is slow (i.e. reading from disk)
+            def __init__(self, data):
+                self.dataset, self.subset, self.batch_size, self.minimum_batch_size = data, dataset.TRAIN, 10, 1
+                self.data_len, self.iterations = 100, 10
+                self.release = threading.Event()
+                self.closed = 0
+            def __iter__(self):
+                return self
+            def next(self):
+                self.release.wait()
+                return numpy.zeros((10, 5)), None
+            __next__ = next
+            def close(self):
+                self.closed += 1
+
+        blocking = _Blocking(self.memory)
+        iterator = PrefetchIterator(blocking)
+        iterator.close()
+        # the thread is still inside next(), so the wrapped iterator stays open until the thread gets out
+        assert iterator._thread.is_alive()
+        assert blocking.closed == 0
+        blocking.release.set()
+        iterator._thread.join(5)
+        assert not iterator._thread.is_alive()
+        assert blocking.closed == 1
+
+    def testWorkerPoolSequential(self):
+        plain = [x for x, _ in SequentialIterator(self.memory, dataset.TRAIN, 64, 1)]
+        pooled = [x for x, _ in WorkerPoolIterator(self.memory, dataset.TRAIN, 64, 1, n_workers=3, buffer_slots=2)]
+        # batches come out in the same deterministic order as the plain iterator
+        assert len(plain) == len(pooled) == 16
+        for a, b in zip(plain, pooled):
+            assert numpy.array_equal(a, b)
+
+    def testWorkerPoolRandom(self):
+        rows = []
+        for x, _ in WorkerPoolIterator(self.memory, dataset.TRAIN, 100, 1, n_workers=2, order=iterators.RANDOM):
+            rows.extend(x[:, 0])
+        assert sorted(rows) == list(range(1000))
+
+    def testBlockShuffle(self):
+        rows = []
+        for x, _ in BlockShuffleIterator(self.memory, dataset.TRAIN, 50, 1, block_size=25, window_blocks=4):
+            batch = list(x[:, 0])
+            # indices inside each batch are sorted for sequential reads
+            assert batch == sorted(batch)
+            # and a batch only spans the blocks from one window
+            assert len(set(int(i) // 25 for i in batch)) <= 4
+            rows.extend(batch)
+        assert sorted(rows) == list(range(1000))
+        assert rows != list(range(1000))
+
+    def testCompactStorage(self):
+        pixels = numpy.repeat(numpy.arange(256)[:, None], 8, axis=1) / 255.
+        uint8 = MemoryDataset(pixels, storage=dataset.STORAGE_UINT8, scale=1./255)
+        assert uint8.train_X.get_value(borrow=True).dtype == 'uint8'
+        batches = [x for x, _ in SequentialIterator(uint8, dataset.TRAIN, 64, 1)]
+        # batches are cast back to floatX when they are gathered
+        assert batches[0].dtype == theano.config.floatX
+        assert numpy.allclose(numpy.concatenate(batches), pixels, atol=1e-6)
+
+        binary = (numpy.arange(1000*11).reshape((1000, 11)) % 3 == 0).astype('float32')
+        bits = MemoryDataset(binary, storage=dataset.STORAGE_BITS)
+        # 11 values pack into 2 bytes per example
+        assert bits.train_X.get_value(borrow=True).shape == (1000, 2)
+        assert bits.getDataShape(dataset.TRAIN) == (1000, 11)
+        assert numpy.array_equal(bits.getDataByIndices(numpy.arange(100, 200), dataset.TRAIN), binary[100:200])
+
+    def testSubsetRanges(self):
+        # the in-memory arrays are wrapped, not copied
+        assert numpy.may_share_memory(self.memory.train_X.get_value(borrow=True), self.data)
+
+        labels = numpy.arange(1000)
+        ranged = MemoryDataset(self.data, labels, subset_ranges={dataset.TRAIN: (0, 800),
+                                                                 dataset.VALID: (600, 800),
+                                                                 dataset.TEST: (800, 1000)})
+        assert ranged.getDataShape(dataset.TRAIN) == (800, 5)
+        assert ranged.getDataShape(dataset.VALID) == (200, 5)
+        assert ranged.getDataShape(dataset.TEST) == (200, 5)
+        # the overlapping subsets are all views of the one backing array
+        for subset in [dataset.TRAIN, dataset.VALID, dataset.TEST]:
+            assert numpy.may_share_memory(ranged.getDataByIndices(slice(0, 10), subset), self.data)
+        assert ranged.getDataByIndices(0, dataset.VALID)[0] == 600
+        assert ranged.getLabelsByIndices(0, dataset.TEST) == 800
+
+    def testShards(self):
+        for iterator_class in [SequentialIterator, RandomIterator]:
+            shards = []
+            for shard_index in range(3):
+                # every worker's rng starts from the same seed
+                iterator = iterator_class(self.memory, dataset.TRAIN, 100, 1, rng=numpy.random.RandomState(7),
+                                          num_shards=3, shard_index=shard_index)
+                rows = []
+                for x, _ in iterator:
+                    rows.extend(x[:, 0])
+                shards.append(rows)
+            # the shards are balanced, disjoint, and cover the subset exactly once
+            assert [len(rows) for rows in shards] == [333, 333, 334]
+            assert sorted(shards[0] + shards[1] + shards[2]) == list(range(1000))
+        self.assertRaises(AssertionError, SequentialIterator, self.memory, dataset.TRAIN, 100, 1,
+                          num_shards=3, shard_index=3)
+
+    def tearDown(self):
+        del self.memory
+
+
+if __name__ == '__main__':
+    unittest.main()
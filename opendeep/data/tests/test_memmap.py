@@ -0,0 +1,80 @@
+'''
+Unit testing for the memory-mapped .npy dataset
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import logging
+import os
+import shutil
+import tempfile
+# third party libraries
+import numpy
+# internal references
+from opendeep.data.dataset import MemmapDataset
+import opendeep.data.dataset as dataset
+import opendeep.log.logger as logger
+from opendeep.data.iterators.sequential import SequentialIterator
+from opendeep.data.iterators.random import RandomIterator
+
+
+class TestMemmapDataset(unittest.TestCase):
+
+    def setUp(self):
+        # configure the root logger
+        logger.config_root_logger()
+        # get a logger for this session
+        self.log = logging.getLogger(__name__)
+        # write some small .npy files to memory-map
+        self.dir = tempfile.mkdtemp()
+        self.train_X = numpy.arange(1000*10, dtype='float32').reshape((1000, 10))
+        self.train_Y = numpy.arange(1000, dtype='int32')
+        self.test_X  = numpy.arange(200*10, dtype='float32').reshape((200, 10))
+        numpy.save(os.path.join(self.dir, 'train_X.npy'), self.train_X)
+        numpy.save(os.path.join(self.dir, 'train_Y.npy'), self.train_Y)
+        numpy.save(os.path.join(self.dir, 'test_X.npy'), self.test_X)
+        self.memmap = MemmapDataset(train_X=os.path.join(self.dir, 'train_X.npy'),
+                                    train_Y=os.path.join(self.dir, 'train_Y.npy'),
+                                    test_X=os.path.join(self.dir, 'test_X.npy'))
+
+    def testSizes(self):
+        assert self.memmap.getDataShape(dataset.TRAIN) == (1000, 10)
+        assert self.memmap.getDataShape(dataset.TEST) == (200, 10)
+        assert self.memmap.hasSubset(dataset.TEST)
+        assert not self.memmap.hasSubset(dataset.VALID)
+
+    def testIndices(self):
+        indices = [5, 900, 17]
+        x = self.memmap.getDataByIndices(indices, dataset.TRAIN)
+        y = self.memmap.getLabelsByIndices(indices, dataset.TRAIN)
+        assert numpy.array_equal(x, self.train_X[indices])
+        assert numpy.array_equal(y, self.train_Y[indices])
+        assert self.memmap.getLabelsByIndices(indices, dataset.TEST) is None
+
+    def testSequentialIterator(self):
+        i = 0
+        for x, y in SequentialIterator(self.memmap, dataset.TRAIN, 100, 100):
+            assert numpy.array_equal(x, self.train_X[i*100:(i+1)*100])
+            assert numpy.array_equal(y, self.train_Y[i*100:(i+1)*100])
+            i += 1
+        assert i == 10
+
+    def testRandomIterator(self):
+        seen = []
+        for _, y in RandomIterator(self.memmap, dataset.TRAIN, 128, 1):
+            seen.extend(y)
+        assert sorted(seen) == list(range(1000))
+
+    def tearDown(self):
+        del self.memmap
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,6 +11,7 @@ __email__ = "opendeep-dev@googlegroups.com"
 # standard libraries
 import unittest
 import logging
+import os
 # internal references
 from opendeep.data.standard_datasets.image.mnist import MNIST
 import opendeep.data.dataset as dataset
@@ -38,6 +39,36 @@ class TestMNIST(unittest.TestCase):
         assert self.mnist.getDataShape(dataset.VALID) == (10000, 784)
         assert self.mnist.getDataShape(dataset.TEST) == (10000, 784)
 
+    def testCache(self):
+        # the first load wrote the converted cache, so this one memory-maps it
+        cached = MNIST(binary=False)
+        for subset in [dataset.TRAIN, dataset.VALID, dataset.TEST]:
+            assert cached.getDataShape(subset) == self.mnist.getDataShape(subset)
+            indices = [0, 1234, 9999]
+            assert (cached.getDataByIndices(indices, subset) == self.mnist.getDataByIndices(indices, subset)).all()
+            assert (cached.getLabelsByIndices(indices, subset) == self.mnist.getLabelsByIndices(indices, subset)).all()
+
+    def testStaleCache(self):
+        base = os.path.dirname(self.mnist.dataset_location)
+        # a cache from an older version of the file or the cache layout, and an unrelated file
+        stale = os.path.join(base, 'mnist_0123456789abcdef_all_X.npy')
+        # and an interrupted write of one, under its unique temporary name
+        stale_tmp = os.path.join(base, 'mnist_0123456789abcdef_all_Y.npy.a1B_c2.tmp')
+        unrelated = os.path.join(base, 'mnist_notes.npy')
+        for path in [stale, stale_tmp, unrelated]:
+            open(path, 'w').close()
+        current = self.mnist._cache_paths(self.mnist._fingerprint(False, dataset.STORAGE_FLOATX))
+        try:
+            self.mnist._remove_stale_caches()
+            assert not os.path.exists(stale)
+            assert not os.path.exists(stale_tmp)
+            assert os.path.exists(unrelated)
+            assert all(os.path.exists(path) for path in current)
+        finally:
+            for path in [stale, stale_tmp, unrelated]:
+                if os.path.exists(path):
+                    os.remove(path)
+
     def testSequentialIterator(self):
         self.log.debug('TESTING SEQUENTIAL ITERATOR')
         i = 0
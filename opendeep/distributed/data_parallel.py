@@ -0,0 +1,268 @@
+'''
+.. module:: data_parallel
+
+Synchronous data-parallel stochastic gradient descent over local worker processes.
+
+Every epoch N worker processes are forked, each with its own replica of the model. For every global batch, each
+worker computes the gradients on its slice of the batch, the gradients are summed across the workers with an
+all-reduce through shared memory, and every worker runs the same optimizer update (get_updates) on the summed
+gradient. The replicas stay identical, and the updates are the same as single-process SGD with the same global batch.
+
+The all-reduce is a reduce-scatter followed by an all-gather: each worker writes its gradient into its own row of a
+shared buffer, then sums one chunk of the columns across all the rows into the reduced buffer, which every worker
+reads once all the chunks are done. Each worker sums 1/N of the columns, so the reduction work is split evenly like
+in a ring all-reduce, without any sockets or copies between the processes.
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import multiprocessing
+import time
+# third party libraries
+import numpy
+import theano
+from theano.compat.python2x import OrderedDict  # use this compatibility OrderedDict
+# internal references
+from opendeep import function
+from opendeep.optimization.stochastic_gradient_descent import SGD, _defaults
+from opendeep.data.iterators.sequential import SequentialIterator
+import opendeep.data.dataset as datasets
+from opendeep.utils.misc import make_time_units_string, set_shared_values
+from opendeep.utils.shared_memory import shared_ndarray, Barrier
+from opendeep.distributed.processes import run_workers, check_host_device
+
+log = logging.getLogger(__name__)
+
+class SharedAllReduce(object):
+    '''
+    Sums a vector across a fixed group of forked worker processes through shared memory. Create it before forking
+    the workers, then every worker calls allreduce() with its rank once per step.
+    '''
+    def __init__(self, n_workers, size, dtype, timeout=None):
+        '''
+        :param n_workers: the number of worker processes taking part in every all-reduce
+        :type n_workers: Integer
+
+        :param size: the length of the vectors to sum
+        :type size: Integer
+
+        :param dtype: the dtype of the vectors
+        :type dtype: String or numpy.dtype
+
+        :param timeout: the seconds to wait on the other workers before giving up
+        :type timeout: Float
+        '''
+        self.n_workers = n_workers
+        self.size = size
+        self.timeout = timeout
+        # one row per worker to write its vector into, and the sum
+        self.buffers = shared_ndarray((n_workers, size), dtype)
+        self.reduced = shared_ndarray((size,), dtype)
+        self.barrier = Barrier(n_workers)
+
+    def row(self, rank):
+        '''
+        :return: the worker's row of the shared buffer - write the vector to sum here before calling allreduce()
+        :rtype: numpy.ndarray
+        '''
+        return self.buffers[rank]
+
+    def allreduce(self, rank, size=None):
+        '''
+        Sums the rows every worker wrote. The returned buffer is valid until the worker's next call to allreduce().
+
+        :param rank: the calling worker's rank
+        :type rank: Integer
+
+        :param size: only sum the first size elements of the rows (every worker has to give the same size)
+        :type size: Integer
+
+        :return: the sum of all the workers' rows
+        :rtype: numpy.ndarray
+        '''
+        size = self.size if size is None else size
+        # reduce-scatter: wait for every row, then sum this worker's chunk of the columns
+        self.barrier.wait(self.timeout)
+        start = size * rank // self.n_workers
+        stop = size * (rank + 1) // self.n_workers
+        numpy.sum(self.buffers[:, start:stop], axis=0, out=self.reduced[start:stop])
+        # all-gather: once every chunk is summed, the whole reduced buffer is readable by everyone
+        self.barrier.wait(self.timeout)
+        return self.reduced[:size]
+
+
+class DataParallelSGD(SGD):
+    '''
+    Synchronous data-parallel stochastic gradient descent - N worker processes split every batch, all-reduce their
+    gradients, and make the same update. Only works on the CPU, since the workers are forked from this process.
+    '''
+    def __init__(self, model, dataset, n_workers=None, iterator_class=SequentialIterator, config=None,
+                 defaults=_defaults, rng=None, n_epoch=None, batch_size=None, minimum_batch_size=None,
+                 save_frequency=None, early_stop_threshold=None, early_stop_length=None, learning_rate=None,
+                 momentum=None, nesterov_momentum=None, index_batches=None, timeout=600, **kwargs):
+        '''
+        :param n_workers: the number of worker processes. Defaults to the number of CPUs.
+        :type n_workers: Integer
+
+        :param timeout: the seconds a worker waits on the others during an all-reduce before giving up
+        :type timeout: Float
+
+        The other parameters are the same as for SGD, and any other SGD options (i.e. lr_decay or momentum_decay)
+        are passed through to it as keyword arguments. The batch_size is the global batch size, split between the
+        workers.
+        '''
+        check_host_device('DataParallelSGD')
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        assert self.n_workers >= 1, "Need at least 1 worker process, found %s" % str(self.n_workers)
+
+        super(DataParallelSGD, self).__init__(model=model,
+                                              dataset=dataset,
+                                              iterator_class=iterator_class,
+                                              config=config,
+                                              defaults=defaults,
+                                              rng=rng,
+                                              n_epoch=n_epoch,
+                                              batch_size=batch_size,
+                                              minimum_batch_size=minimum_batch_size,
+                                              save_frequency=save_frequency,
+                                              early_stop_threshold=early_stop_threshold,
+                                              early_stop_length=early_stop_length,
+                                              learning_rate=learning_rate,
+                                              momentum=momentum,
+                                              nesterov_momentum=nesterov_momentum,
+                                              index_batches=index_batches,
+                                              **kwargs)
+
+        # the flat layout of the gradients in the all-reduce buffers
+        shapes = [param.get_value(borrow=True).shape for param in self.params]
+        sizes = [int(numpy.prod(shape)) for shape in shapes]
+        offsets = numpy.cumsum([0] + sizes)
+        self._layout = [(offsets[i], offsets[i + 1], shapes[i]) for i in range(len(shapes))]
+        self.allreduce = SharedAllReduce(self.n_workers, int(offsets[-1]), theano.config.floatX, timeout=timeout)
+
+        # the first worker hands the trained parameters and optimizer state (everything but the learning rate and
+        # momentum, which are decayed by this process) back through shared memory at the end of every epoch.
+        self.worker_vars = [var for var in self.optimizer_vars if var not in [self.learning_rate, self.momentum]]
+        self._results = [shared_ndarray(var.get_value(borrow=True).shape, var.dtype)
+                         for var in self.params + self.worker_vars]
+
+    def _compile_learn(self, outputs, updates):
+        '''
+        Splits training into f_learn, which only computes the cost, monitors, and gradients on a worker's slice, and
+        f_update, which makes the optimizer updates from the all-reduced gradients.
+        '''
+        if self.accumulate_steps > 1:
+            log.error("DataParallelSGD doesn't support gradient accumulation (accumulate_steps=%s) - use a bigger "
+                      "batch_size, it is split between the workers.", str(self.accumulate_steps))
+            raise AssertionError("DataParallelSGD doesn't support gradient accumulation.")
+        for param in self.params:
+            if param.dtype != theano.config.floatX:
+                log.error("DataParallelSGD needs floatX (%s) parameters, found %s with dtype %s",
+                          theano.config.floatX, str(param), param.dtype)
+                raise AssertionError("DataParallelSGD needs floatX (%s) parameters, found %s with dtype %s" %
+                                     (theano.config.floatX, str(param), param.dtype))
+
+        optimizer_vars = set(self.params + self.optimizer_vars)
+        optimizer_updates = OrderedDict((var, update) for var, update in updates.items() if var in optimizer_vars)
+        other_updates = OrderedDict((var, update) for var, update in updates.items() if var not in optimizer_vars)
+
+        # the same update rule, but on the reduced gradients given as inputs
+        gradients = [self.grads[param] for param in self.params]
+        self.reduced_grads = [gradient.type('reduced_grad_%s' % param.name if param.name else None)
+                              for param, gradient in zip(self.params, gradients)]
+        update_expressions = theano.clone(list(optimizer_updates.values()),
+                                          replace=OrderedDict(zip(gradients, self.reduced_grads)))
+        log.info('Compiling f_update function for model %s...', str(type(self.model)))
+        t = time.time()
+        self.f_update = function(inputs  = self.reduced_grads,
+                                 updates = OrderedDict(zip(optimizer_updates.keys(), update_expressions)),
+                                 name    = 'f_update')
+        log.info('f_update compilation took %s', make_time_units_string(time.time() - t))
+
+        self._n_outputs = len(outputs)
+        return super(DataParallelSGD, self)._compile_learn(list(outputs) + gradients, other_updates)
+
+    def _work(self, rank, schedule):
+        '''
+        Runs in each worker process - computes the gradients on the worker's slice of every batch, all-reduces them,
+        and applies the update.
+
+        :return: for each batch the worker had a slice of - the batch number, the slice's share of the batch, the cost,
+        and the monitor values
+        :rtype: Tuple(List, List, List, Dictionary)
+        '''
+        row = self.allreduce.row(rank)
+        grad_views = [row[start:stop].reshape(shape) for start, stop, shape in self._layout]
+        batches, weights, train_costs = [], [], []
+        train_monitors = {key: [] for key in self.train_monitor_names}
+        for batch_number, indices in enumerate(schedule):
+            if isinstance(indices, slice):
+                indices = numpy.arange(indices.start, indices.stop, dtype='int64')
+            part = numpy.array_split(numpy.asarray(indices, dtype='int64'), self.n_workers)[rank]
+            if len(part) == 0:
+                row[...] = 0
+            else:
+                # the batch cost is a mean over the examples, so each slice's gradient is weighted by its share
+                weight = float(len(part)) / len(indices)
+                inputs = None
+                if self.index_batches:
+                    outputs = self.f_learn(part)
+                    if len(self.monitor_expressions) == 0 and len(self.train_monitor_names) > 0:
+                        inputs = [self.dataset.getDataByIndices(part, datasets.TRAIN)]
+                        if not self.unsupervised:
+                            inputs.append(self.dataset.getLabelsByIndices(part, datasets.TRAIN))
+                else:
+                    inputs = [self.dataset.getDataByIndices(part, datasets.TRAIN)]
+                    if not self.unsupervised:
+                        inputs.append(self.dataset.getLabelsByIndices(part, datasets.TRAIN))
+                    outputs = self.f_learn(*inputs)
+                for view, gradient in zip(grad_views, outputs[self._n_outputs:]):
+                    numpy.multiply(gradient, weight, out=view)
+                self._record_train_step(outputs[:self._n_outputs], inputs, train_costs, train_monitors)
+                batches.append(batch_number)
+                weights.append(weight)
+            reduced = self.allreduce.allreduce(rank)
+            self.f_update(*[reduced[start:stop].reshape(shape) for start, stop, shape in self._layout])
+
+        if rank == 0:
+            for result, var in zip(self._results, self.params + self.worker_vars):
+                result[...] = var.get_value(borrow=True)
+        return batches, weights, train_costs, train_monitors
+
+    def _perform_train_pass(self):
+        '''
+        Forks the workers to train on the epoch together, then takes the trained parameters from the first worker and
+        combines the workers' costs and monitors for each batch.
+
+        :return: the training costs and the training monitor values for each batch
+        :rtype: Tuple(List, Dictionary)
+        '''
+        schedule = self._train_schedule()
+        for indices in schedule:
+            if isinstance(indices, slice):
+                self.epoch_timer.examples += indices.stop - indices.start
+            else:
+                self.epoch_timer.examples += len(indices)
+        results = run_workers(self._work, self.n_workers, args=(schedule,), name='opendeep_data_parallel_worker')
+        # every replica made the same updates
+        set_shared_values(self.params + self.worker_vars, self._results)
+
+        # each batch's values are the average of the slices' values, weighted by the slices' shares
+        train_costs = [0.] * len(schedule)
+        train_monitors = {key: [0.] * len(schedule) for key in self.train_monitor_names}
+        for batches, weights, costs, monitors in results:
+            for i, (batch_number, weight) in enumerate(zip(batches, weights)):
+                train_costs[batch_number] += weight * numpy.asarray(costs[i])
+                for key in train_monitors.keys():
+                    train_monitors[key][batch_number] += weight * numpy.asarray(monitors[key][i])
+        return train_costs, train_monitors
+
+    def _perform_index_pass(self):
+        # the workers handle both the data and the index modes
+        return self._perform_train_pass()
@@ -0,0 +1,187 @@
+'''
+.. module:: hogwild
+
+Hogwild-style lock-free parallel stochastic gradient descent on one machine.
+
+The model parameters are moved into shared memory, and every epoch N worker processes are forked that each run
+SGD steps over their own shard of the epoch, adding their parameter updates straight into the shared
+buffers without any locking. With sparse or low-contention updates, the occasional overwritten update doesn't hurt
+convergence and training scales with the number of cores.
+
+'Hogwild!: A Lock-Free Approach to Parallelizing Stochastic Gradient Descent'
+Feng Niu, Benjamin Recht, Christopher Re, Stephen J. Wright
+http://arxiv.org/abs/1106.5730
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import multiprocessing
+from collections import OrderedDict
+# third party libraries
+import numpy
+import theano
+# internal references
+from opendeep.optimization.stochastic_gradient_descent import SGD, _defaults
+from opendeep.data.iterators.sequential import SequentialIterator
+import opendeep.data.dataset as datasets
+from opendeep.utils.misc import set_shared_values
+from opendeep.utils.shared_memory import shared_copy
+from opendeep.distributed.processes import run_workers, check_host_device
+
+log = logging.getLogger(__name__)
+
+class HogwildSGD(SGD):
+    '''
+    Stochastic gradient descent where N worker processes update the shared model parameters in parallel without locks.
+    Each worker keeps its own optimizer state (i.e. momentum velocities) in shared memory across epochs. Only works
+    on the CPU, since the parameters have to be in host shared memory.
+    '''
+    def __init__(self, model, dataset, n_workers=None, iterator_class=SequentialIterator, config=None,
+                 defaults=_defaults, rng=None, n_epoch=None, batch_size=None, minimum_batch_size=None,
+                 save_frequency=None, early_stop_threshold=None, early_stop_length=None, learning_rate=None,
+                 momentum=None, nesterov_momentum=None, index_batches=None, **kwargs):
+        '''
+        :param n_workers: the number of worker processes. Defaults to the number of CPUs.
+        :type n_workers: Integer
+
+        The other parameters are the same as for SGD, and any other SGD options (i.e. lr_decay or momentum_decay)
+        are passed through to it as keyword arguments.
+        '''
+        check_host_device('HogwildSGD')
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        assert self.n_workers >= 1, "Need at least 1 worker process, found %s" % str(self.n_workers)
+
+        # move the parameters into shared memory before the training function is compiled, so every forked worker
+        # (and this process) reads and writes the same buffers.
+        self.shared_values = [None] * len(model.get_params())
+        self._share_params(model.get_params())
+
+        # need to call the SGD constructor after the parameters are shared, because it compiles f_learn
+        super(HogwildSGD, self).__init__(model=model,
+                                         dataset=dataset,
+                                         iterator_class=iterator_class,
+                                         config=config,
+                                         defaults=defaults,
+                                         rng=rng,
+                                         n_epoch=n_epoch,
+                                         batch_size=batch_size,
+                                         minimum_batch_size=minimum_batch_size,
+                                         save_frequency=save_frequency,
+                                         early_stop_threshold=early_stop_threshold,
+                                         early_stop_length=early_stop_length,
+                                         learning_rate=learning_rate,
+                                         momentum=momentum,
+                                         nesterov_momentum=nesterov_momentum,
+                                         index_batches=index_batches,
+                                         **kwargs)
+        if self.accumulate_steps > 1:
+            log.error("HogwildSGD doesn't support gradient accumulation (accumulate_steps=%s)",
+                      str(self.accumulate_steps))
+            raise AssertionError("HogwildSGD doesn't support gradient accumulation.")
+
+        # each worker's optimizer variables (not the learning rate and momentum, which are decayed by this process)
+        # live in shared memory between epochs, since the worker processes only last for one epoch.
+        self.worker_vars = [var for var in self.optimizer_vars if var not in [self.learning_rate, self.momentum]]
+        self.worker_states = [[shared_copy(var.get_value()) for var in self.worker_vars]
+                              for _ in range(self.n_workers)]
+
+    def _share_params(self, params):
+        '''
+        Puts the parameter values back in the shared memory buffers if they were replaced (i.e. by restoring the best
+        parameters after early stopping or by loading a checkpoint, which set new arrays).
+        '''
+        for i, param in enumerate(params):
+            value = param.get_value(borrow=True)
+            if self.shared_values[i] is not None and numpy.may_share_memory(value, self.shared_values[i]):
+                continue
+            if self.shared_values[i] is None or self.shared_values[i].shape != value.shape:
+                self.shared_values[i] = shared_copy(value)
+            else:
+                self.shared_values[i][...] = value
+            param.set_value(self.shared_values[i], borrow=True)
+            if not numpy.may_share_memory(param.get_value(borrow=True), self.shared_values[i]):
+                log.error("Parameter %s didn't keep its shared memory buffer!", str(param))
+                raise AssertionError("Parameter %s didn't keep its shared memory buffer!" % str(param))
+
+    def _compile_learn(self, outputs, updates):
+        '''
+        Compiles f_learn to output the parameter increments instead of updating the parameters - theano would swap
+        in new arrays for updated parameters, so the workers add the increments into the shared buffers themselves.
+        '''
+        params = set(self.params)
+        other_updates = OrderedDict((var, update) for var, update in updates.items() if var not in params)
+        increments = [updates[param] - param for param in self.params]
+        self._n_outputs = len(outputs)
+        return super(HogwildSGD, self)._compile_learn(list(outputs) + increments, other_updates)
+
+    def _work(self, worker_index, seed):
+        '''
+        Runs in each worker process - trains on the worker's shard of the epoch. Every worker seeds its rng with the
+        same seed, so the shards come from the same shuffle without any coordination.
+
+        :return: the training costs and the training monitor values for the worker's batches, and the number of
+        examples the worker trained on
+        :rtype: Tuple(List, Dictionary, Integer)
+        '''
+        self.rng = numpy.random.RandomState(seed)
+        set_shared_values(self.worker_vars, self.worker_states[worker_index])
+        train_costs = []
+        train_monitors = {key: [] for key in self.train_monitor_names}
+        n_examples = 0
+        for indices in self._train_schedule(self.n_workers, worker_index):
+            inputs = None
+            if isinstance(indices, slice):
+                n_examples += indices.stop - indices.start
+            else:
+                n_examples += len(indices)
+            if self.index_batches:
+                if isinstance(indices, slice):
+                    indices = numpy.arange(indices.start, indices.stop, dtype='int64')
+                outputs = self.f_learn(numpy.asarray(indices, dtype='int64'))
+                if len(self.monitor_expressions) == 0 and len(self.train_monitor_names) > 0:
+                    inputs = [self.dataset.getDataByIndices(indices, datasets.TRAIN)]
+                    if not self.unsupervised:
+                        inputs.append(self.dataset.getLabelsByIndices(indices, datasets.TRAIN))
+            else:
+                inputs = [self.dataset.getDataByIndices(indices, datasets.TRAIN)]
+                if not self.unsupervised:
+                    inputs.append(self.dataset.getLabelsByIndices(indices, datasets.TRAIN))
+                outputs = self.f_learn(*inputs)
+            # lock-free: add this step's increments straight into the shared parameters
+            for value, increment in zip(self.shared_values, outputs[self._n_outputs:]):
+                numpy.add(value, increment, out=value)
+            self._record_train_step(outputs[:self._n_outputs], inputs, train_costs, train_monitors)
+        # keep this worker's optimizer state for its next epoch
+        for state, var in zip(self.worker_states[worker_index], self.worker_vars):
+            state[...] = var.get_value(borrow=True)
+        return train_costs, train_monitors, n_examples
+
+    def _perform_train_pass(self):
+        '''
+        Forks the workers to train on their shares of the epoch in parallel, and gathers their costs and monitors.
+
+        :return: the training costs and the training monitor values for each batch
+        :rtype: Tuple(List, Dictionary)
+        '''
+        self._share_params(self.params)
+        # a new shared seed every epoch, so the workers' shards are reshuffled
+        seed = self.rng.randint(2 ** 30)
+        results = run_workers(self._work, self.n_workers, args=(seed,), name='opendeep_hogwild_worker')
+        train_costs = []
+        train_monitors = {key: [] for key in self.train_monitor_names}
+        for costs, monitors, n_examples in results:
+            train_costs.extend(costs)
+            for key in train_monitors.keys():
+                train_monitors[key].extend(monitors[key])
+            self.epoch_timer.examples += n_examples
+        return train_costs, train_monitors
+
+    def _perform_index_pass(self):
+        # the workers handle both the data and the index modes
+        return self._perform_train_pass()
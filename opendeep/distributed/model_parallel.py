@@ -0,0 +1,406 @@
+'''
+.. module:: model_parallel
+
+Hybrid data/model-parallel training for AlexNet over local worker processes, following Krizhevsky's scheme:
+
+'One weird trick for parallelizing convolutional neural networks'
+Alex Krizhevsky
+http://arxiv.org/abs/1404.5997
+
+The convolutional layers have few parameters and most of the computation, so they run data-parallel - every worker
+has a replica and its own slice of the global batch, and their gradients are all-reduced. The fully-connected layers
+hold most of the parameters, so they run model-parallel - the columns of every layer are split between the workers,
+and each worker computes its columns for the whole global batch. The activations are all-gathered between the layers
+on the way forward, and the gradients for the layer inputs are all-reduced on the way back. The model's own
+fully-connected parameters are moved into shared memory, and every worker updates its columns of them in place, so
+they are stored once instead of once per replica and the model's functions see the trained values.
+
+The workers are forked processes exchanging through shared memory, so this only runs on a single host.
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import multiprocessing
+import time
+# third party libraries
+import numpy
+import theano
+import theano.tensor as T
+# internal references
+from opendeep import function, trunc
+from opendeep.optimization.optimizer import Optimizer
+from opendeep.models.single_layer.basic import BasicLayer
+from opendeep.data.iterators.sequential import SequentialIterator
+import opendeep.data.dataset as datasets
+from opendeep.utils.misc import make_time_units_string, set_shared_values
+from opendeep.utils.shared_memory import shared_ndarray, shared_copy, Barrier
+from opendeep.distributed.data_parallel import SharedAllReduce
+from opendeep.distributed.processes import run_workers, check_host_device
+
+log = logging.getLogger(__name__)
+
+# Default values to use for some training parameters
+_defaults = {"n_epoch": 90,
+             "learning_rate": 0.01,
+             "momentum": 0.9,
+             "dropout": 0.5,
+             "save_frequency": 10,
+             "timeout": 600}
+
+def column_ranges(n_columns, n_workers):
+    '''
+    :return: the (start, stop) columns of each worker's partition, as even as possible
+    :rtype: List(Tuple)
+    '''
+    return [(n_columns * rank // n_workers, n_columns * (rank + 1) // n_workers) for rank in range(n_workers)]
+
+
+class HybridParallelSGD(Optimizer):
+    '''
+    Trains an AlexNet built with model_parallel_fc=True - its convolutional layers run data-parallel and the
+    parameters of its fully-connected layers (model.fc_params) are column-partitioned across N forked worker
+    processes on this host. The AlexNet batch_size is the batch of each worker, so the global batch is n_workers times
+    bigger. Updates are momentum SGD.
+    '''
+    def __init__(self, model, dataset, n_workers=None, config=None, defaults=_defaults, rng=None, n_epoch=None,
+                 learning_rate=None, momentum=None, save_frequency=None):
+        '''
+        :param model: the AlexNet to train, built with model_parallel_fc=True
+        :type model: AlexNet
+
+        :param dataset: the dataset to train on
+        :type dataset: Dataset
+
+        :param n_workers: the number of worker processes. Defaults to the number of CPUs.
+        :type n_workers: Integer
+        '''
+        super(HybridParallelSGD, self).__init__(config, defaults)
+        if not getattr(model, 'model_parallel_fc', False):
+            log.error("HybridParallelSGD needs a model built with model_parallel_fc=True, found %s", str(type(model)))
+            raise AssertionError("HybridParallelSGD needs a model built with model_parallel_fc=True, found %s" %
+                                 str(type(model)))
+        if model.flag_datalayer:
+            log.critical("The random cropping data layer isn't implemented for HybridParallelSGD yet!")
+            raise NotImplementedError("The random cropping data layer isn't implemented for HybridParallelSGD yet!")
+        check_host_device('HybridParallelSGD')
+
+        self.model = model
+        self.dataset = dataset
+        self.n_workers      = n_workers or multiprocessing.cpu_count()
+        self.n_epoch        = n_epoch or self.args.get('n_epoch')
+        self.learning_rate  = learning_rate or self.args.get('learning_rate')
+        self.momentum       = momentum or self.args.get('momentum')
+        self.save_frequency = save_frequency or self.args.get('save_frequency')
+        self.corruption     = self.args.get('dropout')
+        if rng is None:
+            rng = numpy.random.RandomState(123)
+        self.rng = rng
+        self.worker_batch = model.batch_size
+        self.batch_size = self.n_workers * self.worker_batch
+        floatX = theano.config.floatX
+
+        # the model's fully-connected parameters go into shared memory so they are only stored once, and each worker
+        # updates its columns of them in place
+        sizes = model.fc_sizes
+        self.fc_params = list(model.fc_params)
+        shapes = []
+        for n_in, n_out in zip(sizes[:-1], sizes[1:]):
+            shapes += [(n_in, n_out), (n_out,)]
+        found = [param.get_value(borrow=True).shape for param in self.fc_params]
+        if found != shapes:
+            log.error("The model's fully-connected parameters have shapes %s, expected %s from fc_sizes %s",
+                      str(found), str(shapes), str(sizes))
+            raise AssertionError("The model's fully-connected parameters have shapes %s, expected %s from fc_sizes %s"
+                                 % (str(found), str(shapes), str(sizes)))
+        self.fc_values = [None] * len(self.fc_params)
+        self.columns = [column_ranges(n_out, self.n_workers) for n_out in sizes[1:]]
+        self.fc_velocities = []
+        for layer, (n_in, n_out) in enumerate(zip(sizes[:-1], sizes[1:])):
+            self.fc_velocities.append([(shared_ndarray((n_in, stop - start), floatX),
+                                        shared_ndarray((stop - start,), floatX))
+                                       for start, stop in self.columns[layer]])
+        self._share_fc_params()
+
+        # the convolutional replicas' velocities, and the buffers the first worker hands its trained convolutional
+        # parameters and velocities back in
+        self.conv_params = model.conv_params
+        self.conv_velocities = [numpy.zeros_like(param.get_value(borrow=True)) for param in self.conv_params]
+        self._conv_results = [shared_ndarray(param.get_value(borrow=True).shape, param.dtype)
+                              for param in self.conv_params + self.conv_params]
+
+        # the exchange buffers - the gathered activations of every layer, and the all-reduces for the gradients of
+        # the layer inputs and of the convolutional parameters
+        timeout = self.args.get('timeout')
+        self.activations = [shared_ndarray((self.batch_size, size), floatX) for size in sizes]
+        self.gather_barrier = Barrier(self.n_workers)
+        self.input_grads = SharedAllReduce(self.n_workers, self.batch_size * max(sizes[:-1]), floatX, timeout=timeout)
+        self._conv_layout = []
+        offset = 0
+        for param in self.conv_params:
+            shape = param.get_value(borrow=True).shape
+            self._conv_layout.append((offset, offset + int(numpy.prod(shape)), shape))
+            offset += int(numpy.prod(shape))
+        self.conv_grads = SharedAllReduce(self.n_workers, offset, floatX, timeout=timeout)
+
+        self._compile()
+
+    def _share_fc_params(self):
+        '''
+        Puts the model's fully-connected parameters back in the shared memory buffers if they were replaced (i.e. by
+        loading a .params file, which sets new arrays), and splits the buffers into every worker's columns.
+        '''
+        for i, param in enumerate(self.fc_params):
+            value = param.get_value(borrow=True)
+            if self.fc_values[i] is not None and numpy.may_share_memory(value, self.fc_values[i]):
+                continue
+            if self.fc_values[i] is None:
+                self.fc_values[i] = shared_copy(value)
+            else:
+                self.fc_values[i][...] = value
+            param.set_value(self.fc_values[i], borrow=True)
+            if not numpy.may_share_memory(param.get_value(borrow=True), self.fc_values[i]):
+                log.error("Parameter %s didn't keep its shared memory buffer!", str(param))
+                raise AssertionError("Parameter %s didn't keep its shared memory buffer!" % str(param))
+        # views of the buffers, so the workers' updates land in the model's parameters
+        self.fc_weights = [[W[:, start:stop] for start, stop in columns]
+                           for W, columns in zip(self.fc_values[0::2], self.columns)]
+        self.fc_biases = [[b[start:stop] for start, stop in columns]
+                          for b, columns in zip(self.fc_values[1::2], self.columns)]
+
+    def _compile(self):
+        '''
+        Compiles the functions every worker uses. The fully-connected functions take the weights as inputs, so the
+        same functions work on every worker's columns.
+        '''
+        log.info('Compiling the hybrid parallel functions for model %s...', str(type(self.model)))
+        t = time.time()
+        # data-parallel convolutional layers
+        conv_output_grad = T.matrix('conv_output_grad', dtype=self.model.conv_output.dtype)
+        self.f_conv = function(inputs=[self.model.x], outputs=self.model.conv_output, name='f_conv')
+        conv_grads = theano.grad(None, wrt=self.conv_params, known_grads={self.model.conv_output: conv_output_grad})
+        self.f_conv_grad = function(inputs=[self.model.x, conv_output_grad], outputs=conv_grads, name='f_conv_grad')
+
+        # one column partition of a fully-connected layer - the hidden layers have rectifiers and dropout masks, and
+        # the last layer outputs the logits for the softmax
+        self.f_fc, self.f_fc_grad = {}, {}
+        for kind, activation in [('hidden', self.model.fc_config['activation']), ('output', 'linear')]:
+            H = T.matrix('H', dtype=theano.config.floatX)
+            W = T.matrix('W', dtype=theano.config.floatX)
+            b = T.vector('b', dtype=theano.config.floatX)
+            mask = T.matrix('mask', dtype=theano.config.floatX)
+            output_grad = T.matrix('output_grad', dtype=theano.config.floatX)
+            layer = BasicLayer(inputs_hook=(None, H), params_hook=(W, b), activation=activation)
+            output = layer.get_outputs() * mask
+            grads = theano.grad(None, wrt=[H, W, b], known_grads={output: output_grad})
+            self.f_fc[kind] = function(inputs=[H, W, b, mask], outputs=output, name='f_fc_%s' % kind)
+            self.f_fc_grad[kind] = function(inputs=[H, W, b, mask, output_grad], outputs=grads,
+                                            name='f_fc_grad_%s' % kind)
+
+        # the softmax cost on the gathered logits
+        logits = T.matrix('logits', dtype=theano.config.floatX)
+        y = T.lvector('y')
+        p_y = T.nnet.softmax(logits)
+        cost = -T.mean(T.log(p_y)[T.arange(y.shape[0]), y])
+        errors = T.mean(T.neq(T.argmax(p_y, axis=1), y))
+        self.f_loss = function(inputs=[logits, y], outputs=[cost, errors, T.grad(cost, logits)], name='f_loss')
+        log.info('compilation took %s', make_time_units_string(time.time() - t))
+
+    def _schedule(self, subset):
+        '''
+        :return: the indices of every full global batch of the subset
+        :rtype: List
+        '''
+        iterator = SequentialIterator(self.dataset, subset, self.batch_size, self.batch_size)
+        schedule = []
+        try:
+            while True:
+                try:
+                    indices = iterator.next_indices()
+                except StopIteration:
+                    break
+                if isinstance(indices, slice):
+                    indices = numpy.arange(indices.start, indices.stop, dtype='int64')
+                schedule.append(indices)
+        finally:
+            iterator.close()
+        return schedule
+
+    def _forward(self, rank, x, train, rng):
+        '''
+        Runs the worker's convolutional replica on its slice and its columns of the fully-connected layers on the
+        global batch, gathering every layer's activations from all the workers.
+
+        :return: the dropout masks used for each layer
+        :rtype: List
+        '''
+        rows = slice(rank * self.worker_batch, (rank + 1) * self.worker_batch)
+        self.activations[0][rows] = self.f_conv(x)
+        self.gather_barrier.wait(self.args.get('timeout'))
+        masks = []
+        n_layers = len(self.fc_weights)
+        for layer in range(n_layers):
+            start, stop = self.columns[layer][rank]
+            kind = 'hidden' if layer < n_layers - 1 else 'output'
+            if kind == 'hidden' and train:
+                mask = (rng.uniform(size=(self.batch_size, stop - start)) >= self.corruption)
+            else:
+                mask = numpy.ones((self.batch_size, stop - start))
+            mask = mask.astype(theano.config.floatX)
+            masks.append(mask)
+            self.activations[layer + 1][:, start:stop] = self.f_fc[kind](self.activations[layer],
+                                                                          self.fc_weights[layer][rank],
+                                                                          self.fc_biases[layer][rank],
+                                                                          mask)
+            self.gather_barrier.wait(self.args.get('timeout'))
+        return masks
+
+    def _backward(self, rank, x, masks, output_grad):
+        '''
+        Backpropagates the logits' gradient through the worker's columns and convolutional replica, and makes the
+        momentum updates.
+        '''
+        n_layers = len(self.fc_weights)
+        for layer in reversed(range(n_layers)):
+            start, stop = self.columns[layer][rank]
+            kind = 'hidden' if layer < n_layers - 1 else 'output'
+            W, b = self.fc_weights[layer][rank], self.fc_biases[layer][rank]
+            input_grad, W_grad, b_grad = self.f_fc_grad[kind](self.activations[layer], W, b, masks[layer],
+                                                              numpy.ascontiguousarray(output_grad[:, start:stop]))
+            # only this worker has these columns, so they can be updated right away
+            for value, velocity, gradient in zip([W, b], self.fc_velocities[layer][rank], [W_grad, b_grad]):
+                velocity *= self.momentum
+                velocity -= self.learning_rate * gradient
+                value += velocity
+            # every worker's columns contributed to the gradient of the layer input
+            size = input_grad.size
+            self.input_grads.row(rank)[:size] = input_grad.ravel()
+            output_grad = self.input_grads.allreduce(rank, size).reshape(input_grad.shape)
+
+        rows = slice(rank * self.worker_batch, (rank + 1) * self.worker_batch)
+        conv_grads = self.f_conv_grad(x, numpy.ascontiguousarray(output_grad[rows]))
+        row = self.conv_grads.row(rank)
+        for (start, stop, _), gradient in zip(self._conv_layout, conv_grads):
+            row[start:stop] = gradient.ravel()
+        reduced = self.conv_grads.allreduce(rank)
+        for param, velocity, (start, stop, shape) in zip(self.conv_params, self.conv_velocities, self._conv_layout):
+            value = param.get_value(borrow=True, return_internal_type=True)
+            velocity *= self.momentum
+            velocity -= self.learning_rate * reduced[start:stop].reshape(shape)
+            value += velocity
+
+    def _work(self, rank, schedule, subset, seed):
+        '''
+        Runs in each worker process - trains on (or evaluates) every global batch of the schedule.
+
+        :return: the cost and errors of each batch (only from the first worker, they are the same everywhere)
+        :rtype: Tuple(List, List)
+        '''
+        train = subset is datasets.TRAIN
+        rng = numpy.random.RandomState(seed + rank)
+        costs, errors = [], []
+        for indices in schedule:
+            x = self.dataset.getDataByIndices(indices[rank * self.worker_batch:(rank + 1) * self.worker_batch],
+                                              subset)
+            y = numpy.asarray(self.dataset.getLabelsByIndices(indices, subset), dtype='int64')
+            masks = self._forward(rank, x, train, rng)
+            cost, error, logits_grad = self.f_loss(self.activations[-1], y)
+            if train:
+                self._backward(rank, x, masks, logits_grad)
+            costs.append(cost)
+            errors.append(error)
+        if train and rank == 0:
+            for result, value in zip(self._conv_results,
+                                     [param.get_value(borrow=True) for param in self.conv_params] +
+                                     self.conv_velocities):
+                result[...] = value
+        if rank == 0:
+            return costs, errors
+
+    def _run(self, subset):
+        self._share_fc_params()
+        schedule = self._schedule(subset)
+        if len(schedule) == 0:
+            log.warning("%s subset has no full batches of %d examples", datasets.get_subset_strings(subset),
+                        self.batch_size)
+            return [], []
+        seed = self.rng.randint(2 ** 30)
+        results = run_workers(self._work, self.n_workers, args=(schedule, subset, seed),
+                              name='opendeep_hybrid_parallel_worker')
+        if subset is datasets.TRAIN:
+            n_params = len(self.conv_params)
+            set_shared_values(self.conv_params, self._conv_results[:n_params])
+            self.conv_velocities = [result.copy() for result in self._conv_results[n_params:]]
+        return results[0]
+
+    def save_params(self, param_file):
+        '''
+        Writes all the model's parameters to a .params file at the model's param_file_path() - the fully-connected
+        ones are the model's own, so the model can load the file by itself as well.
+
+        :param param_file: filename of the .params file
+        :type param_file: String
+
+        :return: whether or not successful
+        :rtype: Boolean
+        '''
+        return self.model.save_params(param_file)
+
+    def load_params(self, param_file):
+        '''
+        Restores the model's parameters from a file written by save_params(), and puts the fully-connected ones back
+        in shared memory. The momentum velocities start again from zero.
+
+        :param param_file: filename of the .params file
+        :type param_file: String
+
+        :return: whether or not successful
+        :rtype: Boolean
+        '''
+        path = self.model.param_file_path(param_file)
+        if not self.model.load_params(path, mmap=False):
+            log.error("Couldn't load the hybrid parallel parameters from %s", path)
+            return False
+        self._share_fc_params()
+        for layer in self.fc_velocities:
+            for velocities in layer:
+                for velocity in velocities:
+                    velocity[...] = 0
+        self.conv_velocities = [numpy.zeros_like(velocity) for velocity in self.conv_velocities]
+        log.info("Loaded the hybrid parallel parameters from %s", path)
+        return True
+
+    def train(self, resume_from=None):
+        '''
+        Trains the model.
+
+        :param resume_from: a .params file from save_params() to start from
+        :type resume_from: String
+        '''
+        log.info("-----------TRAINING %s HYBRID PARALLEL OVER %d WORKERS FOR %s EPOCHS-----------",
+                 str(type(self.model)), self.n_workers, str(self.n_epoch))
+        if resume_from is not None and not self.load_params(resume_from):
+            log.error("Couldn't resume from %s!", str(resume_from))
+            raise AssertionError("Couldn't resume from %s!" % str(resume_from))
+        times = []
+        for epoch in range(1, self.n_epoch + 1):
+            t = time.time()
+            log.info('EPOCH %s', str(epoch))
+            costs, errors = self._run(datasets.TRAIN)
+            log.info('Train cost: %s, dropout errors: %s', trunc(numpy.mean(costs)), trunc(numpy.mean(errors)))
+            for subset in [datasets.VALID, datasets.TEST]:
+                if self.dataset.hasSubset(subset):
+                    costs, errors = self._run(subset)
+                    if len(costs) > 0:
+                        log.info('%s cost: %s, errors: %s', datasets.get_subset_strings(subset).capitalize(),
+                                 trunc(numpy.mean(costs)), trunc(numpy.mean(errors)))
+            times.append(time.time() - t)
+            log.info('time: ' + make_time_units_string(times[-1]))
+            log.info('remaining time: ' + make_time_units_string((self.n_epoch - epoch) * numpy.mean(times)))
+            if epoch % self.save_frequency == 0 or epoch == self.n_epoch:
+                self.save_params('trained_epoch_%d.params' % epoch)
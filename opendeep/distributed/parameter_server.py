@@ -0,0 +1,564 @@
+'''
+.. module:: parameter_server
+
+A Downpour-style asynchronous parameter server over TCP.
+
+One server process holds the model parameters (from Model.get_param_values()), sharded by tensor - each shard has its
+own lock, so pushes to different tensors are applied concurrently. Workers pull the parameters every n_fetch steps,
+push their summed gradients every n_push steps, and the server applies them with its own update rule (SGD or Adagrad,
+as in the paper). Every tensor has a version counting the pushes applied to it, so the server can measure how stale
+each pushed gradient is (the pushes applied since its parameters were pulled) and drop gradients that are too stale.
+
+The server only speaks plain TCP, so the same code runs with every worker on one machine (LocalParameterServer starts
+a stand-in server process on localhost) or across nodes. The messages are pickled, so only run it on trusted networks.
+
+'Large Scale Distributed Deep Networks'
+Jeffrey Dean, Greg S. Corrado, Rajat Monga, Kai Chen, Matthieu Devin, Quoc V. Le, Mark Z. Mao, Marc'Aurelio Ranzato,
+Andrew Senior, Paul Tucker, Ke Yang, Andrew Y. Ng
+http://papers.nips.cc/paper/4687-large-scale-distributed-deep-networks.pdf
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import multiprocessing
+import socket
+import SocketServer
+import struct
+import threading
+import cPickle
+# third party libraries
+import numpy
+import theano
+from theano.compat.python2x import OrderedDict  # use this compatibility OrderedDict
+# internal references
+from opendeep.optimization.stochastic_gradient_descent import SGD, _defaults
+from opendeep.data.iterators.sequential import SequentialIterator
+import opendeep.data.dataset as datasets
+from opendeep.utils.misc import set_shared_values
+from opendeep.utils.param_file import param_names
+from opendeep.distributed.processes import run_workers, check_host_device
+
+log = logging.getLogger(__name__)
+
+# the server's update rules
+SGD_RULE     = 'sgd'
+ADAGRAD_RULE = 'adagrad'
+
+_LENGTH = struct.Struct('<Q')
+
+def send_message(sock, message):
+    '''
+    Sends a pickled message with its length in front.
+    '''
+    data = cPickle.dumps(message, protocol=cPickle.HIGHEST_PROTOCOL)
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+def _receive_exactly(sock, n_bytes):
+    chunks = []
+    while n_bytes > 0:
+        chunk = sock.recv(min(n_bytes, 1 << 20))
+        if not chunk:
+            raise EOFError("Connection closed")
+        chunks.append(chunk)
+        n_bytes -= len(chunk)
+    return ''.join(chunks)
+
+def receive_message(sock):
+    '''
+    Receives a message sent by send_message().
+
+    :raises: EOFError if the connection closed
+    '''
+    n_bytes, = _LENGTH.unpack(_receive_exactly(sock, _LENGTH.size))
+    return cPickle.loads(_receive_exactly(sock, n_bytes))
+
+
+class _TCPServer(SocketServer.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ParameterServer(object):
+    '''
+    Holds the parameters and applies the pushed gradients. serve_forever() answers the clients' requests over TCP,
+    one thread per connection.
+    '''
+    def __init__(self, param_values, names=None, host='127.0.0.1', port=0, n_shards=None, rule=SGD_RULE,
+                 max_staleness=None, epsilon=1e-6):
+        '''
+        :param param_values: the initial parameter values, i.e. from Model.get_param_values()
+        :type param_values: List(numpy.ndarray)
+
+        :param names: the names of the parameters. Defaults to 'param_0', 'param_1', ...
+        :type names: List(String)
+
+        :param host: the interface to listen on - use '' or '0.0.0.0' to accept workers from other nodes
+        :type host: String
+
+        :param port: the port to listen on, 0 picks a free port (see address)
+        :type port: Integer
+
+        :param n_shards: the number of shards to split the tensors into, each with its own lock. Defaults to one
+        shard per tensor.
+        :type n_shards: Integer
+
+        :param rule: how to apply the pushed gradients - SGD_RULE (value -= learning_rate * gradient) or ADAGRAD_RULE
+        (which scales each element's learning rate by its history of squared gradients, like Downpour)
+        :type rule: String
+
+        :param max_staleness: drop pushed gradients that more than this many pushes were applied after they were
+        pulled. None applies every gradient.
+        :type max_staleness: Integer
+
+        :param epsilon: added to the Adagrad denominator
+        :type epsilon: Float
+        '''
+        if rule not in [SGD_RULE, ADAGRAD_RULE]:
+            log.error("Parameter server rule %s not recognized, needs to be one of %s", str(rule),
+                      str([SGD_RULE, ADAGRAD_RULE]))
+            raise NotImplementedError("Parameter server rule %s not recognized" % str(rule))
+        names = names or ['param_%d' % i for i in range(len(param_values))]
+        self.values = OrderedDict((name, numpy.array(value)) for name, value in zip(names, param_values))
+        self.versions = dict((name, 0) for name in names)
+        self.rule = rule
+        self.max_staleness = max_staleness
+        self.epsilon = epsilon
+        if self.rule == ADAGRAD_RULE:
+            self.accumulators = dict((name, numpy.zeros_like(value)) for name, value in self.values.items())
+
+        # shard by tensor - the biggest tensors go first, each to the least loaded shard
+        n_shards = min(n_shards or len(names), max(len(names), 1))
+        loads = [0] * n_shards
+        self.shard_of = {}
+        for name in sorted(names, key=lambda name: -self.values[name].size):
+            shard = loads.index(min(loads))
+            self.shard_of[name] = shard
+            loads[shard] += self.values[name].size
+        self.locks = [threading.Lock() for _ in range(n_shards)]
+
+        # staleness statistics over the applied and dropped pushes
+        self._stats_lock = threading.Lock()
+        self.stats = {'pushes': 0, 'dropped': 0, 'total_staleness': 0, 'max_staleness': 0}
+
+        server = self
+
+        class _Handler(SocketServer.BaseRequestHandler):
+            def handle(self):
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                while True:
+                    try:
+                        message = receive_message(self.request)
+                    except EOFError:
+                        return
+                    reply = server.handle(message)
+                    send_message(self.request, reply)
+                    if message[0] == 'stop':
+                        threading.Thread(target=server.shutdown).start()
+                        return
+
+        self._server = _TCPServer((host, port), _Handler)
+        self.address = self._server.server_address
+
+    def pull(self, names=None):
+        '''
+        :return: copies of the values and their versions
+        :rtype: Tuple(Dictionary, Dictionary)
+        '''
+        names = names or list(self.values.keys())
+        values, versions = {}, {}
+        for name in names:
+            with self.locks[self.shard_of[name]]:
+                values[name] = self.values[name].copy()
+                versions[name] = self.versions[name]
+        return values, versions
+
+    def push(self, gradients, versions, learning_rate):
+        '''
+        Applies the gradients, unless they are staler than max_staleness. The staleness is computed and the gradients
+        applied while holding the locks of every shard they touch, so concurrent pushes can't both pass the bound
+        against the same versions.
+
+        :param gradients: the summed gradients by parameter name
+        :type gradients: Dictionary
+
+        :param versions: the versions of the parameters the gradients were computed with
+        :type versions: Dictionary
+
+        :param learning_rate: the learning rate to apply the gradients with
+        :type learning_rate: Float
+
+        :return: the staleness of the gradients (the most pushes applied to any of the tensors since they were pulled)
+        :rtype: Integer
+        '''
+        # take the shard locks in order, so pushes over overlapping shards can't deadlock
+        shards = sorted(set(self.shard_of[name] for name in gradients.keys()))
+        for shard in shards:
+            self.locks[shard].acquire()
+        try:
+            staleness = 0
+            for name in gradients.keys():
+                staleness = max(staleness, self.versions[name] - versions.get(name, self.versions[name]))
+            dropped = self.max_staleness is not None and staleness > self.max_staleness
+            if not dropped:
+                for name, gradient in gradients.items():
+                    value = self.values[name]
+                    if self.rule == ADAGRAD_RULE:
+                        accumulator = self.accumulators[name]
+                        accumulator += gradient ** 2
+                        value -= learning_rate * gradient / (numpy.sqrt(accumulator) + self.epsilon)
+                    else:
+                        value -= learning_rate * gradient
+                    self.versions[name] += 1
+        finally:
+            for shard in reversed(shards):
+                self.locks[shard].release()
+        with self._stats_lock:
+            self.stats['pushes'] += 1
+            self.stats['dropped'] += int(dropped)
+            self.stats['total_staleness'] += staleness
+            self.stats['max_staleness'] = max(self.stats['max_staleness'], staleness)
+        return staleness
+
+    def set(self, values):
+        '''
+        Replaces parameter values (i.e. with a restored checkpoint) and resets their optimizer state.
+        '''
+        for name, value in values.items():
+            with self.locks[self.shard_of[name]]:
+                self.values[name][...] = value
+                if self.rule == ADAGRAD_RULE:
+                    self.accumulators[name][...] = 0
+
+    def handle(self, message):
+        '''
+        :return: the reply to a request from a ParameterClient
+        '''
+        command = message[0]
+        if command == 'pull':
+            return self.pull(*message[1:])
+        elif command == 'push':
+            return self.push(*message[1:])
+        elif command == 'set':
+            return self.set(*message[1:])
+        elif command == 'stats':
+            with self._stats_lock:
+                return dict(self.stats)
+        elif command == 'stop':
+            return True
+        log.error("Unknown parameter server request %s", str(command))
+        return None
+
+    def serve_forever(self):
+        log.info("Parameter server listening on %s", str(self.address))
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def shutdown(self):
+        self._server.shutdown()
+
+
+class ParameterClient(object):
+    '''
+    A connection to a ParameterServer.
+    '''
+    def __init__(self, address, timeout=None):
+        '''
+        :param address: the (host, port) of the server
+        :type address: Tuple
+
+        :param timeout: the seconds to wait on the server before giving up
+        :type timeout: Float
+        '''
+        self.address = tuple(address)
+        self.sock = socket.create_connection(self.address, timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _request(self, *message):
+        send_message(self.sock, message)
+        return receive_message(self.sock)
+
+    def pull(self, names=None):
+        '''
+        :return: the parameter values by name and their versions
+        :rtype: Tuple(Dictionary, Dictionary)
+        '''
+        return self._request('pull', names)
+
+    def push(self, gradients, versions, learning_rate):
+        '''
+        :return: the staleness of the pushed gradients
+        :rtype: Integer
+        '''
+        return self._request('push', gradients, versions, learning_rate)
+
+    def set(self, values):
+        return self._request('set', values)
+
+    def stats(self):
+        return self._request('stats')
+
+    def stop(self):
+        '''
+        Shuts the server down.
+        '''
+        return self._request('stop')
+
+    def close(self):
+        self.sock.close()
+
+
+def _serve(server_args, server_kwargs, connection):
+    server = ParameterServer(*server_args, **server_kwargs)
+    connection.send(server.address)
+    connection.close()
+    server.serve_forever()
+
+class LocalParameterServer(object):
+    '''
+    Runs a ParameterServer in a separate process on this machine, as a stand-in for a server on another node.
+    '''
+    def __init__(self, param_values, names=None, **kwargs):
+        '''
+        The parameters are the same as for ParameterServer.
+        '''
+        kwargs.setdefault('host', '127.0.0.1')
+        parent_connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=((param_values, names), kwargs, child_connection),
+                                               name='opendeep_parameter_server')
+        self.process.daemon = True
+        self.process.start()
+        self.address = parent_connection.recv()
+        parent_connection.close()
+
+    def stop(self):
+        if self.process.is_alive():
+            try:
+                client = ParameterClient(self.address, timeout=10)
+                client.stop()
+                client.close()
+            except (socket.error, EOFError):
+                log.exception("Couldn't stop the parameter server at %s", str(self.address))
+            self.process.join(timeout=10)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+
+
+class DownpourSGD(SGD):
+    '''
+    Asynchronous SGD against a parameter server - N local worker processes each train on their share of the batches,
+    pulling the parameters every n_fetch steps and pushing their summed gradients every n_push steps. The server
+    applies the updates, so the optimizer's own update rule (i.e. momentum) isn't used; the learning rate (and its
+    decay) is sent with every push. Trainers on other nodes can share the same server through server_address.
+    '''
+    def __init__(self, model, dataset, n_workers=None, server_address=None, initialize_server=True,
+                 iterator_class=SequentialIterator, config=None, defaults=_defaults, rng=None, n_epoch=None,
+                 batch_size=None, minimum_batch_size=None, save_frequency=None, early_stop_threshold=None,
+                 early_stop_length=None, learning_rate=None, index_batches=None, n_fetch=1, n_push=1,
+                 server_rule=SGD_RULE, max_staleness=None, **kwargs):
+        '''
+        :param n_workers: the number of local worker processes. Defaults to the number of CPUs.
+        :type n_workers: Integer
+
+        :param server_address: the (host, port) of a running ParameterServer. None starts a LocalParameterServer.
+        :type server_address: Tuple
+
+        :param initialize_server: whether to set the server's parameters to the model's when training starts (only
+        one trainer sharing a server should)
+        :type initialize_server: Boolean
+
+        :param n_fetch: the number of steps between pulling the parameters from the server
+        :type n_fetch: Integer
+
+        :param n_push: the number of steps to sum the gradients over before pushing them to the server
+        :type n_push: Integer
+
+        :param server_rule: the update rule of a local server - SGD_RULE or ADAGRAD_RULE
+        :type server_rule: String
+
+        :param max_staleness: the local server drops gradients staler than this many pushes
+        :type max_staleness: Integer
+
+        The other parameters are the same as for SGD, and any other SGD options (i.e. lr_decay) are passed through
+        to it as keyword arguments.
+        '''
+        check_host_device('DownpourSGD')
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.n_fetch = n_fetch
+        self.n_push = n_push
+        assert self.n_workers >= 1, "Need at least 1 worker process, found %s" % str(self.n_workers)
+        assert self.n_fetch >= 1 and self.n_push >= 1, "n_fetch and n_push need to be at least 1"
+
+        super(DownpourSGD, self).__init__(model=model,
+                                          dataset=dataset,
+                                          iterator_class=iterator_class,
+                                          config=config,
+                                          defaults=defaults,
+                                          rng=rng,
+                                          n_epoch=n_epoch,
+                                          batch_size=batch_size,
+                                          minimum_batch_size=minimum_batch_size,
+                                          save_frequency=save_frequency,
+                                          early_stop_threshold=early_stop_threshold,
+                                          early_stop_length=early_stop_length,
+                                          learning_rate=learning_rate,
+                                          index_batches=index_batches,
+                                          **kwargs)
+        self.param_names = param_names(self.params)
+        self.server_address = server_address
+        self.initialize_server = initialize_server
+        self.server_rule = server_rule
+        self.max_staleness = max_staleness
+        self.local_server = None
+        self._server_initialized = False
+        # staleness of every push in the last epoch
+        self.staleness = []
+
+    def _compile_learn(self, outputs, updates):
+        '''
+        Compiles f_learn to return the gradients after the cost and monitors, without the optimizer updates - the
+        parameter server applies those.
+        '''
+        if self.accumulate_steps > 1:
+            log.error("DownpourSGD sums the gradients over n_push steps itself, use that instead of "
+                      "accumulate_steps=%s.", str(self.accumulate_steps))
+            raise AssertionError("DownpourSGD doesn't support accumulate_steps, use n_push.")
+        optimizer_vars = set(self.params + self.optimizer_vars)
+        other_updates = OrderedDict((var, update) for var, update in updates.items() if var not in optimizer_vars)
+        self._n_outputs = len(outputs)
+        gradients = [self.grads[param] for param in self.params]
+        return super(DownpourSGD, self)._compile_learn(list(outputs) + gradients, other_updates)
+
+    def _connect(self):
+        '''
+        Starts the local server if there isn't one, and sets its parameters the first time.
+        '''
+        if self.server_address is None:
+            self.local_server = LocalParameterServer(self.model.get_param_values(borrow=False),
+                                                     names=self.param_names,
+                                                     rule=self.server_rule,
+                                                     max_staleness=self.max_staleness)
+            self.server_address = self.local_server.address
+            self._server_initialized = True
+        elif self.initialize_server and not self._server_initialized:
+            client = ParameterClient(self.server_address)
+            try:
+                client.set(dict(zip(self.param_names, self.model.get_param_values(borrow=False))))
+            finally:
+                client.close()
+            self._server_initialized = True
+
+    def _pull(self, client):
+        values, versions = client.pull(self.param_names)
+        set_shared_values(self.params, [values[name] for name in self.param_names], borrow=True)
+        return versions
+
+    def _work(self, rank, seed):
+        '''
+        Runs in each worker process - trains on the worker's shard of the epoch against the server. Every worker
+        seeds its rng with the same seed, so the shards come from the same shuffle.
+
+        :return: the training costs, the training monitor values, the staleness of each push, and the number of
+        examples the worker trained on
+        :rtype: Tuple(List, Dictionary, List, Integer)
+        '''
+        self.rng = numpy.random.RandomState(seed)
+        client = ParameterClient(self.server_address)
+        train_costs = []
+        train_monitors = {key: [] for key in self.train_monitor_names}
+        staleness = []
+        n_examples = 0
+        try:
+            versions = self._pull(client)
+            sums = [None] * len(self.params)
+            n_summed = 0
+            for step, indices in enumerate(self._train_schedule(self.n_workers, rank)):
+                inputs = None
+                if isinstance(indices, slice):
+                    n_examples += indices.stop - indices.start
+                else:
+                    n_examples += len(indices)
+                if self.index_batches:
+                    if isinstance(indices, slice):
+                        indices = numpy.arange(indices.start, indices.stop, dtype='int64')
+                    outputs = self.f_learn(numpy.asarray(indices, dtype='int64'))
+                    if len(self.monitor_expressions) == 0 and len(self.train_monitor_names) > 0:
+                        inputs = [self.dataset.getDataByIndices(indices, datasets.TRAIN)]
+                        if not self.unsupervised:
+                            inputs.append(self.dataset.getLabelsByIndices(indices, datasets.TRAIN))
+                else:
+                    inputs = [self.dataset.getDataByIndices(indices, datasets.TRAIN)]
+                    if not self.unsupervised:
+                        inputs.append(self.dataset.getLabelsByIndices(indices, datasets.TRAIN))
+                    outputs = self.f_learn(*inputs)
+                self._record_train_step(outputs[:self._n_outputs], inputs, train_costs, train_monitors)
+
+                for i, gradient in enumerate(outputs[self._n_outputs:]):
+                    sums[i] = numpy.array(gradient) if sums[i] is None else sums[i] + gradient
+                n_summed += 1
+                if n_summed >= self.n_push:
+                    staleness.append(client.push(dict(zip(self.param_names, sums)), versions,
+                                                 float(self.learning_rate.get_value())))
+                    sums = [None] * len(self.params)
+                    n_summed = 0
+                if (step + 1) % self.n_fetch == 0:
+                    versions = self._pull(client)
+            if n_summed > 0:
+                staleness.append(client.push(dict(zip(self.param_names, sums)), versions,
+                                             float(self.learning_rate.get_value())))
+        finally:
+            client.close()
+        return train_costs, train_monitors, staleness, n_examples
+
+    def _perform_train_pass(self):
+        '''
+        Forks the workers to train on their shares of the epoch asynchronously, then pulls the trained parameters
+        from the server into the model.
+
+        :return: the training costs and the training monitor values for each batch
+        :rtype: Tuple(List, Dictionary)
+        '''
+        self._connect()
+        # a new shared seed every epoch, so the workers' shards are reshuffled
+        seed = self.rng.randint(2 ** 30)
+        results = run_workers(self._work, self.n_workers, args=(seed,), name='opendeep_downpour_worker')
+        client = ParameterClient(self.server_address)
+        try:
+            self._pull(client)
+        finally:
+            client.close()
+
+        train_costs = []
+        train_monitors = {key: [] for key in self.train_monitor_names}
+        self.staleness = []
+        for costs, monitors, staleness, n_examples in results:
+            train_costs.extend(costs)
+            for key in train_monitors.keys():
+                train_monitors[key].extend(monitors[key])
+            self.staleness.extend(staleness)
+            self.epoch_timer.examples += n_examples
+        if len(self.staleness) > 0:
+            log.info('Gradient staleness: mean %s, max %d', str(numpy.mean(self.staleness)), max(self.staleness))
+        return train_costs, train_monitors
+
+    def _perform_index_pass(self):
+        # the workers handle both the data and the index modes
+        return self._perform_train_pass()
+
+    def train(self, continue_training=False, resume_from=None):
+        try:
+            super(DownpourSGD, self).train(continue_training=continue_training, resume_from=resume_from)
+        finally:
+            if self.local_server is not None:
+                self.local_server.stop()
+                self.local_server = None
+                self.server_address = None
+                self._server_initialized = False
@@ -0,0 +1,110 @@
+'''
+.. module:: processes
+
+Running a group of local worker processes forked from the training process. Forking means the workers start with
+everything the parent already built (the model, the compiled functions, the dataset, and any shared memory buffers)
+without pickling any of it.
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import multiprocessing
+import Queue
+import traceback
+# third party libraries
+import theano
+
+log = logging.getLogger(__name__)
+
+# how long (in seconds) to wait on the workers' results before checking whether they are still alive.
+_POLL_INTERVAL = 0.1
+
+def check_host_device(trainer_name):
+    '''
+    Makes sure theano computes on the CPU, since the forked workers can't share the parent's GPU context. Any device
+    other than the CPU is refused - 'gpu*' with the old backend, and 'cuda*' or 'opencl*' with gpuarray.
+
+    :param trainer_name: the name of the trainer for the error message
+    :type trainer_name: String
+
+    :raises: AssertionError if theano isn't computing on the CPU
+    '''
+    device = str(theano.config.device)
+    contexts = str(getattr(theano.config, 'contexts', '') or '')
+    if not device.startswith('cpu') or contexts:
+        target = device if not contexts else "%s (contexts %s)" % (device, contexts)
+        log.error("%s forks its workers on the CPU, but the theano device is %s!", trainer_name, target)
+        raise AssertionError("%s forks its workers on the CPU, but the theano device is %s!" % (trainer_name, target))
+
+def _run_worker(target, rank, results, args):
+    try:
+        results.put((rank, target(rank, *args), None))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        log.exception("Exception in worker %d", rank)
+        results.put((rank, None, traceback.format_exc()))
+
+def run_workers(target, n_workers, args=(), name='opendeep_worker'):
+    '''
+    Forks n_workers processes that each call target(rank, *args), and waits for all of them to finish. If any worker
+    fails or dies, the others are terminated and the error is raised here.
+
+    :param target: the function to run in each worker - its return value is sent back to this process, so it has
+    to be picklable
+    :type target: function
+
+    :param n_workers: the number of worker processes
+    :type n_workers: Integer
+
+    :param args: the extra arguments for target after the worker's rank
+    :type args: Tuple
+
+    :param name: the prefix for the worker process names
+    :type name: String
+
+    :return: the return values of target, ordered by rank
+    :rtype: List
+
+    :raises: RuntimeError if a worker raised an exception or died
+    '''
+    results = multiprocessing.Queue()
+    workers = []
+    for rank in range(n_workers):
+        worker = multiprocessing.Process(target=_run_worker, args=(target, rank, results, args),
+                                         name='%s_%d' % (name, rank))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+
+    values = [None] * n_workers
+    received = 0
+    try:
+        while received < n_workers:
+            try:
+                rank, value, error = results.get(True, _POLL_INTERVAL)
+            except Queue.Empty:
+                for worker in workers:
+                    if not worker.is_alive() and worker.exitcode not in (0, None):
+                        log.error("Worker %s died with exit code %s", worker.name, str(worker.exitcode))
+                        raise RuntimeError("Worker %s died with exit code %s" % (worker.name, str(worker.exitcode)))
+                continue
+            if error is not None:
+                log.error("Worker %d failed:\n%s", rank, error)
+                raise RuntimeError("Worker %d failed:\n%s" % (rank, error))
+            values[rank] = value
+            received += 1
+    finally:
+        for worker in workers:
+            # the workers are done (or have to be stopped because another one failed)
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+    return values
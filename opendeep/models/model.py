@@ -18,10 +18,14 @@ __email__ = "opendeep-dev@googlegroups.com"
 import logging
 import os
 import cPickle
+from collections import OrderedDict
+# third party libraries
+import numpy
 # internal references
 from opendeep.utils.config import combine_config_and_defaults
 from opendeep.utils import file_ops
 from opendeep.utils.misc import set_shared_values, get_shared_values
+from opendeep.utils.param_file import save_param_file, load_param_file, param_names
 
 log = logging.getLogger(__name__)
 
@@ -222,6 +226,40 @@ class Model(object):
         return {}
 
 
+    def get_monitor_expressions(self):
+        """
+        This returns an ordered dictionary of (monitor_name: theano_expression) for the same monitors as get_monitors(),
+        but as symbolic expressions over get_inputs() instead of compiled functions. The Optimizer compiles these as
+        extra outputs of its training function, so the training monitors come out of the same forward pass as the
+        cost instead of re-running the model once per monitor function.
+
+        Models that only return compiled functions from get_monitors() can leave this empty - the Optimizer will fall
+        back to calling those functions.
+        ------------------
+
+        :return: OrderedDict of String: theano expression for each monitor variable we care about in the model.
+        :rtype: OrderedDict
+        """
+        # no symbolic monitors by default
+        return OrderedDict()
+
+
+    def get_train_monitor_expressions(self):
+        """
+        This returns the same monitors as get_monitor_expressions() (with the same names, in the same order), but
+        built on the graph of the training cost - i.e. with the dropout or noise the training cost uses - so the
+        Optimizer's training function can compute them from the forward pass it already makes for the cost.
+        get_monitor_expressions() stays the version evaluated on the valid and test sets.
+
+        Defaults to get_monitor_expressions(), for models whose monitors don't differ between the two graphs.
+        ------------------
+
+        :return: OrderedDict of String: theano expression for each monitor variable, on the training graph.
+        :rtype: OrderedDict
+        """
+        return self.get_monitor_expressions()
+
+
     def get_decay_params(self):
         """
         If the model requires any of its internal parameters to decay over time during training, return the list
@@ -268,6 +306,18 @@ class Model(object):
         raise NotImplementedError("Please implement a get_params method for %s" % str(type(self)))
 
 
+    def get_param_names(self):
+        """
+        This returns a unique name for each parameter from get_params(), in the same order. These are the names used
+        in .params files, so parameters can be loaded by name.
+        ------------------
+
+        :return: list of unique parameter names
+        :rtype: List(String)
+        """
+        return param_names(self.get_params())
+
+
     def get_param_values(self, borrow=True):
         """
         This returns a list of the parameter values for the model.
@@ -335,21 +385,43 @@ class Model(object):
         return True
 
 
-    def save_params(self, param_file):
+    def param_file_path(self, param_file):
         """
-        This saves the model's parameters to the param_file (pickle file)
+        This returns the full path that save_params() writes the param_file to. Override this if your model keeps
+        its files somewhere specific (like an output directory from its config).
         ------------------
 
-        :param param_file: filename of pickled params file
+        :param param_file: filename of the params file
         :type param_file: String
 
+        :return: the full path to the params file
+        :rtype: String
+        """
+        return os.path.realpath(param_file)
+
+
+    def save_params(self, param_file, param_values=None):
+        """
+        This saves the model's parameters to the param_file - a pickle file, or the memory-mappable .params format
+        (see opendeep.utils.param_file) if param_file ends with '.params'. The file is written to a temporary name
+        first and then renamed into place, so an interrupted save never leaves a partial file behind.
+        ------------------
+
+        :param param_file: filename of the params file (.pkl or .params)
+        :type param_file: String
+
+        :param param_values: the parameter values to save instead of the current ones (i.e. a snapshot taken earlier
+        by a background checkpointer)
+        :type param_values: List(array)
+
         :return: whether or not successful
         :rtype: Boolean
         """
         # By default, try to dump all the values from get_param_values into a pickle file.
-        params = self.get_param_values()
+        if param_values is None:
+            param_values = self.get_param_values()
 
-        param_file = os.path.realpath(param_file)
+        param_file = self.param_file_path(param_file)
 
         # force extension to be .pkl if it isn't a pickle file
         _, extension = os.path.splitext(param_file)
@@ -359,33 +431,49 @@ class Model(object):
         log.debug('Saving %s parameters to %s...',
                   str(type(self)), str(param_file))
         # try to dump the param values
-        with open(param_file, 'wb') as f:
-            try:
-                cPickle.dump(params, f, protocol=cPickle.HIGHEST_PROTOCOL)
-            except Exception as e:
-                log.exception("Some issue saving model %s parameters to %s! Exception: %s",
-                              str(type(self)), str(param_file), str(e))
-                return False
-            finally:
-                f.close()
+        tmp_file = param_file + '.tmp'
+        try:
+            if extension.lower() == '.params':
+                save_param_file(tmp_file, self.get_param_names(), param_values)
+            else:
+                with open(tmp_file, 'wb') as f:
+                    cPickle.dump(param_values, f, protocol=cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, param_file)
+        except Exception as e:
+            log.exception("Some issue saving model %s parameters to %s! Exception: %s",
+                          str(type(self)), str(param_file), str(e))
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            return False
 
         return True
 
 
-    def load_params(self, param_file):
+    def load_params(self, param_file, names=None, mmap=True):
         """
-        This loads the model's parameters from the param_file (pickle file)
+        This loads the model's parameters from the param_file (pickle file or .params file). The shapes of the loaded
+        values are checked against the current parameters before any of them are changed.
         ------------------
 
-        :param param_file: filename of pickled params file
+        :param param_file: filename of the params file
         :type param_file: String
 
+        :param names: the names (from get_param_names()) of the parameters to load. Defaults to all of them.
+        :type names: List(String)
+
+        :param mmap: for .params files, whether to memory-map the values instead of reading them into memory, so
+        only the pages that are used get read (and they are shared between processes loading the same file).
+        :type mmap: Boolean
+
         :return: whether or not successful
         :rtype: Boolean
         """
         param_file = os.path.realpath(param_file)
+        model_names = self.get_param_names()
+        if names is None:
+            names = model_names
 
-        # make sure it is a pickle file
+        # make sure it is a pickle file or a .params file
         ftype = file_ops.get_file_type(param_file)
         if ftype == file_ops.PKL:
             log.debug("loading model %s parameters from %s...",
@@ -393,13 +481,41 @@ class Model(object):
             # try to grab the pickled params from the specified param_file path
             with open(param_file, 'r') as f:
                 loaded_params = cPickle.load(f)
-            self.set_param_values(loaded_params)
-            return True
-        # if get_file_type didn't return pkl or none, it wasn't a pickle file
+            if len(loaded_params) != len(model_names):
+                log.error("Param file %s has %d parameters, %s has %d!",
+                          str(param_file), len(loaded_params), str(type(self)), len(model_names))
+                return False
+            # the pickled values are in the order of get_params()
+            loaded = dict(zip(model_names, loaded_params))
+            values = [(name, loaded[name]) for name in names]
+        elif ftype == file_ops.PARAMS:
+            log.debug("loading model %s parameters from %s (mmap=%s)...",
+                      str(type(self)), str(param_file), str(mmap))
+            try:
+                values = load_param_file(param_file, names=names, mmap=mmap).items()
+            except (KeyError, AssertionError) as e:
+                log.error("Couldn't load params from %s: %s", str(param_file), str(e))
+                return False
+        # if get_file_type didn't return pkl, params, or none, it wasn't a params file
         elif ftype:
-            log.error("Param file %s doesn't have a supported pickle extension!", str(param_file))
+            log.error("Param file %s doesn't have a supported pickle or .params extension!", str(param_file))
             return False
         # if get_file_type returned none, it couldn't find the file
         else:
             log.error("Param file %s couldn't be found!", str(param_file))
-            return False
\ No newline at end of file
+            return False
+
+        # validate everything before touching the shared variables
+        params = dict(zip(model_names, self.get_params()))
+        for name, value in values:
+            if name not in params:
+                log.error("%s doesn't have a parameter named %s!", str(type(self)), str(name))
+                return False
+            expected = tuple(params[name].get_value(borrow=True).shape)
+            if tuple(numpy.shape(value)) != expected:
+                log.error("Parameter %s from %s has shape %s, expected %s!",
+                          str(name), str(param_file), str(numpy.shape(value)), str(expected))
+                return False
+        for name, value in values:
+            params[name].set_value(value, borrow=True)
+        return True
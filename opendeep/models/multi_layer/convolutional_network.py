@@ -71,10 +71,28 @@ class AlexNet(Model):
                   "use_data_layer": False,
                   "rand_crop": True,
                   "batch_size": 256,  # convolutional nets are particular about the batch size
-                  "output_path": '/outputs/alexnet/'
+                  "output_path": '/outputs/alexnet/',
+                  # train with opendeep.distributed.model_parallel.HybridParallelSGD, which splits the columns of
+                  # the fully-connected parameters (fc_params) across its worker processes
+                  "model_parallel_fc": False
+    }
+    # the sizes of the flattened convolutional output and the fully-connected layers
+    fc_sizes = [9216, 4096, 4096, 1000]
+    fc_config = {
+        'activation': 'rectifier',  # type of activation function to use for output
+        'weights_init': 'gaussian',  # either 'gaussian' or 'uniform' - how to initialize weights
+        'weights_mean': 0.0,  # mean for gaussian weights init
+        'weights_std': 0.005,  # standard deviation for gaussian weights init
+        'bias_init': 0.0  # how to initialize the bias parameter
+    }
+    softmax_config = {
+        'weights_init': 'gaussian',
+        'weights_mean': 0.0,
+        'weights_std': 0.005,
+        'bias_init': 0.0
     }
     def __init__(self, config=None, defaults=defaults, inputs_hook=None, hiddens_hook=None, params_hook=None,
-                 use_data_layer=None, rand_crop=None, batch_size=None):
+                 use_data_layer=None, rand_crop=None, batch_size=None, model_parallel_fc=None):
         # init Model to combine the defaults and config dictionaries.
         super(AlexNet, self).__init__(config, defaults)
         # all configuration parameters are now in self.args
@@ -86,6 +104,7 @@ class AlexNet(Model):
         self.flag_datalayer = use_data_layer or self.args.get('use_data_layer')
         self.batch_size     = batch_size or self.args.get('batch_size')
         self.rand_crop      = rand_crop or self.args.get('rand_crop')
+        self.model_parallel_fc = model_parallel_fc or self.args.get('model_parallel_fc')
 
         ####################
         # Theano variables #
@@ -182,17 +201,15 @@ class AlexNet(Model):
         # Add this layer's parameters!
         self.params += convpool_layer5.get_params()
 
+        # the flattened convolutional features that go into the fully-connected layers
+        self.conv_output = T.flatten(convpool_layer5.get_outputs(), 2)
+        self.conv_params = list(self.params)
+
         # Now onto the fully-connected layers!
-        fc_config = {
-            'activation': 'rectifier',  # type of activation function to use for output
-            'weights_init': 'gaussian',  # either 'gaussian' or 'uniform' - how to initialize weights
-            'weights_mean': 0.0,  # mean for gaussian weights init
-            'weights_std': 0.005,  # standard deviation for gaussian weights init
-            'bias_init': 0.0  # how to initialize the bias parameter
-        }
+        fc_config = self.fc_config
         log.debug("fully connected layer 1 (model layer 6)...")
         # we want to have dropout applied to the training version, but not the test version.
-        fc_layer6_input = T.flatten(convpool_layer5.get_outputs(), 2)
+        fc_layer6_input = self.conv_output
         fc_layer6 = BasicLayer(inputs_hook=(9216, fc_layer6_input), output_size=4096, config=fc_config)
         # Add this layer's parameters!
         self.params += fc_layer6.get_params()
@@ -215,12 +232,7 @@ class AlexNet(Model):
         dropout_layer7 = dropout(fc_layer7_train.get_outputs(), corruption_level=0.5)
 
         # last layer is a softmax prediction output layer
-        softmax_config = {
-            'weights_init': 'gaussian',
-            'weights_mean': 0.0,
-            'weights_std': 0.005,
-            'bias_init': 0.0
-        }
+        softmax_config = self.softmax_config
         log.debug("softmax classification layer (model layer 8)...")
         softmax_layer8       = SoftmaxLayer(inputs_hook=(4096, fc_layer7.get_outputs()),
                                             output_size=1000,
@@ -231,6 +243,8 @@ class AlexNet(Model):
                                             config=softmax_config)
         # Add this layer's parameters!
         self.params += softmax_layer8.get_params()
+        # the weights and biases of every fully-connected layer, in the order of fc_sizes
+        self.fc_params = fc_layer6.get_params() + fc_layer7.get_params() + softmax_layer8.get_params()
 
         # finally the softmax output from the whole thing!
         self.output = softmax_layer8.get_outputs()
@@ -244,6 +258,10 @@ class AlexNet(Model):
         train_errors = softmax_layer8_train.errors(self.y)
 
         self.monitors = OrderedDict([('cost', cost), ('errors', errors), ('dropout_errors', train_errors)])
+        # the same monitors on the dropout graph the training cost uses, for the optimizer to fuse into training
+        self.train_monitors = OrderedDict([('cost', self.train_cost),
+                                           ('errors', train_errors),
+                                           ('dropout_errors', train_errors)])
 
         #########################
         # Compile the functions #
@@ -252,9 +270,11 @@ class AlexNet(Model):
         t = time.time()
         log.debug("f_predict...")
         # use the actual argmax from the classification
-        self.f_predict = function(inputs=[self.x], outputs=softmax_layer8.get_argmax_prediction())
+        self.f_predict = function(inputs=[self.x], outputs=softmax_layer8.get_argmax_prediction(),
+                                  name='alexnet_f_predict')
         log.debug("f_monitors")
-        self.f_monitors = function(inputs=[self.x, self.y], outputs=self.monitors.values())
+        self.f_monitors = function(inputs=[self.x, self.y], outputs=self.monitors.values(),
+                                   name='alexnet_f_monitors')
         log.debug("compilation took %s" % make_time_units_string(time.time() - t))
 
     def get_inputs(self):
@@ -341,6 +361,29 @@ class AlexNet(Model):
         names = ', '.join(self.monitors.keys())
         return {names: self.f_monitors}
 
+    def get_monitor_expressions(self):
+        """
+        This returns an ordered dictionary of (monitor_name: theano_expression) for the monitors, so the Optimizer can
+        compute them in the same call as the training cost.
+        ------------------
+
+        :return: OrderedDict of String: theano expression for each monitor variable we care about in the model.
+        :rtype: OrderedDict
+        """
+        return self.monitors
+
+    def get_train_monitor_expressions(self):
+        """
+        The monitors on the dropout graph of the training cost, so training computes them from its own forward pass
+        instead of running the network again without dropout. During training, 'cost' and 'errors' are therefore the
+        dropout cost and errors.
+        ------------------
+
+        :return: OrderedDict of String: theano expression for each monitor variable, on the training graph.
+        :rtype: OrderedDict
+        """
+        return self.train_monitors
+
     def get_params(self):
         """
         This returns the list of theano shared variables that will be trained by the Optimizer.
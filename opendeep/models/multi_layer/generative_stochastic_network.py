@@ -390,7 +390,7 @@ class GSN(Model):
         # compile the monitoring functions for things we want to run on the valid/test sets
         if not hiddens_hook:
             log.debug("monitoring functions...")
-            self.f_monitors = function(inputs=[self.X], outputs=self.monitors.values())
+            self.f_monitors = function(inputs=[self.X], outputs=self.monitors.values(), name='gsn_f_monitors')
 
         log.debug("GSN compiling done. Took %s", make_time_units_string(time.time() - t))
 
@@ -502,6 +502,19 @@ class GSN(Model):
         names = ', '.join(self.monitors.keys())
         return {names: self.f_monitors}
 
+    def get_monitor_expressions(self):
+        """
+        This returns an ordered dictionary of (monitor_name: theano_expression) for the monitors, so the Optimizer can
+        compute them in the same call as the training cost. 'noisy_recon_cost' comes from the noisy walkback chain the
+        training cost is built on, so it reuses the training forward pass; 'recon_cost' is by definition on the
+        noiseless chain, which still has to be computed next to it.
+        ------------------
+
+        :return: OrderedDict of String: theano expression for each monitor variable we care about in the model.
+        :rtype: OrderedDict
+        """
+        return self.monitors
+
     def get_decay_params(self):
         """
         If the model requires any of its internal parameters to decay over time during training, return the list
@@ -698,21 +711,20 @@ class GSN(Model):
         return h_list
 
 
-    def save_params(self, param_file):
+    def param_file_path(self, param_file):
         """
-        This saves the model's parameters to the param_file (pickle file)
+        This returns the full path that save_params() writes the param_file to - inside the output directory from
+        the model config.
         ------------------
 
-        :param param_file: filename of pickled params file
+        :param param_file: filename of the params file
         :type param_file: String
 
-        :return: whether or not successful
-        :rtype: Boolean
+        :return: the full path to the params file
+        :rtype: String
         """
         # save to the output directory from the model config
-        base = self.outdir
-        filepath = os.path.join(base, param_file)
-        super(GSN, self).save_params(filepath)
+        return os.path.realpath(os.path.join(self.outdir, param_file))
 
 
 ###############################################
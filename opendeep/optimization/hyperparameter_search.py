@@ -0,0 +1,339 @@
+'''
+.. module:: hyperparameter_search
+
+A parallel hyperparameter search runner - grid search, random search, or successive halving over the config
+dictionaries the models and optimizers take.
+
+The trials run in a pool of worker processes forked from this one, so they all share the one dataset (a memory-mapped
+dataset is only mapped once) instead of each loading it again. Trials whose configs only differ in the optimizer
+scalars (the learning rate and momentum, which are sharedX values, and their decays) share one model and optimizer -
+its functions are compiled once before the pool starts, and each trial resets the parameters and sets the scalars
+before training. Successive halving trains every trial for a small number of epochs, keeps the best 1/eta of them,
+and continues only those for eta times longer, so losing trials are stopped early.
+
+'Non-stochastic Best Arm Identification and Hyperparameter Optimization'
+Kevin Jamieson, Ameet Talwalkar
+http://arxiv.org/abs/1502.07943
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import itertools
+import math
+import multiprocessing
+import time
+# third party libraries
+import numpy
+# internal references
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.utils.decay import get_decay_function
+import opendeep.data.dataset as datasets
+from opendeep.utils.misc import make_time_units_string, get_shared_values, set_shared_values
+
+log = logging.getLogger(__name__)
+
+# search strategies
+GRID    = 'grid'
+RANDOM  = 'random'
+HALVING = 'halving'
+
+# the optimizer settings a trial can change without compiling new functions
+SCALAR_KEYS = ['learning_rate', 'lr_decay', 'lr_factor', 'momentum', 'momentum_decay', 'momentum_factor']
+
+# the trainers shared with the forked pool workers, by structural config
+_trainers = {}
+
+def grid(space):
+    '''
+    :param space: the values to try for each setting, i.e. {'learning_rate': [.1, .01], 'hidden_size': [500, 1000]}
+    :type space: Dictionary
+
+    :return: every combination of the values
+    :rtype: List(Dictionary)
+    '''
+    keys = sorted(space.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*[space[key] for key in keys])]
+
+def sample(space, n_trials, rng=None):
+    '''
+    Draws random configs. A list of values is sampled uniformly, a (low, high) tuple uniformly in between (on a log
+    scale when both are positive and differ by more than 100x, like learning rates), and a function is called with
+    the rng. A tuple of integers samples integers from low to high inclusive, i.e. (500, 1500) for a layer size.
+
+    :param space: how to sample each setting
+    :type space: Dictionary
+
+    :param n_trials: the number of configs to draw
+    :type n_trials: Integer
+
+    :return: the sampled configs
+    :rtype: List(Dictionary)
+    '''
+    rng = rng or numpy.random.RandomState(123)
+    configs = []
+    for _ in range(n_trials):
+        config = {}
+        for key in sorted(space.keys()):
+            values = space[key]
+            if callable(values):
+                config[key] = values(rng)
+            elif isinstance(values, tuple):
+                low, high = values
+                integer = all(isinstance(bound, (int, long)) and not isinstance(bound, bool) for bound in values)
+                if low > 0 and high > 100 * low:
+                    value = numpy.exp(rng.uniform(numpy.log(low), numpy.log(high)))
+                    config[key] = int(min(max(round(value), low), high)) if integer else float(value)
+                elif integer:
+                    config[key] = int(rng.randint(low, high + 1))
+                else:
+                    config[key] = float(rng.uniform(low, high))
+            else:
+                config[key] = values[rng.randint(len(values))]
+        configs.append(config)
+    return configs
+
+def halving_rungs(n_trials, min_epochs, max_epochs, eta=3):
+    '''
+    :return: the (number of trials, epochs trained by the end of the rung) for each successive halving rung
+    :rtype: List(Tuple)
+    '''
+    rungs = []
+    epochs = min_epochs
+    while True:
+        rungs.append((n_trials, min(epochs, max_epochs)))
+        if epochs >= max_epochs or n_trials <= 1:
+            return rungs
+        n_trials = max(int(math.ceil(n_trials / float(eta))), 1)
+        epochs *= eta
+
+def _structural_key(config):
+    return repr(sorted((key, value) for key, value in config.items() if key not in SCALAR_KEYS))
+
+def _set_scalars(optimizer, config):
+    '''
+    Sets the optimizer's learning rate and momentum from the trial config, and rebuilds their decay functions.
+    '''
+    for name, decay_name, key in [('learning_rate', 'learning_rate_decay', 'lr'),
+                                  ('momentum', 'momentum_decay', 'momentum')]:
+        variable = getattr(optimizer, name)
+        value = config.get(name, optimizer.args.get(name))
+        variable.set_value(numpy.cast[variable.dtype](value))
+        decay = config.get(key + '_decay', optimizer.args.get(key + '_decay'))
+        if hasattr(optimizer, decay_name):
+            delattr(optimizer, decay_name)
+        if decay:
+            setattr(optimizer, decay_name, get_decay_function(decay, variable, value,
+                                                              config.get(key + '_factor',
+                                                                         optimizer.args.get(key + '_factor'))))
+
+def _run_trial(task):
+    '''
+    Runs in a pool worker - trains one trial up to its epochs and measures the objective.
+    '''
+    trial_id, config, state, epochs, objective, seed = task
+    trainer = _trainers[_structural_key(config)]
+    optimizer = trainer['optimizer']
+    new_trial = state is None
+    if new_trial:
+        state = {'epochs': 0, 'history': []}
+    value = state['history'][-1] if len(state['history']) > 0 else None
+    try:
+        if new_trial:
+            # a new trial starts from the same initial parameters as every other trial
+            set_shared_values(optimizer.params, trainer['initial_params'])
+            set_shared_values(optimizer.optimizer_vars, trainer['initial_optimizer_values'])
+            _set_scalars(optimizer, config)
+            # and shuffles from its own seed, so its result doesn't depend on which trials the worker ran before it
+            optimizer.rng = numpy.random.RandomState([seed, trial_id])
+        else:
+            # continue where the trial's last rung stopped
+            _set_scalars(optimizer, config)
+            set_shared_values(optimizer.params, state['params'])
+            set_shared_values(optimizer.optimizer_vars, state['optimizer_values'])
+            for decay, decay_state in zip(optimizer._decay_functions(), state['decay_states']):
+                decay.set_state(decay_state)
+            optimizer.rng = numpy.random.RandomState()
+            optimizer.rng.set_state(state['rng_state'])
+        optimizer._eval_indices = {}
+
+        while state['epochs'] < epochs:
+            # the trial's passes don't go through _perform_one_epoch, so clear its timer here
+            optimizer.epoch_timer.reset()
+            if optimizer.index_batches:
+                train_costs, _ = optimizer._perform_index_pass()
+            else:
+                train_costs, _ = optimizer._perform_train_pass()
+            for decay in optimizer._decay_functions():
+                decay.decay()
+            state['epochs'] += 1
+            if objective is None:
+                value = float(numpy.mean(train_costs))
+            else:
+                value = float(numpy.mean(optimizer._evaluate(datasets.VALID)[objective]))
+            state['history'].append(value)
+            if not numpy.isfinite(value):
+                log.info("Trial %d diverged after %d epochs", trial_id, state['epochs'])
+                break
+    except Exception:
+        log.exception("Trial %d failed", trial_id)
+        value = float('inf')
+    if value is None or not numpy.isfinite(value):
+        value = float('inf')
+
+    state['params'] = get_shared_values(optimizer.params, borrow=False)
+    state['optimizer_values'] = get_shared_values(optimizer.optimizer_vars, borrow=False)
+    state['decay_states'] = [decay.get_state() for decay in optimizer._decay_functions()]
+    state['rng_state'] = optimizer.rng.get_state()
+    return trial_id, value, state
+
+
+class HyperparameterSearch(object):
+    '''
+    Searches hyperparameter configs for a model by training trials in parallel worker processes.
+    '''
+    def __init__(self, build_model, dataset, space, optimizer_class=SGD, config=None, strategy=RANDOM, n_trials=16,
+                 n_workers=None, epochs=10, min_epochs=1, eta=3, objective=None, rng=None):
+        '''
+        :param build_model: called with a trial's config to make the model, i.e. lambda config: GSN(config=config)
+        :type build_model: function
+
+        :param dataset: the dataset every trial trains on (shared by all of the workers)
+        :type dataset: Dataset
+
+        :param space: the values to search for each setting - lists for the grid, or what sample() takes
+        :type space: Dictionary
+
+        :param optimizer_class: the optimizer to train each trial with, given the trial's config
+        :type optimizer_class: class
+
+        :param config: the settings shared by every trial
+        :type config: Dictionary
+
+        :param strategy: GRID, RANDOM, or HALVING (successive halving over random configs)
+        :type strategy: String
+
+        :param n_trials: the number of random configs to try
+        :type n_trials: Integer
+
+        :param n_workers: the number of trials to train at the same time. Defaults to the number of CPUs.
+        :type n_workers: Integer
+
+        :param epochs: the epochs to train each trial for (the most epochs for successive halving)
+        :type epochs: Integer
+
+        :param min_epochs: the epochs every trial trains for before the first successive halving cut
+        :type min_epochs: Integer
+
+        :param eta: successive halving keeps the best 1/eta trials at every rung
+        :type eta: Integer
+
+        :param objective: the name of the VALID monitor to minimize. None minimizes the training cost.
+        :type objective: String
+        '''
+        if strategy not in [GRID, RANDOM, HALVING]:
+            log.error("Search strategy %s not recognized, needs to be one of %s", str(strategy),
+                      str([GRID, RANDOM, HALVING]))
+            raise NotImplementedError("Search strategy %s not recognized" % str(strategy))
+        self.build_model = build_model
+        self.dataset = dataset
+        self.space = space
+        self.optimizer_class = optimizer_class
+        self.config = config or {}
+        self.strategy = strategy
+        self.n_trials = n_trials
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.epochs = epochs
+        self.min_epochs = min_epochs
+        self.eta = eta
+        self.objective = objective
+        self.rng = rng or numpy.random.RandomState(123)
+        self.results = []
+
+    def _build_trainers(self, configs):
+        '''
+        Builds (and compiles) one model and optimizer for every structurally different config.
+        '''
+        _trainers.clear()
+        for config in configs:
+            key = _structural_key(config)
+            if key in _trainers:
+                continue
+            log.info("Building the trainer for %s", key)
+            model = self.build_model(config)
+            optimizer = self.optimizer_class(model=model, dataset=self.dataset, config=config)
+            _trainers[key] = {'optimizer': optimizer,
+                              'initial_params': get_shared_values(optimizer.params, borrow=False),
+                              'initial_optimizer_values': get_shared_values(optimizer.optimizer_vars, borrow=False)}
+        log.info("%d trials share %d compiled trainers", len(configs), len(_trainers))
+
+    def _run_rung(self, trials, epochs, seed):
+        '''
+        Trains the trials up to epochs in the process pool. Each trial's iterator rng is seeded from the seed and the
+        trial id.
+        '''
+        tasks = [(trial['id'], trial['config'], trial['state'], epochs, self.objective, seed) for trial in trials]
+        by_id = dict((trial['id'], trial) for trial in trials)
+        # the pool is forked after the trainers are built, so the workers have them
+        pool = multiprocessing.Pool(min(self.n_workers, len(tasks)))
+        try:
+            for trial_id, value, state in pool.imap_unordered(_run_trial, tasks):
+                by_id[trial_id]['objective'] = value
+                by_id[trial_id]['state'] = state
+                log.info("Trial %d: %s after %d epochs with %s", trial_id, str(value), state['epochs'],
+                         str(by_id[trial_id]['config']))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def run(self):
+        '''
+        Runs the search.
+
+        :return: the trials' configs, objectives, epochs trained, and objective after each epoch, best first
+        :rtype: List(Dictionary)
+        '''
+        t = time.time()
+        if self.strategy == GRID:
+            configs = grid(self.space)
+        else:
+            configs = sample(self.space, self.n_trials, self.rng)
+        configs = [dict(self.config, **config) for config in configs]
+        self._build_trainers(configs)
+        # the trials' rngs are seeded from this and their ids
+        seed = self.rng.randint(2 ** 30)
+
+        trials = [{'id': i, 'config': config, 'state': None, 'objective': float('inf')}
+                  for i, config in enumerate(configs)]
+        if self.strategy == HALVING:
+            rungs = halving_rungs(len(trials), self.min_epochs, self.epochs, self.eta)
+        else:
+            rungs = [(len(trials), self.epochs)]
+        alive = trials
+        for n_trials, epochs in rungs:
+            # keep the best trials from the last rung
+            ranked = sorted(alive, key=lambda trial: trial['objective'])
+            alive = ranked[:n_trials]
+            # the stopped trials don't need their parameters any more
+            for trial in ranked[n_trials:]:
+                for key in ['params', 'optimizer_values']:
+                    trial['state'].pop(key, None)
+            log.info("Training %d trials to %d epochs", len(alive), epochs)
+            self._run_rung(alive, epochs, seed)
+
+        self.results = [{'config': trial['config'],
+                         'objective': trial['objective'],
+                         'epochs': trial['state']['epochs'] if trial['state'] else 0,
+                         'history': trial['state']['history'] if trial['state'] else []}
+                        for trial in sorted(trials, key=lambda trial: trial['objective'])]
+        log.info("Hyperparameter search took %s, best %s with %s", make_time_units_string(time.time() - t),
+                 str(self.results[0]['objective']), str(self.results[0]['config']))
+        return self.results
@@ -14,9 +14,11 @@ __email__ = "opendeep-dev@googlegroups.com"
 # standard libraries
 import logging
 import time
+import cPickle
 # third party libraries
 import numpy
 import numpy.random as random
+import theano.tensor as T
 from theano.compat.python2x import OrderedDict  # use this compatibility OrderedDict
 import theano.compat.six as six
 # internal references
@@ -24,11 +26,19 @@ from opendeep import function, grad, trunc, sharedX
 from opendeep.optimization.optimizer import Optimizer
 from opendeep.utils.decay import get_decay_function
 from opendeep.data.iterators.sequential import SequentialIterator
+from opendeep.data.iterators.prefetch import PrefetchIterator
 import opendeep.data.dataset as datasets
 from opendeep.utils.misc import make_time_units_string, get_shared_values, set_shared_values
+from opendeep.utils.checkpoint import Checkpointer, state_file_path, save_pickle
+from opendeep.utils.param_file import param_names
+from opendeep.utils.timing import PhaseTimer, format_phases, epoch_percentiles
+from opendeep.utils import profiling
 
 log = logging.getLogger(__name__)
 
+# bump whenever the contents of the optimizer state from get_state() change
+_STATE_VERSION = 1
+
 # Default values to use for some training parameters
 _defaults = {"n_epoch": 1000,
              "batch_size": 100,
@@ -43,7 +53,17 @@ _defaults = {"n_epoch": 1000,
              'momentum_decay': 'linear',
              'momentum_factor': 0,
              'nesterov_momentum': True,
-             'flag_para_load': False}
+             'flag_para_load': False,
+             'prefetch_depth': 2,
+             'index_batches': False,
+             'eval_frequency': None,
+             'eval_time_frequency': None,
+             'eval_batch_size': None,
+             'eval_subsample': None,
+             'checkpoint_keep': None,
+             'async_checkpoint': True,
+             'accumulate_steps': 1,
+             'profile': False}
 
 class SGD(Optimizer):
     '''
@@ -53,7 +73,10 @@ class SGD(Optimizer):
     def __init__(self, model, dataset, iterator_class=SequentialIterator, config=None, defaults=_defaults, rng=None,
                  n_epoch=None, batch_size=None, minimum_batch_size=None, save_frequency=None,
                  early_stop_threshold=None, early_stop_length=None, learning_rate=None, lr_decay=None, lr_factor=None,
-                 momentum=None, momentum_decay=None, momentum_factor=None, nesterov_momentum=None, flag_para_load=None):
+                 momentum=None, momentum_decay=None, momentum_factor=None, nesterov_momentum=None, flag_para_load=None,
+                 prefetch_depth=None, index_batches=None, eval_frequency=None, eval_time_frequency=None,
+                 eval_batch_size=None, eval_subsample=None, checkpoint_keep=None, async_checkpoint=None,
+                 accumulate_steps=None, profile=None):
         # superclass init
         super(SGD, self).__init__(config=config, defaults=defaults)
         # config and defaults are now combined in self.args! yay!
@@ -71,6 +94,12 @@ class SGD(Optimizer):
 
         # Number of epochs between saving model parameters
         self.save_frequency = save_frequency or self.args.get('save_frequency')
+        # How many of the most recent checkpoints to keep on disk (None keeps all of them), and whether to write them
+        # on a background thread so training doesn't wait on the disk
+        self.checkpoint_keep  = checkpoint_keep or self.args.get('checkpoint_keep')
+        self.async_checkpoint = async_checkpoint
+        if self.async_checkpoint is None:
+            self.async_checkpoint = self.args.get('async_checkpoint', True)
 
         # Early stopping threshold and patience - by how much does the cost have to improve over a number of epochs
         self.early_stop_threshold = early_stop_threshold or self.args.get('early_stop_threshold')
@@ -88,13 +117,49 @@ class SGD(Optimizer):
 
         # Momentum - smoothing over the parameter changes (see Hinton)
         self.momentum = sharedX(momentum or self.args.get('momentum'), 'momentum')
-        if self.args.get('momentum_decay'):
+        if momentum_decay or self.args.get('momentum_decay'):
             self.momentum_decay = get_decay_function(momentum_decay or self.args.get('momentum_decay'),
                                                      self.momentum,
                                                      self.momentum.get_value(),
                                                      momentum_factor or self.args.get('momentum_factor'))
         self.nesterov_momentum = nesterov_momentum or self.args.get('nesterov_momentum')
 
+        # Parallel data loading - prefetch batches on a background thread while the functions are computing
+        self.flag_para_load = flag_para_load or self.args.get('flag_para_load')
+        self.prefetch_depth = prefetch_depth or self.args.get('prefetch_depth') or 2
+
+        # Index-based minibatches - f_learn takes the batch indices and slices the dataset's shared variables
+        # inside the graph, instead of copying each batch in from the host.
+        self.index_batches = index_batches or self.args.get('index_batches')
+
+        # Evaluation on the valid and test sets - every eval_frequency epochs and/or every eval_time_frequency seconds
+        # (every epoch when neither is given), with its own (usually much larger) batch size, optionally on a fixed
+        # random subsample of eval_subsample examples instead of the whole subset.
+        self.eval_frequency      = eval_frequency or self.args.get('eval_frequency')
+        self.eval_time_frequency = eval_time_frequency or self.args.get('eval_time_frequency')
+        self.eval_batch_size     = eval_batch_size or self.args.get('eval_batch_size') or self.batch_size
+        self.eval_subsample      = eval_subsample or self.args.get('eval_subsample')
+        self._eval_indices = {}
+
+        # Gradient accumulation - f_learn only sums the gradients of each micro-batch into shared buffers, and f_apply
+        # makes one optimizer update with their average every accumulate_steps micro-batches. This gives the update
+        # of a batch accumulate_steps times larger while only holding the activations of one micro-batch.
+        self.accumulate_steps = accumulate_steps or self.args.get('accumulate_steps') or 1
+        self._pending_steps = 0
+
+        # Timing breakdown - the phases of the current epoch (waiting on the iterator, f_learn, the monitors,
+        # evaluation, checkpointing, and decay), and a summary of every finished epoch in epoch_timings.
+        self.epoch_timer = PhaseTimer()
+        self.epoch_timings = []
+
+        # Op-level profiling - compile this optimizer's functions with theano profiling (see opendeep.utils.profiling),
+        # collecting their profiles in self.profiles, and save the aggregated report next to the checkpoints after
+        # training. The model's monitor functions are run as profiled copies. This doesn't turn on profiling for the
+        # rest of the process, so the model's f_predict (which training doesn't call) is only profiled when profiling
+        # is turned on globally before building the model.
+        self.profile = profile or self.args.get('profile')
+        self.profiles = []
+
         # RNG for working on random iterator
         if rng is None:
             random.seed(123)
@@ -110,10 +175,43 @@ class SGD(Optimizer):
         gradient = grad(self.model.get_train_cost(), self.params)
         grads    = OrderedDict(zip(self.params, gradient))
 
+        if self.accumulate_steps > 1:
+            log.debug("Accumulating gradients over %d micro-batches per update", self.accumulate_steps)
+            self.grad_buffers = OrderedDict()
+            for param in self.params:
+                buffer = sharedX(param.get_value() * 0.)
+                if param.name is not None:
+                    buffer.name = 'grad_' + param.name
+                self.grad_buffers[param] = buffer
+            # the number of micro-batches summed into the buffers so far
+            self.accumulated = sharedX(0., 'accumulated')
+            accumulate_updates = OrderedDict((buffer, buffer + grads[param])
+                                             for param, buffer in self.grad_buffers.items())
+            accumulate_updates[self.accumulated] = self.accumulated + 1
+            # the optimizer updates use the average gradient over the accumulated micro-batches
+            grads = OrderedDict((param, buffer / self.accumulated) for param, buffer in self.grad_buffers.items())
+
         # Calculate the optimizer updates each run
         # This is where the magic happens for a lot of sub-implementations of SGD, including AdaDelta!
         # It tells how to update the params each training epoch
         gradient_updates = self.get_updates(grads)
+        # the gradients the updates were built on, so subclasses can swap in other gradients (i.e. all-reduced ones)
+        self.grads = grads
+
+        # The optimizer's own shared variables (momentum velocities, accumulators, ...) - everything the gradient
+        # updates change besides the parameters, plus the learning rate and momentum. These get saved with the
+        # checkpoints so training can resume exactly where it stopped.
+        params = set(self.params)
+        self.optimizer_vars = [var for var in gradient_updates.keys() if var not in params]
+        self.optimizer_vars += [var for var in [self.learning_rate, self.momentum] if var not in self.optimizer_vars]
+
+        if self.accumulate_steps > 1:
+            # applying the update also clears the buffers for the next micro-batches
+            apply_updates = OrderedDict(gradient_updates)
+            for buffer in self.grad_buffers.values():
+                apply_updates[buffer] = T.zeros_like(buffer)
+            apply_updates[self.accumulated] = T.zeros_like(self.accumulated)
+            gradient_updates = accumulate_updates
 
         # Combine the updates from the model also if applicable
         train_updates = model.get_updates()
@@ -122,19 +220,9 @@ class SGD(Optimizer):
         else:
             train_updates = gradient_updates
 
-        # Compile the training function!
-        log.info('Compiling f_learn function for model %s...', str(type(self.model)))
-        t = time.time()
-        self.f_learn = function(inputs  = model.get_inputs(),
-                                updates = train_updates,
-                                outputs = self.model.get_train_cost(),
-                                name    = 'f_learn')
-        log.info('f_learn compilation took %s', make_time_units_string(time.time() - t))
-
-        # Determine if this function is unsupervised or not by looking at the number of inputs to the f_learn function.
+        # Determine if this model is unsupervised or not by looking at the number of inputs to the training function.
         # If there is only one input, it is unsupervised, otherwise, it is supervised.
-        # This workaround was provided by Pascal Lamblin on the theano-users google group
-        num_inputs = len([i for i in self.f_learn.maker.inputs if not i.shared])
+        num_inputs = len(self.model.get_inputs())
         if num_inputs == 1:
             log.debug("Model is unsupervised: 1 input to f_learn.")
             self.unsupervised = True
@@ -149,12 +237,107 @@ class SGD(Optimizer):
             )
             raise AssertionError(
                 "Number of inputs to f_learn on model %s was %s. Needs to be 1 for unsupervised or 2 for supervised." %
-                str(type(self.model)),
-                str(num_inputs)
+                (str(type(self.model)), str(num_inputs))
             )
 
-        # grab the function(s) to use to monitor different model values during training
-        self.monitors = self.model.get_monitors()
+        # The training monitors are fused into f_learn as extra outputs after the cost, so they come out of the same
+        # forward pass instead of re-running the model for every monitor function. The model gives them on its training
+        # graph (i.e. with dropout) for f_learn, and on its evaluation graph for f_monitors.
+        self.monitor_expressions = self.model.get_monitor_expressions()
+        train_monitor_expressions = self.model.get_train_monitor_expressions()
+        if list(train_monitor_expressions.keys()) != list(self.monitor_expressions.keys()):
+            log.error("The training monitors %s of model %s don't match its monitors %s!",
+                      str(list(train_monitor_expressions.keys())), str(type(self.model)),
+                      str(list(self.monitor_expressions.keys())))
+            raise AssertionError("The training monitors of model %s don't match its monitors!" % str(type(self.model)))
+        train_outputs = [self.model.get_train_cost()] + list(train_monitor_expressions.values())
+
+        if self.profile:
+            profiling.start(self.profiles)
+        try:
+            # Compile the training function!
+            self.f_learn = self._compile_learn(train_outputs, train_updates)
+            if self.accumulate_steps > 1:
+                t = time.time()
+                self.f_apply = function(inputs=[], updates=apply_updates, name='f_apply')
+                log.info('f_apply compilation took %s', make_time_units_string(time.time() - t))
+
+            # grab the function(s) to use to monitor different model values on the valid and test sets (and on the train
+            # set if the model doesn't have symbolic monitors to fuse into f_learn)
+            self.monitors = self.model.get_monitors()
+            if self.profile:
+                # the model compiled its monitor functions before profiling started
+                self.monitors = OrderedDict((name, profiling.profiled_copy(monitor, name))
+                                            for name, monitor in self.monitors.items())
+            if len(self.monitor_expressions) > 0:
+                self.train_monitor_names = list(self.monitor_expressions.keys())
+                # one function computing every monitor in the same call for evaluating the valid and test sets
+                log.info('Compiling f_monitors function for model %s...', str(type(self.model)))
+                t = time.time()
+                self.f_monitors = function(inputs  = model.get_inputs(),
+                                           outputs = list(self.monitor_expressions.values()),
+                                           name    = 'f_monitors')
+                log.info('f_monitors compilation took %s', make_time_units_string(time.time() - t))
+            else:
+                self.train_monitor_names = list(self.monitors.keys())
+        finally:
+            if self.profile:
+                profiling.stop(self.profiles)
+
+
+    def _compile_learn(self, outputs, updates):
+        """
+        Compiles the training function f_learn, taking either the batch data or (with index_batches) the batch indices.
+
+        :param outputs: the training cost followed by the fused monitor expressions
+        :type outputs: List(theano expression)
+
+        :param updates: the updates to make on every call
+        :type updates: OrderedDict
+
+        :return: the compiled training function
+        :rtype: theano function
+        """
+        log.info('Compiling f_learn function for model %s...', str(type(self.model)))
+        t = time.time()
+        if self.index_batches:
+            # f_learn takes a vector of batch indices into the TRAIN subset instead of the data itself.
+            self.batch_indices = T.lvector('batch_indices')
+            f_learn = function(inputs  = [self.batch_indices],
+                               updates = updates,
+                               outputs = outputs,
+                               givens  = self._get_index_givens(self.batch_indices, datasets.TRAIN),
+                               name    = 'f_learn')
+        else:
+            f_learn = function(inputs  = self.model.get_inputs(),
+                               updates = updates,
+                               outputs = outputs,
+                               name    = 'f_learn')
+        log.info('f_learn compilation took %s', make_time_units_string(time.time() - t))
+        return f_learn
+
+
+    def _get_index_givens(self, indices, subset):
+        """
+        Creates the givens that replace the model's inputs with slices of the dataset's shared variables, so
+        the training function can be called with batch indices while the data stays in the graph.
+
+        :param indices: symbolic vector of indices into the dataset subset
+        :type indices: theano lvector
+
+        :param subset: the dataset subset to slice (datasets.TRAIN, VALID, or TEST)
+        :type subset: Integer
+
+        :return: givens for theano.function mapping the model inputs to the symbolic dataset batches
+        :rtype: OrderedDict
+        """
+        inputs = self.model.get_inputs()
+        givens = OrderedDict()
+        # cast in the graph in case the dataset stores a different dtype than the model expects (i.e. floatX labels)
+        givens[inputs[0]] = T.cast(self.dataset.getSymbolicDataByIndices(indices, subset), inputs[0].dtype)
+        if not self.unsupervised:
+            givens[inputs[1]] = T.cast(self.dataset.getSymbolicLabelsByIndices(indices, subset), inputs[1].dtype)
+        return givens
 
 
     def get_updates(self, grads):
@@ -198,7 +381,38 @@ class SGD(Optimizer):
         return updates
 
 
-    def train(self, continue_training=False):
+    def _make_iterator(self, subset, batch_size=None):
+        """
+        Creates the iterator over a dataset subset for one pass of training or monitoring. When parallel data loading
+        is turned on (flag_para_load), the batches are prefetched on a background thread.
+
+        :param subset: the dataset subset to iterate over (datasets.TRAIN, VALID, or TEST)
+        :type subset: Integer
+
+        :param batch_size: the batch size to use instead of the optimizer's batch_size
+        :type batch_size: Integer
+
+        :return: the iterator for the subset
+        :rtype: Iterator
+        """
+        iterator = self.iterator(self.dataset, subset, batch_size or self.batch_size, self.minimum_batch_size, self.rng)
+        if self.flag_para_load:
+            iterator = PrefetchIterator(iterator, depth=self.prefetch_depth)
+        return iterator
+
+
+    def train(self, continue_training=False, resume_from=None):
+        """
+        Trains the model.
+
+        :param continue_training: whether to keep the current learning rate and other decayed values instead of
+        resetting them
+        :type continue_training: Boolean
+
+        :param resume_from: a params file from a checkpoint written during an earlier training run - the model
+        parameters and the optimizer state saved next to it are restored, and training picks up from that epoch.
+        :type resume_from: String
+        """
         log.info("-----------TRAINING %s FOR %s EPOCHS (continue_training=%s)-----------",
                  str(type(self.model)), str(self.n_epoch), str(continue_training))
         log.debug("Train dataset size is: %s", self.dataset.getDataShape(datasets.TRAIN))
@@ -218,87 +432,419 @@ class SGD(Optimizer):
                 decay_param.reset()
 
         self.times       = []
+        self.epoch_timings = []
         self.best_cost   = float('inf')
         self.best_params = None
         self.patience    = 0
+        self._eval_indices = {}
+        if resume_from is not None:
+            self.restore_state(resume_from)
 
         start_time = time.time()
+        self._last_eval_time = start_time
+        self.checkpointer = Checkpointer(self.model, keep=self.checkpoint_keep, asynchronous=self.async_checkpoint)
+        # also profile the functions compiled during training (i.e. the model's lazily compiled ones)
+        if self.profile:
+            profiling.start(self.profiles)
+
+        try:
+            while not self.STOP:
+                try:
+                    self.STOP = self._perform_one_epoch()
+                except KeyboardInterrupt:
+                    log.info("STOPPING EARLY FROM KEYBOARDINTERRUPT")
+                    self.STOP = True
+
+            #save params
+            if self.best_params is not None:
+                log.debug("Restoring best model parameters...")
+                set_shared_values(self.params, self.best_params)
+            log.debug("Saving model parameters...")
+            self.checkpointer.save('trained_epoch_'+str(self.epoch_counter)+'.pkl')
+        finally:
+            # finish writing any checkpoints still in flight
+            self.checkpointer.close()
+            if self.profile:
+                profiling.stop(self.profiles)
 
-        while not self.STOP:
+        log.info("------------TOTAL %s TRAIN TIME TOOK %s---------",
+                 str(type(self.model)), make_time_units_string(time.time()-start_time))
+        if self.profile or profiling.is_enabled():
+            # this optimizer's own functions, plus everything profiled since the last profiling.reset() (i.e. the
+            # model's functions) when profiling is on for the whole process
+            profiles = list(self.profiles)
+            if profiling.is_enabled():
+                profiles += [p for p in profiling.get_profiles() if not any(p is own for own in self.profiles)]
             try:
-                self.STOP = self._perform_one_epoch()
-            except KeyboardInterrupt:
-                log.info("STOPPING EARLY FROM KEYBOARDINTERRUPT")
-                self.STOP = True
+                profiling.save_report(self.model.param_file_path('profile'), profiles)
+            except Exception:
+                log.exception("Couldn't save the profile report")
+        if len(self.epoch_timings) > 0:
+            summary = epoch_percentiles(self.epoch_timings)
+            throughput = summary.pop('examples_per_sec')
+            log.info("Examples/sec over %d epochs: median %.1f, min %.1f, max %.1f", len(self.epoch_timings),
+                     throughput['p50'], min(timing['examples_per_sec'] for timing in self.epoch_timings),
+                     throughput['max'])
+            log.info("Time per epoch by phase: %s", format_phases(summary))
+
+
+    def _decay_functions(self):
+        """
+        :return: every decay function the optimizer steps each epoch - its own and the model's
+        :rtype: List(DecayFunction)
+        """
+        decays = [getattr(self, name) for name in ['learning_rate_decay', 'momentum_decay'] if hasattr(self, name)]
+        return decays + list(self.model.get_decay_params())
 
-        #save params
-        if self.best_params is not None:
-            log.debug("Restoring best model parameters...")
-            set_shared_values(self.params, self.best_params)
-        log.debug("Saving model parameters...")
-        self.model.save_params('trained_epoch_'+str(self.epoch_counter)+'.pkl')
 
-        log.info("------------TOTAL %s TRAIN TIME TOOK %s---------",
-                 str(type(self.model)), make_time_units_string(time.time()-start_time))
+    def get_state(self):
+        """
+        Snapshots the complete optimizer state - the optimizer's shared variables (velocities, accumulators, learning
+        rate, momentum), the epoch counter and early stopping progress, the best parameters so far, the iterator rng,
+        and the decay functions. Everything is copied, so it can be written out while training continues.
+
+        :return: the optimizer state
+        :rtype: Dictionary
+        """
+        return {'version': _STATE_VERSION,
+                'optimizer_names': param_names(self.optimizer_vars),
+                'optimizer_values': get_shared_values(self.optimizer_vars, borrow=False),
+                'epoch_counter': self.epoch_counter,
+                'best_cost': self.best_cost,
+                'patience': self.patience,
+                'times': list(self.times),
+                'best_params': self.best_params,
+                'rng_state': self.rng.get_state(),
+                'decay_states': [decay.get_state() for decay in self._decay_functions()],
+                'eval_indices': dict(self._eval_indices)}
+
+
+    def set_state(self, state):
+        """
+        Restores the optimizer state from get_state(). The shapes of the saved optimizer variables are checked before
+        any of them are changed.
+
+        :param state: the optimizer state
+        :type state: Dictionary
+        """
+        if state.get('version') != _STATE_VERSION:
+            log.error("Optimizer state version %s doesn't match %s!", str(state.get('version')), str(_STATE_VERSION))
+            raise AssertionError("Optimizer state version %s doesn't match %s!" %
+                                 (str(state.get('version')), str(_STATE_VERSION)))
+        names = param_names(self.optimizer_vars)
+        if state['optimizer_names'] != names:
+            log.error("Saved optimizer variables %s don't match %s!", str(state['optimizer_names']), str(names))
+            raise AssertionError("Saved optimizer variables %s don't match %s!" % (str(state['optimizer_names']),
+                                                                                   str(names)))
+        for name, var, value in zip(names, self.optimizer_vars, state['optimizer_values']):
+            if var.get_value(borrow=True).shape != numpy.shape(value):
+                log.error("Saved optimizer variable %s has shape %s, expected %s!",
+                          name, str(numpy.shape(value)), str(var.get_value(borrow=True).shape))
+                raise AssertionError("Saved optimizer variable %s has the wrong shape!" % name)
+        decays = self._decay_functions()
+        if len(decays) != len(state['decay_states']):
+            log.error("Saved %d decay functions, the optimizer has %d!", len(state['decay_states']), len(decays))
+            raise AssertionError("Saved %d decay functions, the optimizer has %d!" %
+                                 (len(state['decay_states']), len(decays)))
+
+        # the decays set the learning rate and momentum too, so restore them before the saved variables
+        for decay, decay_state in zip(decays, state['decay_states']):
+            decay.set_state(decay_state)
+        set_shared_values(self.optimizer_vars, state['optimizer_values'])
+        self.epoch_counter = state['epoch_counter']
+        self.best_cost     = state['best_cost']
+        self.patience      = state['patience']
+        self.times         = list(state['times'])
+        self.best_params   = state['best_params']
+        self.rng.set_state(state['rng_state'])
+        self._eval_indices = dict(state['eval_indices'])
+
+
+    def save_state(self, state_file):
+        """
+        Writes the optimizer state from get_state() to state_file (atomically).
+
+        :param state_file: filename of the state file
+        :type state_file: String
+        """
+        save_pickle(self.get_state(), state_file)
+
+
+    def restore_state(self, param_file, state_file=None):
+        """
+        Restores the model parameters from param_file and the optimizer state saved next to it.
+
+        :param param_file: the params file from a checkpoint
+        :type param_file: String
+
+        :param state_file: the optimizer state file. Defaults to the one the checkpointer writes next to param_file.
+        :type state_file: String
+        """
+        param_path = self.model.param_file_path(param_file)
+        state_file = state_file or state_file_path(param_path)
+        log.info("Resuming training from %s and %s", param_path, state_file)
+        with open(state_file, 'rb') as f:
+            state = cPickle.load(f)
+        # the optimizer state is validated before anything changes, so restore it before the model parameters
+        self.set_state(state)
+        if not self.model.load_params(param_path):
+            log.error("Couldn't load the model parameters from %s!", param_path)
+            raise AssertionError("Couldn't load the model parameters from %s!" % param_path)
+
+
+    def _accumulation_step(self):
+        """
+        Counts a micro-batch that f_learn accumulated, and applies the update once accumulate_steps have been summed.
+        """
+        if self.accumulate_steps > 1:
+            self._pending_steps += 1
+            if self._pending_steps >= self.accumulate_steps:
+                self._apply_accumulated()
+
+
+    def _apply_accumulated(self):
+        """
+        Applies the update from any accumulated micro-batches (i.e. the leftovers at the end of an epoch).
+        """
+        if self.accumulate_steps > 1 and self._pending_steps > 0:
+            self.f_apply()
+            self._pending_steps = 0
+
+
+    def _record_train_step(self, outputs, inputs, train_costs, train_monitors):
+        """
+        Stores the cost and monitor values from one f_learn call. When the model has no symbolic monitors to fuse
+        into f_learn, its compiled monitor functions are run on the batch instead.
+
+        :param outputs: the outputs of f_learn - the cost followed by the fused monitor values
+        :type outputs: List
+
+        :param inputs: the batch inputs for the compiled monitor functions (only needed without fused monitors)
+        :type inputs: List
+
+        :param train_costs: the training costs so far
+        :type train_costs: List
+
+        :param train_monitors: the training monitor values so far
+        :type train_monitors: Dictionary
+        """
+        train_costs.append(outputs[0])
+        if len(self.monitor_expressions) > 0:
+            for key, value in zip(self.train_monitor_names, outputs[1:]):
+                train_monitors[key].append(value)
+        else:
+            for key in self.train_monitor_names:
+                monitor_function = self.monitors[key]
+                train_monitors[key].append(monitor_function(*inputs))
+
+
+    def _perform_train_pass(self):
+        """
+        Runs f_learn over every batch of the TRAIN subset, feeding the data from the iterator.
+
+        :return: the training costs and the training monitor values for each batch
+        :rtype: Tuple(List, Dictionary)
+        """
+        train_costs = []
+        train_monitors = {key: [] for key in self.train_monitor_names}
+        timer = self.epoch_timer
+        train_iterator = self._make_iterator(datasets.TRAIN)
+        try:
+            t = time.time()
+            for x, y in train_iterator:
+                # the time between asking for a batch and getting it is time f_learn spent waiting on the data
+                t_data = time.time()
+                inputs = [x] if self.unsupervised else [x, y]
+                outputs = self.f_learn(*inputs)
+                t_learn = time.time()
+                self._record_train_step(outputs, inputs, train_costs, train_monitors)
+                t_monitors = time.time()
+                self._accumulation_step()
+                t_next = time.time()
+                timer.add('data', t_data - t, 'train')
+                timer.add('learn', t_learn - t_data + t_next - t_monitors, 'train')
+                timer.add('monitors', t_monitors - t_learn, 'train')
+                timer.examples += len(x)
+                t = t_next
+            self._apply_accumulated()
+        finally:
+            train_iterator.close()
+        return train_costs, train_monitors
+
+
+    def _perform_index_pass(self):
+        """
+        Runs the index-based f_learn over every batch of the TRAIN subset - only the batch indices go into the
+        function, the data is sliced from the dataset's shared variables inside the graph.
+
+        :return: the training costs and the training monitor values for each batch
+        :rtype: Tuple(List, Dictionary)
+        """
+        train_costs = []
+        train_monitors = {key: [] for key in self.train_monitor_names}
+        # the data never needs to come through the iterator, so use it directly for its batch schedule.
+        timer = self.epoch_timer
+        train_iterator = self.iterator(self.dataset, datasets.TRAIN, self.batch_size, self.minimum_batch_size, self.rng)
+        try:
+            while True:
+                t = time.time()
+                try:
+                    indices = train_iterator.next_indices()
+                except StopIteration:
+                    break
+                if isinstance(indices, slice):
+                    indices = numpy.arange(indices.start, indices.stop, dtype='int64')
+                t_data = time.time()
+                outputs = self.f_learn(numpy.asarray(indices, dtype='int64'))
+                t_learn = time.time()
+                inputs = None
+                # compiled monitor functions still take the data itself
+                if len(self.monitor_expressions) == 0 and len(self.train_monitor_names) > 0:
+                    inputs = [self.dataset.getDataByIndices(indices, datasets.TRAIN)]
+                    if not self.unsupervised:
+                        inputs.append(self.dataset.getLabelsByIndices(indices, datasets.TRAIN))
+                self._record_train_step(outputs, inputs, train_costs, train_monitors)
+                t_monitors = time.time()
+                self._accumulation_step()
+                timer.add('data', t_data - t, 'train')
+                timer.add('learn', t_learn - t_data + time.time() - t_monitors, 'train')
+                timer.add('monitors', t_monitors - t_learn, 'train')
+                timer.examples += len(indices)
+            self._apply_accumulated()
+        finally:
+            train_iterator.close()
+        return train_costs, train_monitors
+
+
+    def _train_schedule(self, num_shards=1, shard_index=0):
+        """
+        Runs the TRAIN iterator's batch schedule for one epoch without loading any data, for trainers that hand the
+        batches out to worker processes.
+
+        :param num_shards: the number of workers splitting the epoch, each iterating over its own shard
+        :type num_shards: Integer
+
+        :param shard_index: the shard to make the schedule for
+        :type shard_index: Integer
+
+        :return: the batch indices for every batch of the epoch (or of the shard), in order
+        :rtype: List
+        """
+        if num_shards > 1:
+            train_iterator = self.iterator(self.dataset, datasets.TRAIN, self.batch_size, self.minimum_batch_size,
+                                           self.rng, num_shards=num_shards, shard_index=shard_index)
+        else:
+            train_iterator = self.iterator(self.dataset, datasets.TRAIN, self.batch_size, self.minimum_batch_size,
+                                           self.rng)
+        schedule = []
+        try:
+            while True:
+                try:
+                    schedule.append(train_iterator.next_indices())
+                except StopIteration:
+                    break
+        finally:
+            train_iterator.close()
+        return schedule
+
+
+    def _should_evaluate(self):
+        """
+        Decides whether to evaluate the valid and test sets this epoch - every eval_frequency epochs (if given), when
+        eval_time_frequency seconds have passed since the last evaluation (if given), and always on the last epoch.
+        Without either option, every epoch is evaluated.
+
+        :return: whether to evaluate this epoch
+        :rtype: Boolean
+        """
+        if len(self.train_monitor_names) == 0:
+            return False
+        if self.STOP:
+            return True
+        if self.eval_frequency is None and self.eval_time_frequency is None:
+            return True
+        if self.eval_frequency is not None and self.epoch_counter % self.eval_frequency == 0:
+            return True
+        if self.eval_time_frequency is not None:
+            if time.time() - self._last_eval_time >= self.eval_time_frequency:
+                return True
+        return False
+
+
+    def _eval_batches(self, subset):
+        """
+        Yields the (x, y) batches to evaluate a subset on - all of it with eval_batch_size batches, or the fixed random
+        subsample of eval_subsample examples (picked once, then reused every time so the numbers are comparable).
+
+        :param subset: the dataset subset to evaluate (datasets.VALID or TEST)
+        :type subset: Integer
+        """
+        if self.eval_subsample:
+            if subset not in self._eval_indices:
+                n_examples = self.dataset.getDataShape(subset)[0]
+                n_samples  = min(self.eval_subsample, n_examples)
+                # sorted, so the gathers read the dataset in order
+                self._eval_indices[subset] = numpy.sort(self.rng.permutation(n_examples)[:n_samples])
+            indices = self._eval_indices[subset]
+            for start in range(0, len(indices), self.eval_batch_size):
+                batch = indices[start:start + self.eval_batch_size]
+                yield (self.dataset.getDataByIndices(batch, subset), self.dataset.getLabelsByIndices(batch, subset))
+        else:
+            iterator = self._make_iterator(subset, self.eval_batch_size)
+            try:
+                for x, y in iterator:
+                    yield x, y
+            finally:
+                iterator.close()
+
+
+    def _evaluate(self, subset):
+        """
+        Runs the monitors over a subset. With symbolic monitors from the model, all of them are computed by the one
+        fused f_monitors call per batch.
+
+        :param subset: the dataset subset to evaluate (datasets.VALID or TEST)
+        :type subset: Integer
+
+        :return: the monitor values averaged over the examples
+        :rtype: Dictionary
+        """
+        values = {key: [] for key in self.train_monitor_names}
+        sizes = []
+        for x, y in self._eval_batches(subset):
+            inputs = [x] if self.unsupervised else [x, y]
+            if len(self.monitor_expressions) > 0:
+                for key, value in zip(self.train_monitor_names, self.f_monitors(*inputs)):
+                    values[key].append(value)
+            else:
+                for key in self.train_monitor_names:
+                    monitor_function = self.monitors[key]
+                    values[key].append(monitor_function(*inputs))
+            sizes.append(len(x))
+        if len(sizes) == 0:
+            return {}
+        # weight by the batch sizes, since the last batch can be smaller
+        return {key: numpy.average(value, axis=0, weights=sizes) for key, value in values.items()}
 
 
     def _perform_one_epoch(self):
             self.epoch_counter += 1
             t = time.time()
             log.info('EPOCH %s', str(self.epoch_counter))
+            timer = self.epoch_timer
+            timer.reset()
 
             #train
-            train_costs = []
-            train_monitors = {key: [] for key in self.monitors.keys()}
-            for x, y in self.iterator(self.dataset, datasets.TRAIN, self.batch_size, self.minimum_batch_size, self.rng):
-                if self.unsupervised:
-                    train_costs.append(self.f_learn(x))
-                    for key in self.monitors.keys():
-                        monitor_function = self.monitors[key]
-                        train_monitors[key].append(monitor_function(x))
+            with timer.phase('train'):
+                if self.index_batches:
+                    train_costs, train_monitors = self._perform_index_pass()
                 else:
-                    train_costs.append(self.f_learn(x, y))
-                    for key in self.monitors.keys():
-                        monitor_function = self.monitors[key]
-                        train_monitors[key].append(monitor_function(x, y))
+                    train_costs, train_monitors = self._perform_train_pass()
             log.info('Train cost: %s', trunc(numpy.mean(train_costs, 0)))
-            if len(self.monitors.keys()) > 0:
+            if len(train_monitors.keys()) > 0:
                 log.info('Train monitors: %s',
                          str({key: numpy.mean(value, 0) for key, value in train_monitors.items()}))
 
-            #valid
-            if self.dataset.hasSubset(datasets.VALID) and len(self.monitors.keys()) > 0:
-                valid_monitors = {key: [] for key in self.monitors.keys()}
-                for x, y in self.iterator(
-                        self.dataset, datasets.VALID, self.batch_size, self.minimum_batch_size, self.rng
-                ):
-                    if self.unsupervised:
-                        for key in self.monitors.keys():
-                            monitor_function = self.monitors[key]
-                            valid_monitors[key].append(monitor_function(x))
-                    else:
-                        for key in self.monitors.keys():
-                            monitor_function = self.monitors[key]
-                            valid_monitors[key].append(monitor_function(x, y))
-                log.info('Valid monitors: %s',
-                         str({key: numpy.mean(value, 0) for key, value in valid_monitors.items()}))
-
-            #test
-            if self.dataset.hasSubset(datasets.TEST) and len(self.monitors.keys()) > 0:
-                test_monitors = {key: [] for key in self.monitors.keys()}
-                for x, y in self.iterator(
-                        self.dataset, datasets.TEST, self.batch_size, self.minimum_batch_size, self.rng
-                ):
-                    if self.unsupervised:
-                        for key in self.monitors.keys():
-                            monitor_function = self.monitors[key]
-                            test_monitors[key].append(monitor_function(x))
-                    else:
-                        for key in self.monitors.keys():
-                            monitor_function = self.monitors[key]
-                            test_monitors[key].append(monitor_function(x, y))
-                log.info('Test monitors: %s', str({key: numpy.mean(value, 0) for key, value in test_monitors.items()}))
-
             # check for early stopping on train costs
             cost = numpy.sum(train_costs)
             if cost < self.best_cost*self.early_stop_threshold:
@@ -313,6 +859,16 @@ class SGD(Optimizer):
                 log.info("Stopping early...")
                 self.STOP = True
 
+            #valid and test
+            if self._should_evaluate():
+                self._last_eval_time = time.time()
+                for subset in [datasets.VALID, datasets.TEST]:
+                    if self.dataset.hasSubset(subset):
+                        with timer.phase(datasets.get_subset_strings(subset)):
+                            monitors = self._evaluate(subset)
+                        if len(monitors.keys()) > 0:
+                            log.info('%s monitors: %s', datasets.get_subset_strings(subset).capitalize(), str(monitors))
+
             timing = time.time() - t
             self.times.append(timing)
 
@@ -321,14 +877,47 @@ class SGD(Optimizer):
             log.info('remaining time: ' +
                      make_time_units_string((self.n_epoch - self.epoch_counter) * numpy.mean(self.times)))
 
+            # ANNEAL!
+            with timer.phase('decay'):
+                if hasattr(self, 'learning_rate_decay'):
+                    self.learning_rate_decay.decay()
+                if hasattr(self, 'momentum_decay'):
+                    self.momentum_decay.decay()
+                for decay_param in self.model.get_decay_params():
+                    decay_param.decay()
+
+            # checkpoint after annealing, so the saved state is exactly the state the next epoch starts from
             if (self.epoch_counter % self.save_frequency) == 0:
                 #save params
-                self.model.save_params('trained_epoch_'+str(self.epoch_counter)+'.pkl')
+                with timer.phase('checkpoint'):
+                    self.checkpointer.save('trained_epoch_'+str(self.epoch_counter)+'.pkl', state=self.get_state())
 
-            # ANNEAL!
-            if hasattr(self, 'learning_rate_decay'):
-                self.learning_rate_decay.decay()
-            if hasattr(self, 'momentum_decay'):
-                self.momentum_decay.decay()
-            for decay_param in self.model.get_decay_params():
-                decay_param.decay()
\ No newline at end of file
+            self._record_epoch_timing(time.time() - t)
+
+            return self.STOP
+
+
+    def _record_epoch_timing(self, seconds):
+        """
+        Summarizes the epoch's phase timings into epoch_timings and logs the breakdown.
+
+        :param seconds: the wall-clock time of the whole epoch
+        :type seconds: Float
+        """
+        timer = self.epoch_timer
+        # every train pass counts the examples it trained on into the timer
+        examples = timer.examples
+        train_seconds = timer.total('train')
+        stall = timer.total('data')
+        timing = {'epoch': self.epoch_counter,
+                  'seconds': seconds,
+                  'examples': examples,
+                  'examples_per_sec': examples / train_seconds if train_seconds > 0 else 0.,
+                  'stall': stall,
+                  'phases': timer.summary()}
+        self.epoch_timings.append(timing)
+
+        log.info('throughput: %.1f examples/sec, stalled %s (%.1f%% of training) waiting on the iterator',
+                 timing['examples_per_sec'], make_time_units_string(stall),
+                 100. * stall / train_seconds if train_seconds > 0 else 0.)
+        log.info('phases: %s', format_phases(timing['phases'], seconds))
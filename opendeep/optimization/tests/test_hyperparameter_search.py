@@ -0,0 +1,109 @@
+'''
+Unit testing for the hyperparameter search
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+# third party libraries
+import numpy
+# internal references
+from opendeep.optimization.hyperparameter_search import grid, sample, halving_rungs, _structural_key, _run_trial, \
+    HyperparameterSearch, GRID, HALVING
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.data.iterators.random import RandomIterator
+from opendeep.tests.helpers import SoftmaxRegression, classification_dataset
+
+
+class TestHyperparameterSearch(unittest.TestCase):
+
+    def testGrid(self):
+        configs = grid({'learning_rate': [.1, .01], 'hidden_size': [500, 1000, 1500]})
+        assert len(configs) == 6
+        assert {'learning_rate': .01, 'hidden_size': 1500} in configs
+
+    def testSample(self):
+        configs = sample({'learning_rate': (1e-4, 1.), 'momentum': (.5, .9), 'hidden_size': [500, 1000]}, 50,
+                         numpy.random.RandomState(1))
+        assert len(configs) == 50
+        for config in configs:
+            assert 1e-4 <= config['learning_rate'] <= 1.
+            assert .5 <= config['momentum'] <= .9
+            assert config['hidden_size'] in [500, 1000]
+
+    def testSampleIntegers(self):
+        configs = sample({'hidden_size': (500, 1500), 'n_units': (2, 1000), 'dropout': (0, .5)}, 50,
+                         numpy.random.RandomState(1))
+        for config in configs:
+            # integer bounds give integers, on a log scale too
+            assert isinstance(config['hidden_size'], int) and 500 <= config['hidden_size'] <= 1500
+            assert isinstance(config['n_units'], int) and 2 <= config['n_units'] <= 1000
+            assert isinstance(config['dropout'], float)
+
+    def testHalvingRungs(self):
+        assert halving_rungs(27, 1, 27, 3) == [(27, 1), (9, 3), (3, 9), (1, 27)]
+        assert halving_rungs(10, 2, 10, 2) == [(10, 2), (5, 4), (3, 8), (2, 10)]
+
+    def testSharedTrainers(self):
+        # only the optimizer scalars differ, so these can share compiled functions
+        assert _structural_key({'learning_rate': .1, 'hidden_size': 500}) == \
+            _structural_key({'learning_rate': .01, 'hidden_size': 500, 'momentum': .9})
+        assert _structural_key({'hidden_size': 500}) != _structural_key({'hidden_size': 1000})
+
+
+class TestSearchRuns(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset = classification_dataset()
+        # a fast learning rate decay, so resuming with the wrong decay would show up
+        self.config = {'batch_size': 10, 'momentum': .9, 'lr_factor': .5}
+
+    def _search(self, space, **kwargs):
+        return HyperparameterSearch(lambda config: SoftmaxRegression(), self.dataset, space, config=self.config,
+                                    n_workers=2, **kwargs).run()
+
+    def testResetAndDivergence(self):
+        # every trial shares one trainer, and the pool workers run several trials each - identical configs only
+        # give identical results if every trial starts from the initial parameters and optimizer state
+        results = self._search({'learning_rate': [.1, .1, .1, 1e8]}, strategy=GRID, epochs=2)
+        finite = [result for result in results if result['config']['learning_rate'] == .1]
+        assert len(finite) == 3
+        for result in finite:
+            assert result['epochs'] == 2
+            assert numpy.allclose(result['history'], finite[0]['history'])
+        # the diverging trial scores inf, and is ranked last
+        assert results[-1]['config']['learning_rate'] == 1e8
+        assert results[-1]['objective'] == float('inf')
+
+    def testHalvingResumes(self):
+        straight = self._search({'learning_rate': [.1]}, strategy=GRID, epochs=3)
+        # trained 1 epoch, then continued from its saved state (params, velocities, and decays) to 3
+        halving = self._search({'learning_rate': [.1]}, strategy=HALVING, n_trials=3, epochs=3, min_epochs=1)
+        assert halving[0]['epochs'] == 3
+        assert [result['epochs'] for result in halving[1:]] == [1, 1]
+        assert numpy.allclose(halving[0]['history'], straight[0]['history'])
+
+    def testTrialSeeds(self):
+        # with shuffled batches, a trial's result only depends on its id - not on the trials run before it
+        search = HyperparameterSearch(lambda config: SoftmaxRegression(), self.dataset, {'learning_rate': [.1, .1]},
+                                      optimizer_class=lambda model, dataset, config: SGD(model, dataset, config=config,
+                                                                                         iterator_class=RandomIterator),
+                                      config=self.config, strategy=GRID)
+        configs = [dict(self.config, learning_rate=.1)] * 2
+        search._build_trainers(configs)
+        task = lambda trial_id: (trial_id, configs[trial_id], None, 2, None, 5)
+        _, alone, _ = _run_trial(task(1))
+        _, first, _ = _run_trial(task(0))
+        _, after, _ = _run_trial(task(1))
+        assert alone == after
+        # and the trials shuffle differently from each other
+        assert first != after
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+'''
+Unit testing for the stochastic gradient descent optimizer
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import shutil
+import tempfile
+import time
+# third party libraries
+import numpy
+# internal references
+from opendeep import function
+import opendeep.data.dataset as datasets
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.data.dataset import MemoryDataset, STORAGE_UINT8, STORAGE_BITS
+from opendeep.data.iterators.sequential import SequentialIterator
+from opendeep.utils.misc import get_shared_values, set_shared_values
+from opendeep.tests.helpers import SoftmaxRegression, MonitoredSoftmaxRegression, classification_dataset
+
+
+class _SlowIterator(object):
+    '''
+    A SequentialIterator that takes 10ms to produce each batch, like one reading from a slow disk.
+    '''
+    def __init__(self, *args, **kwargs):
+        self.iterator = SequentialIterator(*args, **kwargs)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        time.sleep(0.01)
+        return self.iterator.next()
+    __next__ = next
+
+    def close(self):
+        self.iterator.close()
+
+
+class TestSGD(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dataset = classification_dataset()
+
+    def _sgd(self, model, **kwargs):
+        # a fast decay, so an epoch's difference in the learning rate shows up
+        args = dict(batch_size=10, learning_rate=.1, lr_factor=.5, momentum=.9, early_stop_length=100,
+                    rng=numpy.random.RandomState(5))
+        args.update(kwargs)
+        return SGD(model, self.dataset, **args)
+
+    def _assert_same(self, a, b):
+        for x, y in zip(get_shared_values(a.params) + get_shared_values(a.optimizer_vars),
+                        get_shared_values(b.params) + get_shared_values(b.optimizer_vars)):
+            assert numpy.allclose(x, y)
+
+    def testResume(self):
+        # the uninterrupted run checkpoints after its second epoch
+        uninterrupted = self._sgd(SoftmaxRegression(outdir=self.dir), n_epoch=3, save_frequency=2)
+        uninterrupted.train()
+
+        # resuming from that checkpoint makes the same third epoch
+        resumed = self._sgd(SoftmaxRegression(outdir=self.dir, seed=2), n_epoch=3, save_frequency=2)
+        resumed.train(resume_from='trained_epoch_2.pkl')
+        assert resumed.epoch_counter == 3
+        assert numpy.allclose(resumed.learning_rate.get_value(), uninterrupted.learning_rate.get_value())
+        self._assert_same(resumed, uninterrupted)
+
+    def testAccumulation(self):
+        # 100 examples: 2 micro-batches of 10 per update divide evenly, 3 leave a partial group of 1 micro-batch that
+        # _apply_accumulated() flushes at the end of the epoch - like the last smaller batch of size 10
+        for steps in [2, 3]:
+            accumulated = self._sgd(SoftmaxRegression(), accumulate_steps=steps)
+            accumulated._perform_train_pass()
+            assert accumulated._pending_steps == 0
+            batched = self._sgd(SoftmaxRegression(), batch_size=10 * steps)
+            batched._perform_train_pass()
+            self._assert_same(accumulated, batched)
+
+    def testIndexBatches(self):
+        rng = numpy.random.RandomState(3)
+        labels = rng.randint(0, 3, 100)
+        pixels = rng.randint(0, 256, (100, 8)) / 255.
+        bits = (rng.rand(100, 8) > .5).astype('float32')
+        # the data is cast inside the graph from every storage, and 100 examples in batches of 30 end on a batch of 10
+        for dataset in [classification_dataset(),
+                        MemoryDataset(pixels, labels, storage=STORAGE_UINT8, scale=1./255, label_dtype='int64'),
+                        MemoryDataset(bits, labels, storage=STORAGE_BITS, label_dtype='int64')]:
+            self.dataset = dataset
+            fed = self._sgd(MonitoredSoftmaxRegression(), batch_size=30)
+            fed_costs, fed_monitors = fed._perform_train_pass()
+            indexed = self._sgd(MonitoredSoftmaxRegression(), batch_size=30, index_batches=True)
+            calls = []
+            f_learn = indexed.f_learn
+            def recording_learn(indices):
+                calls.append(indices)
+                return f_learn(indices)
+            indexed.f_learn = recording_learn
+            indexed_costs, indexed_monitors = indexed._perform_index_pass()
+
+            # the iterator's slices go in as int64 index vectors
+            assert [list(indices) for indices in calls] == [list(range(start, min(start + 30, 100)))
+                                                            for start in range(0, 100, 30)]
+            assert all(indices.dtype == 'int64' for indices in calls)
+            assert numpy.allclose(indexed_costs, fed_costs)
+            for key in fed_monitors:
+                assert numpy.allclose(indexed_monitors[key], fed_monitors[key])
+            self._assert_same(indexed, fed)
+
+    def testFusedMonitors(self):
+        self.dataset = classification_dataset(n_valid=25)
+        model = MonitoredSoftmaxRegression()
+        fused = self._sgd(model, batch_size=30)
+        assert fused.train_monitor_names == ['error', 'nll']
+        # the model's separately compiled monitors on each batch, right before f_learn updates the parameters
+        separate = {key: [] for key in fused.train_monitor_names}
+        f_learn = fused.f_learn
+        def checking_learn(x, y):
+            for key, monitor_function in model.get_monitors().items():
+                separate[key].append(monitor_function(x, y))
+            return f_learn(x, y)
+        fused.f_learn = checking_learn
+        _, train_monitors = fused._perform_train_pass()
+        for key in fused.train_monitor_names:
+            assert len(train_monitors[key]) == 4
+            assert numpy.allclose(train_monitors[key], separate[key])
+
+        # the one f_monitors call per batch matches running every compiled monitor function
+        unfused = self._sgd(MonitoredSoftmaxRegression(fused=False), batch_size=30, eval_batch_size=10)
+        set_shared_values(unfused.params, get_shared_values(fused.params))
+        fused.eval_batch_size = 10
+        fused_values, unfused_values = fused._evaluate(datasets.VALID), unfused._evaluate(datasets.VALID)
+        assert sorted(fused_values.keys()) == sorted(unfused_values.keys()) == ['error', 'nll']
+        for key in fused_values:
+            assert numpy.allclose(fused_values[key], unfused_values[key])
+
+    def testEpochTimings(self):
+        optimizer = SGD(SoftmaxRegression(outdir=self.dir), self.dataset, iterator_class=_SlowIterator, n_epoch=2,
+                        batch_size=10, early_stop_length=100)
+        optimizer.train()
+        assert [timing['epoch'] for timing in optimizer.epoch_timings] == [1, 2]
+        for timing in optimizer.epoch_timings:
+            phases = timing['phases']
+            assert timing['examples'] == 100
+            assert timing['examples_per_sec'] > 0
+            # the 10 batches waited at least 10ms each on the iterator
+            assert timing['stall'] == phases['data']['total'] >= 0.09
+            assert phases['data']['count'] == 10
+            # the per-batch phases are nested in training, which is part of the epoch
+            for phase in ['data', 'learn', 'monitors']:
+                assert phases[phase]['parent'] == 'train'
+            assert 'parent' not in phases['train']
+            assert sum(phases[phase]['total'] for phase in ['data', 'learn', 'monitors']) <= phases['train']['total']
+            assert phases['train']['total'] <= timing['seconds']
+
+    def _evaluated_epochs(self, optimizer):
+        # trains, recording the epochs the valid set was evaluated on
+        epochs = []
+        evaluate = optimizer._evaluate
+        def recording_evaluate(subset):
+            if subset == datasets.VALID:
+                epochs.append(optimizer.epoch_counter)
+            return evaluate(subset)
+        optimizer._evaluate = recording_evaluate
+        optimizer.train()
+        return epochs
+
+    def testEvalFrequency(self):
+        self.dataset = classification_dataset(n_valid=25)
+        model = MonitoredSoftmaxRegression(outdir=self.dir)
+        # every epoch without a schedule, every 2 epochs (and the last one) with eval_frequency
+        assert self._evaluated_epochs(self._sgd(model, n_epoch=3)) == [1, 2, 3]
+        assert self._evaluated_epochs(self._sgd(model, n_epoch=5, eval_frequency=2)) == [2, 4, 5]
+
+    def testEvalTimeFrequency(self):
+        self.dataset = classification_dataset(n_valid=25)
+        model = MonitoredSoftmaxRegression(outdir=self.dir)
+        # only the time schedule - not every epoch
+        assert self._evaluated_epochs(self._sgd(model, n_epoch=3, eval_time_frequency=3600)) == [3]
+        assert self._evaluated_epochs(self._sgd(model, n_epoch=3, eval_time_frequency=1e-9)) == [1, 2, 3]
+
+    def testEvalBatches(self):
+        self.dataset = classification_dataset(n_valid=25)
+        optimizer = self._sgd(MonitoredSoftmaxRegression(), eval_batch_size=10)
+        assert [len(x) for x, _ in optimizer._eval_batches(datasets.VALID)] == [10, 10, 5]
+
+        # the subsample is picked once and reused, so the evaluations are comparable
+        optimizer = self._sgd(MonitoredSoftmaxRegression(), eval_batch_size=3, eval_subsample=7)
+        first = [x for x, _ in optimizer._eval_batches(datasets.VALID)]
+        indices = optimizer._eval_indices[datasets.VALID]
+        second = [x for x, _ in optimizer._eval_batches(datasets.VALID)]
+        assert [len(x) for x in first] == [3, 3, 1]
+        assert len(set(indices)) == 7 and list(indices) == sorted(indices)
+        assert optimizer._eval_indices[datasets.VALID] is indices
+        for a, b in zip(first, second):
+            assert numpy.array_equal(a, b)
+
+    def testEvalAverage(self):
+        # the uneven last batch is weighted by its size, giving the cost over the whole subset
+        self.dataset = classification_dataset(n_valid=25)
+        model = MonitoredSoftmaxRegression()
+        optimizer = self._sgd(model, eval_batch_size=10)
+        f_cost = function(inputs=model.get_inputs(), outputs=model.get_train_cost())
+        expected = f_cost(self.dataset.getDataByIndices(slice(0, 25), datasets.VALID),
+                          self.dataset.getLabelsByIndices(slice(0, 25), datasets.VALID))
+        assert numpy.allclose(optimizer._evaluate(datasets.VALID)['nll'], expected)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+'''
+Benchmark for synchronous data-parallel training - trains a softmax regression with single-process SGD and with
+DataParallelSGD over 1, 2, and 4 workers at the same global batch size, reporting the throughput of each and checking
+that the trained parameters match single-process SGD.
+'''
+# standard imports
+import time
+# third-party imports
+import numpy
+import theano.tensor as T
+# internal imports
+from opendeep import sharedX
+from opendeep.models.model import Model
+from opendeep.data.dataset import MemoryDataset, TRAIN
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.distributed.data_parallel import DataParallelSGD
+
+
+class SoftmaxRegression(Model):
+    '''
+    A one-layer softmax classifier, just big enough that the gradient computation dominates.
+    '''
+    def __init__(self, n_in, n_out):
+        super(SoftmaxRegression, self).__init__(config={})
+        self.x = T.fmatrix('x')
+        self.y = T.lvector('y')
+        rng = numpy.random.RandomState(1)
+        self.W = sharedX(rng.normal(0, 0.01, (n_in, n_out)), 'W')
+        self.b = sharedX(numpy.zeros(n_out), 'b')
+        self.p = T.nnet.softmax(T.dot(self.x, self.W) + self.b)
+
+    def get_inputs(self):
+        return [self.x, self.y]
+
+    def get_outputs(self):
+        return self.p
+
+    def get_train_cost(self):
+        return -T.mean(T.log(self.p)[T.arange(self.y.shape[0]), self.y])
+
+    def get_params(self):
+        return [self.W, self.b]
+
+
+def train(optimizer_class, dataset, epochs, batch_size, **kwargs):
+    model = SoftmaxRegression(dataset.getDataShape(TRAIN)[1], 10)
+    optimizer = optimizer_class(model, dataset, n_epoch=epochs, batch_size=batch_size, save_frequency=epochs + 1,
+                                early_stop_length=epochs + 1, learning_rate=0.1, **kwargs)
+    t0 = time.time()
+    optimizer.train()
+    return time.time() - t0, model.get_param_values(borrow=False)
+
+
+def main():
+    n_examples = 60000
+    n_features = 784
+    batch_size = 1000
+    epochs = 3
+
+    rng = numpy.random.RandomState(22)
+    dataset = MemoryDataset(rng.rand(n_examples, n_features).astype('float32'),
+                            rng.randint(0, 10, n_examples), label_dtype='int64')
+
+    seconds, expected = train(SGD, dataset, epochs, batch_size)
+    print 'SGD: %.4f seconds (%.1f examples/sec)' % (seconds, epochs * n_examples / seconds)
+    for n_workers in [1, 2, 4]:
+        seconds, values = train(DataParallelSGD, dataset, epochs, batch_size, n_workers=n_workers)
+        difference = max(numpy.max(numpy.abs(value - expect)) for value, expect in zip(values, expected))
+        print 'DataParallelSGD with %d workers: %.4f seconds (%.1f examples/sec), max difference from SGD %g' % \
+              (n_workers, seconds, epochs * n_examples / seconds, difference)
+
+if __name__ == '__main__':
+    main()
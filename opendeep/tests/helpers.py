@@ -0,0 +1,107 @@
+'''
+Small models shared by the unit tests
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import os
+# third party libraries
+import numpy
+import theano.tensor as T
+from theano.compat.python2x import OrderedDict  # use this compatibility OrderedDict
+# internal references
+from opendeep import function, sharedX
+from opendeep.models.model import Model
+from opendeep.data.dataset import MemoryDataset
+
+
+class ParamModel(Model):
+    '''
+    A model that is nothing but a few parameters (the last two share a name).
+    '''
+    def __init__(self, n_hidden=4):
+        super(ParamModel, self).__init__(config={})
+        self.W = sharedX(numpy.random.rand(3, n_hidden), 'W')
+        self.b = sharedX(numpy.random.rand(n_hidden), 'b')
+        self.c = sharedX(numpy.random.rand(3), 'b')
+
+    def get_params(self):
+        return [self.W, self.b, self.c]
+
+
+class SoftmaxRegression(Model):
+    '''
+    A one-layer softmax classifier - the smallest model that trains like a real one. Its files (checkpoints) are kept
+    in outdir.
+    '''
+    def __init__(self, n_in=8, n_out=3, outdir=None, seed=1):
+        super(SoftmaxRegression, self).__init__(config={})
+        self.outdir = outdir
+        self.x = T.matrix('x')
+        self.y = T.lvector('y')
+        rng = numpy.random.RandomState(seed)
+        self.W = sharedX(rng.normal(0, 0.1, (n_in, n_out)), 'W')
+        self.b = sharedX(numpy.zeros(n_out), 'b')
+        self.p = T.nnet.softmax(T.dot(self.x, self.W) + self.b)
+
+    def get_inputs(self):
+        return [self.x, self.y]
+
+    def get_outputs(self):
+        return self.p
+
+    def get_train_cost(self):
+        return -T.mean(T.log(self.p)[T.arange(self.y.shape[0]), self.y])
+
+    def get_params(self):
+        return [self.W, self.b]
+
+    def param_file_path(self, param_file):
+        if self.outdir is None:
+            return super(SoftmaxRegression, self).param_file_path(param_file)
+        return os.path.join(self.outdir, os.path.basename(param_file))
+
+
+class MonitoredSoftmaxRegression(SoftmaxRegression):
+    '''
+    SoftmaxRegression with an error and a cost monitor - as symbolic expressions for the optimizer to fuse into its
+    functions, or (with fused=False) only as compiled functions.
+    '''
+    def __init__(self, fused=True, **kwargs):
+        super(MonitoredSoftmaxRegression, self).__init__(**kwargs)
+        self.fused = fused
+        self.expressions = OrderedDict([('error', T.mean(T.neq(T.argmax(self.p, axis=1), self.y))),
+                                        ('nll', self.get_train_cost())])
+
+    def get_monitor_expressions(self):
+        if not self.fused:
+            return OrderedDict()
+        return self.expressions
+
+    def get_monitors(self):
+        if not hasattr(self, 'monitor_functions'):
+            self.monitor_functions = OrderedDict((name, function(inputs=self.get_inputs(), outputs=expression,
+                                                                 name='f_' + name))
+                                                 for name, expression in self.expressions.items())
+        return self.monitor_functions
+
+
+def classification_dataset(n_examples=100, n_in=8, n_out=3, seed=22, n_valid=0, n_test=0):
+    '''
+    :return: a random in-memory classification dataset for SoftmaxRegression, with n_valid and n_test examples in the
+    valid and test subsets (if any)
+    :rtype: MemoryDataset
+    '''
+    rng = numpy.random.RandomState(seed)
+    subsets = []
+    for n in [n_examples, n_valid, n_test]:
+        if n > 0:
+            subsets += [rng.rand(n, n_in), rng.randint(0, n_out, n)]
+        else:
+            subsets += [None, None]
+    return MemoryDataset(*subsets, label_dtype='int64')
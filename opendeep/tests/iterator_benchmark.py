@@ -0,0 +1,51 @@
+#!/usr/bin/python
+'''
+Benchmark for the sequential dataset iterator - compares the slice-based batches (views of the stored data) against
+building each batch with a list of indices (a fancy-indexing copy per batch).
+'''
+# standard imports
+import time
+# third-party imports
+import numpy
+# internal imports
+from opendeep.data.dataset import MemoryDataset, TRAIN
+from opendeep.data.iterators.sequential import SequentialIterator
+
+
+class ListSequentialIterator(SequentialIterator):
+    '''
+    The sequential iterator as it was before slices - each batch is requested with a list of indices.
+    '''
+    def next_indices(self):
+        batch = super(ListSequentialIterator, self).next_indices()
+        return list(range(batch.start, batch.stop))
+
+
+def run_epochs(iterator_class, dataset, batch_size, epochs):
+    t0 = time.time()
+    total = 0.
+    for _ in xrange(epochs):
+        for x, _ in iterator_class(dataset, TRAIN, batch_size, 1):
+            # touch the batch so views aren't free just because they are lazy
+            total += x[0, 0]
+    return time.time() - t0, total
+
+
+def main():
+    n_examples = 60000
+    n_features = 784
+    batch_size = 100
+    epochs = 10
+
+    rng = numpy.random.RandomState(22)
+    dataset = MemoryDataset(rng.rand(n_examples, n_features).astype('float32'))
+
+    for name, iterator_class in [('list indices (copy)', ListSequentialIterator),
+                                 ('slice (view)', SequentialIterator)]:
+        seconds, _ = run_epochs(iterator_class, dataset, batch_size, epochs)
+        print '%s: %d epochs of %d x %d with batch size %d took %.4f seconds (%.1f batches/sec)' % \
+              (name, epochs, n_examples, n_features, batch_size, seconds,
+               epochs * (n_examples / batch_size) / seconds)
+
+if __name__ == '__main__':
+    main()
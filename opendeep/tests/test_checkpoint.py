@@ -0,0 +1,60 @@
+'''
+Unit testing for the asynchronous checkpoint writer
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import os
+import shutil
+import tempfile
+import cPickle
+# third party libraries
+import numpy
+# internal references
+from opendeep.utils.checkpoint import Checkpointer
+from opendeep.tests.helpers import ParamModel
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.model = ParamModel()
+
+    def _path(self, epoch):
+        return os.path.join(self.dir, 'trained_epoch_%d.pkl' % epoch)
+
+    def testSnapshot(self):
+        checkpointer = Checkpointer(self.model)
+        saved_b = self.model.b.get_value()
+        checkpointer.save(self._path(1))
+        # changing the params right after save() doesn't change what gets written
+        self.model.b.set_value(numpy.ones(4, dtype=self.model.b.dtype))
+        checkpointer.close()
+        with open(self._path(1), 'rb') as f:
+            W, b, _ = cPickle.load(f)
+        assert numpy.array_equal(W, self.model.W.get_value())
+        assert numpy.array_equal(b, saved_b)
+        # nothing is left behind from the temporary file
+        assert os.listdir(self.dir) == ['trained_epoch_1.pkl']
+
+    def testRetention(self):
+        checkpointer = Checkpointer(self.model, keep=2)
+        for epoch in range(1, 6):
+            checkpointer.save(self._path(epoch))
+        checkpointer.close()
+        assert sorted(os.listdir(self.dir)) == ['trained_epoch_4.pkl', 'trained_epoch_5.pkl']
+        self.assertRaises(AssertionError, checkpointer.save, self._path(6))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
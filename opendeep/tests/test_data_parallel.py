@@ -0,0 +1,76 @@
+'''
+Unit testing for the shared memory all-reduce and synchronous data-parallel training
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+# third party libraries
+import numpy
+# internal references
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.distributed.data_parallel import SharedAllReduce, DataParallelSGD
+from opendeep.distributed.processes import run_workers
+from opendeep.utils.misc import get_shared_values
+from opendeep.tests.helpers import SoftmaxRegression, classification_dataset
+
+
+class TestSharedAllReduce(unittest.TestCase):
+
+    def setUp(self):
+        self.n_workers = 3
+        # a size that doesn't split evenly into chunks
+        self.allreduce = SharedAllReduce(self.n_workers, 10, 'float64', timeout=30)
+
+    def _work(self, rank, steps):
+        sums = []
+        for step in range(steps):
+            self.allreduce.row(rank)[...] = numpy.arange(10) * (rank + 1) + step
+            sums.append(self.allreduce.allreduce(rank).copy())
+        return sums
+
+    def testSum(self):
+        results = run_workers(self._work, self.n_workers, args=(4,))
+        for step in range(4):
+            expected = numpy.arange(10) * 6 + step * self.n_workers
+            for sums in results:
+                assert numpy.array_equal(sums[step], expected)
+
+    def testPartialSum(self):
+        def work(rank):
+            self.allreduce.row(rank)[...] = rank + 1
+            return self.allreduce.allreduce(rank, 4).copy()
+        for sums in run_workers(work, self.n_workers):
+            assert numpy.array_equal(sums, [6, 6, 6, 6])
+
+    def testFailure(self):
+        def fail(rank):
+            if rank == 1:
+                raise ValueError("worker failed")
+            return self.allreduce.allreduce(rank)
+        self.assertRaises(RuntimeError, run_workers, fail, self.n_workers)
+
+
+class TestDataParallelSGD(unittest.TestCase):
+
+    def testMatchesSGD(self):
+        dataset = classification_dataset()
+        # batches of 7 split 4/3 between 2 workers (and the last batch of 2 splits 1/1), batches of 10 split 4/3/3
+        for n_workers, batch_size in [(2, 7), (3, 10)]:
+            args = dict(batch_size=batch_size, learning_rate=.1, momentum=.9)
+            single = SGD(SoftmaxRegression(), dataset, **args)
+            single._perform_train_pass()
+            parallel = DataParallelSGD(SoftmaxRegression(), dataset, n_workers=n_workers, timeout=60, **args)
+            parallel._perform_train_pass()
+            for a, b in zip(get_shared_values(single.params) + get_shared_values(single.optimizer_vars),
+                            get_shared_values(parallel.params) + get_shared_values(parallel.optimizer_vars)):
+                assert numpy.allclose(a, b, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()
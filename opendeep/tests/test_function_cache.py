@@ -0,0 +1,93 @@
+'''
+Unit testing for the compiled function cache
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import os
+import shutil
+import tempfile
+# third party libraries
+import numpy
+import theano
+import theano.tensor as T
+# internal references
+from opendeep import function, sharedX
+from opendeep.utils import function_cache
+
+
+class TestFunctionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        function_cache.enable(self.dir)
+        # count the real compilations, to tell a cache hit from compiling again
+        self.compiled = []
+        self._theano_function = theano.function
+        def counting_function(*args, **kwargs):
+            self.compiled.append(kwargs.get('name'))
+            return self._theano_function(*args, **kwargs)
+        theano.function = counting_function
+
+    def _build(self, W):
+        x = T.fmatrix('x')
+        cost = T.sum(T.dot(x, W))
+        return function(inputs=[x], outputs=cost, updates=[(W, W - 0.1*T.grad(cost, W))], name='f_step')
+
+    def testReuse(self):
+        first = sharedX(numpy.ones((3, 2)), 'W')
+        self._build(first)
+        assert len(os.listdir(self.dir)) == 1
+        assert self.compiled == ['f_step']
+
+        # the same graph over a different parameter loads from the cache, but works on the new parameter
+        second = sharedX(numpy.ones((3, 2)), 'W')
+        f = self._build(second)
+        assert len(os.listdir(self.dir)) == 1
+        assert self.compiled == ['f_step']
+        f(numpy.ones((4, 3), dtype='float32'))
+        assert numpy.allclose(second.get_value(), 0.6)
+        assert numpy.allclose(first.get_value(), 1.)
+
+    def testConstants(self):
+        # big constants differing in one element - too big for debugprint to show in full
+        x = T.fvector('x')
+        constants = [numpy.zeros(1000, dtype='float32') for _ in range(2)]
+        constants[1][500] = 1
+        functions = [function(inputs=[x], outputs=x * constant, name='f_scale') for constant in constants]
+        assert self.compiled == ['f_scale', 'f_scale']
+        assert len(os.listdir(self.dir)) == 2
+        ones = numpy.ones(1000, dtype='float32')
+        assert functions[0](ones).sum() == 0
+        assert functions[1](ones).sum() == 1
+
+    def testInputOrder(self):
+        # the same graph and names, with the inputs in the other order
+        a, b = T.fvector('v'), T.fvector('v')
+        forward = function(inputs=[a, b], outputs=a - b, name='f_diff')
+        backward = function(inputs=[b, a], outputs=a - b, name='f_diff')
+        assert self.compiled == ['f_diff', 'f_diff']
+        assert len(os.listdir(self.dir)) == 2
+        ones, twos = numpy.ones(3, dtype='float32'), 2 * numpy.ones(3, dtype='float32')
+        assert numpy.allclose(forward(ones, twos), -1)
+        assert numpy.allclose(backward(ones, twos), 1)
+
+    def testEviction(self):
+        function_cache.enable(self.dir, max_bytes=1)
+        self._build(sharedX(numpy.ones((3, 2)), 'W'))
+        assert len(os.listdir(self.dir)) == 0
+
+    def tearDown(self):
+        theano.function = self._theano_function
+        function_cache.disable()
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
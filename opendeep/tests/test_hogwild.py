@@ -0,0 +1,71 @@
+'''
+Unit testing for Hogwild lock-free multi-process SGD
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+# third party libraries
+import numpy
+# internal references
+from opendeep.distributed.hogwild import HogwildSGD
+from opendeep.utils.misc import get_shared_values
+from opendeep.tests.helpers import SoftmaxRegression, classification_dataset
+
+
+class TestHogwild(unittest.TestCase):
+
+    def setUp(self):
+        self.model = SoftmaxRegression()
+        self.optimizer = HogwildSGD(self.model, classification_dataset(), n_workers=2, batch_size=10,
+                                    learning_rate=.1, momentum=.9, rng=numpy.random.RandomState(5))
+
+    def testTrainPass(self):
+        initial = self.model.get_param_values(borrow=False)
+        train_costs, _ = self.optimizer._perform_train_pass()
+        # each worker trained on its 50 examples
+        assert len(train_costs) == 10
+        # the workers' updates went into the shared buffers, which this process sees
+        for param, shared, before in zip(self.optimizer.params, self.optimizer.shared_values, initial):
+            assert numpy.may_share_memory(param.get_value(borrow=True), shared)
+            assert not numpy.allclose(param.get_value(), before)
+        # every worker kept its own velocities, and this process's copies were left alone
+        states = self.optimizer.worker_states
+        assert all(numpy.any(value != 0) for value in states[0] + states[1])
+        assert not all(numpy.allclose(a, b) for a, b in zip(states[0], states[1]))
+        assert all(numpy.all(value == 0) for value in get_shared_values(self.optimizer.worker_vars))
+
+    def testWorkerState(self):
+        self.optimizer._perform_train_pass()
+        saved = [numpy.array(value) for value in self.optimizer.worker_states[1]]
+        # run worker 1 in this process, recording the optimizer state its first step starts from
+        seen = []
+        f_learn = self.optimizer.f_learn
+        def spy(*args):
+            if len(seen) == 0:
+                seen.append(get_shared_values(self.optimizer.worker_vars))
+            return f_learn(*args)
+        self.optimizer.f_learn = spy
+        self.optimizer._work(1, 7)
+        for before, value in zip(saved, seen[0]):
+            assert numpy.array_equal(before, value)
+        # and its state at the end was saved for the next epoch
+        for state, value in zip(self.optimizer.worker_states[1], get_shared_values(self.optimizer.worker_vars)):
+            assert numpy.array_equal(state, value)
+
+    def testSGDOptions(self):
+        # the options HogwildSGD doesn't name itself still reach SGD
+        optimizer = HogwildSGD(SoftmaxRegression(), classification_dataset(), n_workers=2, batch_size=10,
+                               eval_frequency=3, prefetch_depth=5)
+        assert optimizer.eval_frequency == 3 and optimizer.prefetch_depth == 5
+        self.assertRaises(AssertionError, HogwildSGD, SoftmaxRegression(), classification_dataset(), n_workers=2,
+                          batch_size=10, accumulate_steps=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
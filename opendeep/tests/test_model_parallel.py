@@ -0,0 +1,135 @@
+'''
+Unit testing for hybrid data/model-parallel training
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import os
+import shutil
+import tempfile
+# third party libraries
+import numpy
+import theano.tensor as T
+# internal references
+from opendeep import sharedX
+from opendeep.models.model import Model
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.distributed.model_parallel import HybridParallelSGD
+import opendeep.data.dataset as datasets
+from opendeep.utils.activation import get_activation_function
+from opendeep.utils.misc import get_shared_values
+from opendeep.tests.helpers import classification_dataset
+
+
+class _HybridModel(Model):
+    '''
+    A stand-in for AlexNet(model_parallel_fc=True) - a dense tanh layer instead of the convolutional layers, and small
+    fully-connected layers for the workers to split.
+    '''
+    model_parallel_fc = True
+    flag_datalayer = False
+    fc_sizes = [6, 5, 3]
+    fc_config = {'activation': 'rectifier'}
+
+    def __init__(self, batch_size, outdir):
+        super(_HybridModel, self).__init__(config={})
+        self.batch_size = batch_size
+        self.outdir = outdir
+        self.x = T.matrix('x')
+        rng = numpy.random.RandomState(3)
+        self.W = sharedX(rng.normal(0, .5, (8, 6)), 'W')
+        self.b = sharedX(numpy.zeros(6), 'b')
+        self.conv_output = T.tanh(T.dot(self.x, self.W) + self.b)
+        self.conv_params = [self.W, self.b]
+        self.fc_params = [sharedX(rng.normal(0, .5, (6, 5)), 'W1'), sharedX(numpy.ones(5) * .1, 'b1'),
+                          sharedX(rng.normal(0, .5, (5, 3)), 'W2'), sharedX(numpy.zeros(3), 'b2')]
+
+    def get_params(self):
+        return self.conv_params + self.fc_params
+
+    def param_file_path(self, param_file):
+        return os.path.join(self.outdir, os.path.basename(param_file))
+
+
+class _DenseModel(Model):
+    '''
+    The same network in one process, with every layer whole.
+    '''
+    def __init__(self, values):
+        super(_DenseModel, self).__init__(config={})
+        self.x = T.matrix('x')
+        self.y = T.lvector('y')
+        self.params = [sharedX(value, name) for name, value in zip(['W', 'b', 'W1', 'b1', 'W2', 'b2'], values)]
+        W, b, W1, b1, W2, b2 = self.params
+        hidden = get_activation_function('rectifier')(T.dot(T.tanh(T.dot(self.x, W) + b), W1) + b1)
+        p_y = T.nnet.softmax(T.dot(hidden, W2) + b2)
+        self.cost = -T.mean(T.log(p_y)[T.arange(self.y.shape[0]), self.y])
+
+    def get_inputs(self):
+        return [self.x, self.y]
+
+    def get_train_cost(self):
+        return self.cost
+
+    def get_params(self):
+        return self.params
+
+
+class TestHybridParallelSGD(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dataset = classification_dataset(n_examples=40)
+        self.model = _HybridModel(batch_size=5, outdir=self.dir)
+        self.optimizer = HybridParallelSGD(self.model, self.dataset, n_workers=2, learning_rate=.1, momentum=.9,
+                                           config={'dropout': 0., 'timeout': 60}, rng=numpy.random.RandomState(4))
+
+    def _hybrid_velocities(self):
+        velocities = list(self.optimizer.conv_velocities)
+        for layer in self.optimizer.fc_velocities:
+            velocities += [numpy.hstack([W for W, _ in layer]), numpy.concatenate([b for _, b in layer])]
+        return velocities
+
+    def testMatchesDense(self):
+        dense = _DenseModel(self.model.get_param_values(borrow=False))
+        # the same global batches of 10, with classical momentum
+        sgd = SGD(dense, self.dataset, batch_size=10, minimum_batch_size=10, learning_rate=.1, momentum=.9,
+                  config={'nesterov_momentum': False})
+        sgd._perform_train_pass()
+        self.optimizer._run(datasets.TRAIN)
+
+        # the workers trained the model's own fully-connected parameters
+        for param, value in zip(self.model.fc_params, self.optimizer.fc_values):
+            assert numpy.may_share_memory(param.get_value(borrow=True), value)
+        for a, b in zip(get_shared_values(sgd.params) + get_shared_values(sgd.optimizer_vars[:6]),
+                        self.model.get_param_values(borrow=False) + self._hybrid_velocities()):
+            assert numpy.allclose(a, b, atol=1e-5)
+
+    def testSaveLoad(self):
+        assert self.optimizer.save_params('hybrid.params')
+        saved = self.model.get_param_values(borrow=False)
+        self.optimizer._run(datasets.TRAIN)
+        # the model can load its own parameters from the file by name
+        assert self.model.load_params(os.path.join(self.dir, 'hybrid.params'))
+        self.optimizer._run(datasets.TRAIN)
+        assert self.optimizer.load_params('hybrid.params')
+        for a, b in zip(saved, self.model.get_param_values(borrow=False)):
+            assert numpy.array_equal(a, b)
+        # loading replaced the arrays, so the fully-connected ones were put back in shared memory
+        for param, value in zip(self.model.fc_params, self.optimizer.fc_values):
+            assert numpy.may_share_memory(param.get_value(borrow=True), value)
+        assert all(numpy.all(velocity == 0) for velocity in self._hybrid_velocities())
+        assert not self.optimizer.load_params('missing.params')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+'''
+Unit testing for the .params file format
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import os
+import shutil
+import tempfile
+# third party libraries
+import numpy
+# internal references
+from opendeep.utils.param_file import read_manifest, load_param_file
+from opendeep.tests.helpers import ParamModel
+
+
+class TestParamFile(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'model.params')
+        self.model = ParamModel()
+        assert self.model.save_params(self.path)
+
+    def testManifest(self):
+        params, data_start = read_manifest(self.path)
+        # duplicate names get their position appended
+        assert list(params.keys()) == ['W', 'b_1', 'b_2']
+        assert params['W']['shape'] == [3, 4]
+        assert data_start % 64 == 0
+
+    def testRoundTrip(self):
+        for mmap in [True, False]:
+            other = ParamModel()
+            assert other.load_params(self.path, mmap=mmap)
+            for a, b in zip(self.model.get_param_values(), other.get_param_values()):
+                assert numpy.array_equal(a, b)
+
+    def testLoadByName(self):
+        values = load_param_file(self.path, names=['b_2'])
+        assert list(values.keys()) == ['b_2']
+        other = ParamModel()
+        W = other.W.get_value()
+        assert other.load_params(self.path, names=['b_1'])
+        assert numpy.array_equal(other.b.get_value(), self.model.b.get_value())
+        assert numpy.array_equal(other.W.get_value(), W)
+
+    def testShapeMismatch(self):
+        other = ParamModel(n_hidden=5)
+        W = other.W.get_value()
+        assert not other.load_params(self.path)
+        # nothing was changed
+        assert numpy.array_equal(other.W.get_value(), W)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
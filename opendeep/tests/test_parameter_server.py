@@ -0,0 +1,78 @@
+'''
+Unit testing for the asynchronous parameter server
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import threading
+# third party libraries
+import numpy
+# internal references
+from opendeep.distributed.parameter_server import LocalParameterServer, ParameterClient, ParameterServer
+
+
+class TestParameterServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalParameterServer([numpy.ones((3, 4)), numpy.zeros(4)], names=['W', 'b'], max_staleness=1)
+        self.client = ParameterClient(self.server.address, timeout=30)
+
+    def testPushPull(self):
+        values, versions = self.client.pull()
+        assert numpy.array_equal(values['W'], numpy.ones((3, 4)))
+        assert versions == {'W': 0, 'b': 0}
+
+        staleness = self.client.push({'W': numpy.ones((3, 4)), 'b': numpy.ones(4)}, versions, 0.5)
+        assert staleness == 0
+        values, new_versions = self.client.pull(['W', 'b'])
+        assert numpy.allclose(values['W'], 0.5)
+        assert numpy.allclose(values['b'], -0.5)
+        assert new_versions == {'W': 1, 'b': 1}
+
+    def testStaleness(self):
+        _, versions = self.client.pull()
+        # two other pushes happen after the pull
+        self.client.push({'b': numpy.ones(4)}, versions, 1.)
+        self.client.push({'b': numpy.ones(4)}, versions, 1.)
+        # so this one is too stale and gets dropped
+        assert self.client.push({'b': numpy.ones(4)}, versions, 1.) == 2
+        values, _ = self.client.pull(['b'])
+        assert numpy.allclose(values['b'], -2.)
+        stats = self.client.stats()
+        assert stats['pushes'] == 3 and stats['dropped'] == 1 and stats['max_staleness'] == 2
+
+    def testConcurrentPushes(self):
+        server = ParameterServer([numpy.zeros(1000)], names=['b'], max_staleness=0)
+        try:
+            _, versions = server.pull()
+            stalenesses = []
+            start = threading.Event()
+            def push():
+                start.wait()
+                stalenesses.append(server.push({'b': numpy.ones(1000)}, versions, 1.))
+            threads = [threading.Thread(target=push) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+            # only one of the pushes from the same versions is fresh enough to apply
+            assert sorted(stalenesses) == [0] + [1] * 7
+            values, versions = server.pull()
+            assert versions['b'] == 1 and numpy.allclose(values['b'], -1.)
+        finally:
+            server._server.server_close()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
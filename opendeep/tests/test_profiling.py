@@ -0,0 +1,108 @@
+'''
+Unit testing for the op-level profiling report
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import os
+import json
+import shutil
+import tempfile
+# third party libraries
+import numpy
+import theano.tensor as T
+# internal references
+from opendeep import function, sharedX
+from opendeep.utils import profiling
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.tests.helpers import SoftmaxRegression, MonitoredSoftmaxRegression, classification_dataset
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        profiling.reset()
+        profiling.enable()
+
+    def testReport(self):
+        x = T.matrix('x')
+        W = sharedX(numpy.ones((5, 3)), 'W')
+        f = function(inputs=[x], outputs=T.tanh(T.dot(x, W)), name='f_profiled')
+        for _ in range(4):
+            f(numpy.ones((2, 5), dtype=W.dtype))
+
+        report = profiling.report()
+        assert [function['function'] for function in report['functions']] == ['f_profiled']
+        assert report['functions'][0]['calls'] == 4
+        assert len(report['ops']) > 0
+        # every op ran once per call, and the shares add up
+        assert all(op['calls'] == 4 * op['nodes'] for op in report['ops'])
+        assert abs(sum(op['time_fraction'] for op in report['ops']) - 1.) < 1e-6 or report['op_time'] == 0
+
+        path = os.path.join(self.directory, 'profile')
+        profiling.save_report(path)
+        with open(path + '.json') as f:
+            assert json.load(f)['functions'][0]['function'] == 'f_profiled'
+        with open(path + '.txt') as f:
+            assert 'f_profiled' in f.read()
+
+    def testDisabled(self):
+        profiling.disable()
+        v = T.vector('v')
+        function(inputs=[v], outputs=v * 2, name='f_plain')
+        assert len(profiling.report()['functions']) == 0
+
+    def testScoped(self):
+        profiling.disable()
+        v = T.vector('v')
+        with profiling.profiled() as profiles:
+            assert profiling.is_active() and not profiling.is_enabled()
+            function(inputs=[v], outputs=v * 2, name='f_scoped')
+        function(inputs=[v], outputs=v * 3, name='f_after')
+        # only the function compiled inside the scope was profiled, and only into the scope's own list
+        assert [profile.message for profile in profiles] == ['f_scoped']
+        assert not profiling.is_active()
+        assert len(profiling.get_profiles()) == 0
+
+    def testOptimizer(self):
+        profiling.disable()
+        v = T.vector('v')
+        function(inputs=[v], outputs=v * 2, name='f_before')
+        optimizer = SGD(SoftmaxRegression(outdir=self.directory), classification_dataset(), n_epoch=1, batch_size=10,
+                        early_stop_length=100, profile=True)
+        optimizer.train()
+        # training leaves the switch the way it was, and the report only has the optimizer's functions
+        assert not profiling.is_active()
+        assert 'f_learn' in [profile.message for profile in optimizer.profiles]
+        with open(os.path.join(self.directory, 'profile.json')) as f:
+            names = [function['function'] for function in json.load(f)['functions']]
+        assert 'f_learn' in names and 'f_before' not in names
+
+    def testModelMonitors(self):
+        profiling.disable()
+        model = MonitoredSoftmaxRegression(fused=False, outdir=self.directory)
+        # the model compiles its monitor functions before the optimizer starts profiling
+        before = model.get_monitors()
+        optimizer = SGD(model, classification_dataset(n_valid=20), n_epoch=1, batch_size=10, early_stop_length=100,
+                        profile=True)
+        for name in ['error', 'nll']:
+            assert optimizer.monitors[name] is not before[name]
+            assert optimizer.monitors[name].profile in optimizer.profiles
+        optimizer.train()
+        assert all(optimizer.monitors[name].profile.fct_callcount > 0 for name in ['error', 'nll'])
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.reset()
+        shutil.rmtree(self.directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+'''
+Unit testing for the epoch phase timers
+'''
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import unittest
+import time
+# internal references
+from opendeep.utils.timing import PhaseTimer, phase_stats, format_phases, epoch_percentiles
+
+
+class TestTiming(unittest.TestCase):
+
+    def testPhaseStats(self):
+        stats = phase_stats([float(i) for i in range(1, 101)])
+        assert stats['count'] == 100
+        assert stats['total'] == 5050.
+        assert stats['max'] == 100.
+        assert abs(stats['p50'] - 50.5) < 1e-9
+        assert stats['p90'] < stats['p99'] <= stats['max']
+        assert phase_stats([])['total'] == 0.
+
+    def testPhaseTimer(self):
+        timer = PhaseTimer()
+        for _ in range(3):
+            timer.add('data', 0.5)
+            timer.add('learn', 1.)
+        with timer.phase('checkpoint'):
+            time.sleep(0.01)
+        timer.examples += 30
+        summary = timer.summary()
+        # phases keep the order they first happened in
+        assert list(summary.keys()) == ['data', 'learn', 'checkpoint']
+        assert summary['data']['count'] == 3 and timer.total('data') == 1.5
+        assert timer.total('checkpoint') >= 0.01
+        assert timer.total('missing') == 0.
+        assert 'learn' in format_phases(summary, total=5.)
+
+        timer.reset()
+        assert timer.examples == 0 and len(timer.summary()) == 0
+
+    def testNestedPhases(self):
+        timer = PhaseTimer()
+        with timer.phase('train'):
+            timer.add('data', 0.25, 'train')
+        timer.add('checkpoint', 1.)
+        summary = timer.summary()
+        assert summary['data']['parent'] == 'train' and 'parent' not in summary['train']
+        train = summary['train']['total']
+        # top-level phases are a share of the whole, nested ones a share of their parent
+        text = format_phases(summary, total=2.)
+        assert '(50.0%)' in text
+        assert '(%.1f%% of train)' % (100. * .25 / train) in text
+        assert epoch_percentiles([{'examples_per_sec': 1., 'phases': summary}])['data']['parent'] == 'train'
+
+    def testEpochPercentiles(self):
+        timings = [{'examples_per_sec': float(n), 'phases': {'train': phase_stats([float(n)])}} for n in [1, 2, 3]]
+        summary = epoch_percentiles(timings)
+        assert summary['train']['p50'] == 2.
+        assert summary['examples_per_sec']['max'] == 3.
+
+
+if __name__ == '__main__':
+    unittest.main()
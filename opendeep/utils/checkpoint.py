@@ -0,0 +1,168 @@
+"""
+.. module:: checkpoint
+
+An asynchronous checkpoint writer for model parameters. The parameter values are snapshotted (copied out of the
+shared variables) on the training thread, which is fast, and written to disk on a background thread so training
+doesn't stall on pickling and disk I/O. Every file is written to a temporary name and renamed into place, so a crash
+in the middle of a write never leaves a corrupt checkpoint behind.
+"""
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import os
+import threading
+import Queue
+import time
+import cPickle
+# internal imports
+from opendeep.utils.misc import make_time_units_string
+
+log = logging.getLogger(__name__)
+
+# tells the writer thread to finish
+_STOP = object()
+
+def state_file_path(param_path):
+    """
+    :return: the path of the optimizer state file saved next to a checkpoint's params file
+    :rtype: String
+    """
+    return os.path.splitext(param_path)[0] + '.state.pkl'
+
+def save_pickle(obj, path):
+    """
+    Pickles obj to a temporary file and renames it into place, so the file at path is always complete.
+    """
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            cPickle.dump(obj, f, protocol=cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class Checkpointer(object):
+    """
+    Saves snapshots of a model's parameters through model.save_params() - on a background thread when asynchronous -
+    and keeps only the most recent checkpoints on disk if a retention limit is given.
+    """
+    def __init__(self, model, keep=None, asynchronous=True, max_pending=1):
+        """
+        :param model: the model whose parameters to checkpoint
+        :type model: Model
+
+        :param keep: the number of most recent checkpoint files to keep on disk (older ones are deleted). None keeps
+        every checkpoint.
+        :type keep: Integer
+
+        :param asynchronous: whether to write the checkpoints on a background thread
+        :type asynchronous: Boolean
+
+        :param max_pending: the number of snapshots that can wait for the writer before save() blocks - this bounds
+        the extra memory used by snapshots when the disk is slower than the checkpoint frequency.
+        :type max_pending: Integer
+        """
+        self.model = model
+        self.keep = keep
+        self.asynchronous = asynchronous
+        # the checkpoint files written so far, oldest first
+        self.written = []
+        self.failures = 0
+        self._closed = False
+        if self.asynchronous:
+            self._queue = Queue.Queue(maxsize=max_pending)
+            self._thread = threading.Thread(target=self._run, name='opendeep_checkpointer')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def save(self, param_file, state=None):
+        """
+        Snapshots the model's current parameter values and writes them to param_file. When asynchronous, this only
+        blocks if max_pending earlier snapshots are still waiting to be written.
+
+        :param param_file: filename of the params file (passed to model.save_params())
+        :type param_file: String
+
+        :param state: the optimizer state to pickle next to the params file (see state_file_path()). It should
+        already be a snapshot - the checkpointer doesn't copy it.
+        :type state: Dictionary
+        """
+        if self._closed:
+            log.error("Checkpointer is closed, can't save %s!", str(param_file))
+            raise AssertionError("Checkpointer is closed, can't save %s!" % str(param_file))
+        # copy the values out of the shared variables, so training can keep updating them while this is written
+        param_values = self.model.get_param_values(borrow=False)
+        if self.asynchronous:
+            self._queue.put((param_file, param_values, state))
+        else:
+            self._write(param_file, param_values, state)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._write(*item)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, param_file, param_values, state=None):
+        t = time.time()
+        path = self.model.param_file_path(param_file)
+        try:
+            success = self.model.save_params(param_file, param_values=param_values)
+            if success and state is not None:
+                save_pickle(state, state_file_path(path))
+        except Exception:
+            log.exception("Couldn't write the checkpoint %s!", str(param_file))
+            success = False
+        if not success:
+            self.failures += 1
+            return
+        log.debug("Checkpoint %s took %s to write", str(param_file), make_time_units_string(time.time() - t))
+        self._prune(path)
+
+    def _prune(self, path):
+        """
+        Records the newly written checkpoint and deletes the oldest ones beyond the retention limit.
+        """
+        if path in self.written:
+            self.written.remove(path)
+        self.written.append(path)
+        if self.keep is None:
+            return
+        while len(self.written) > max(self.keep, 1):
+            old_path = self.written.pop(0)
+            try:
+                os.remove(old_path)
+                if os.path.exists(state_file_path(old_path)):
+                    os.remove(state_file_path(old_path))
+                log.debug("Removed old checkpoint %s", old_path)
+            except OSError:
+                log.exception("Couldn't remove the old checkpoint %s", old_path)
+
+    def wait(self):
+        """
+        Blocks until every snapshot so far has been written.
+        """
+        if self.asynchronous and not self._closed:
+            self._queue.join()
+
+    def close(self):
+        """
+        Writes any pending snapshots and stops the background thread.
+        """
+        if self._closed:
+            return
+        if self.asynchronous:
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._closed = True
@@ -66,6 +66,24 @@ class DecayFunction(object):
         """
         self.param.set_value(self.initial)
 
+    def get_state(self):
+        """
+        Returns the current state of the decay (for checkpointing), so it can be resumed later with set_state().
+
+        :return: the decay state
+        :rtype: Dictionary
+        """
+        return {'value': self.param.get_value()}
+
+    def set_state(self, state):
+        """
+        Restores the decay to a state returned by get_state().
+
+        :param state: the decay state
+        :type state: Dictionary
+        """
+        self.param.set_value(state['value'])
+
     def simulate(self, initial, reduction_factor, epoch):
         """
         This will take an initial value for a hypothetical variable, the reduction factor appropriate to the
@@ -144,6 +162,15 @@ class Montreal(DecayFunction):
         self.param.set_value(cast32(new_value))
         self.epoch += 1
 
+    def get_state(self):
+        state = super(self.__class__, self).get_state()
+        state['epoch'] = self.epoch
+        return state
+
+    def set_state(self, state):
+        super(self.__class__, self).set_state(state)
+        self.epoch = state['epoch']
+
     def simulate(self, initial, reduction_factor, epoch):
         new_value = initial / (1 + reduction_factor*epoch)
         return new_value
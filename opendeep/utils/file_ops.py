@@ -14,6 +14,7 @@ __email__ = "opendeep-dev@googlegroups.com"
 # standard imports
 import os
 import errno
+import hashlib
 import urllib
 import zipfile
 import tarfile
@@ -28,7 +29,9 @@ GZ        = 2
 PKL       = 3
 TAR       = 4
 NPY       = 5
-UNKNOWN   = 6
+HDF5      = 6
+PARAMS    = 7
+UNKNOWN   = 8
 
 def get_filetype_string(filetype):
     if filetype is DIRECTORY:
@@ -43,6 +46,10 @@ def get_filetype_string(filetype):
         return 'TAR'
     elif filetype is NPY:
         return 'NPY'
+    elif filetype is HDF5:
+        return 'HDF5'
+    elif filetype is PARAMS:
+        return 'PARAMS'
     elif filetype is UNKNOWN:
         return 'UNKNOWN'
     else:
@@ -110,11 +117,34 @@ def download_file(url, destination):
         return False
 
 
+def file_fingerprint(file_path, *options):
+    """
+    Makes a short fingerprint of a file and any extra options, to key converted caches of that file. The fingerprint
+    uses the file's path, size, and modification time (not its contents), so it is cheap even for huge files.
+
+    :param file_path: the filesystem path to the file
+    :type file_path: String
+
+    :param options: any extra values (like processing options) that should change the fingerprint
+    :type options: objects with a stable str() representation
+
+    :return: hex digest fingerprint, or None if the file doesn't exist
+    :rtype: String or None
+    """
+    file_path = os.path.realpath(file_path)
+    if not os.path.exists(file_path):
+        log.debug('File %s doesn\'t exist!', file_path)
+        return None
+    stat = os.stat(file_path)
+    key = [file_path, str(stat.st_size), str(int(stat.st_mtime))] + [str(option) for option in options]
+    return hashlib.md5('|'.join(key)).hexdigest()[:16]
+
+
 def get_file_type(file_path):
     """
     Given a filename, try to determine the type of file from the extension into one of the categories defined as
     global variables above.
-    Currently, can be .zip, .gz, .tar, .pkl, .p, or .pickle.
+    Currently, can be .zip, .gz, .tar, .pkl, .p, .pickle, .npy, .h5, .hdf5, .hdf, or .params.
 
     :param file_path: the filesystem path to the file in question
     :type file_path: String
@@ -141,6 +171,10 @@ def get_file_type(file_path):
                 return PKL
             elif extension == '.npy':
                 return NPY
+            elif extension == '.h5' or extension == '.hdf5' or extension == '.hdf':
+                return HDF5
+            elif extension == '.params':
+                return PARAMS
             else:
                 log.warning('Didn\'t recognize file extension %s for file %s', extension, file_path)
                 return UNKNOWN
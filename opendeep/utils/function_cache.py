@@ -0,0 +1,266 @@
+"""
+.. module:: function_cache
+
+An on-disk cache of compiled theano functions, so restarting a process doesn't have to run theano's graph
+optimization again (which can take minutes for big graphs like the GSN with walkbacks).
+
+Entries are pickled theano functions keyed by a hash of the symbolic graph (the inputs, outputs, updates, and givens),
+the data of its constants, where each input and shared variable sits in the graph, the types of the shared variables, the compile arguments, and the theano flags and version. The shared variables in
+a pickled function are swapped for tiny placeholders before it is written, and swapped for the current graph's shared
+variables (the model parameters) when it is loaded, so entries stay small and the loaded function works on the live
+parameters. The cache directory is bounded in size, evicting the least recently used entries.
+
+The cache is off by default. Turn it on with the OPENDEEP_FUNCTION_CACHE environment variable (set to the cache
+directory) or by calling enable(). opendeep.function() then uses it transparently. It needs theano 0.8 or newer
+(Function.copy with swap, and Function.get_shared) - with older versions functions are always compiled normally.
+Loaded entries skip the graph optimization under theano's default reoptimize_unpickled_function=False; the flag is
+left as the user set it.
+"""
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import os
+import cPickle
+import hashlib
+import inspect
+import time
+from StringIO import StringIO
+# third party libraries
+import numpy
+import theano
+from theano.compile.sharedvalue import SharedVariable
+from theano.compile.function_module import Function
+from theano.gof import graph
+# internal imports
+from opendeep.utils import file_ops
+from opendeep.utils.misc import make_time_units_string
+
+log = logging.getLogger(__name__)
+
+# bump whenever the format of the cache entries changes
+_CACHE_VERSION = 1
+# theano flags that change the compiled function
+_FLAGS = ['floatX', 'device', 'mode', 'optimizer', 'optimizer_including', 'optimizer_excluding', 'linker',
+          'cxx', 'openmp', 'cast_policy', 'warn_float64']
+
+_settings = {'directory': None,
+             'max_bytes': int(os.environ.get('OPENDEEP_FUNCTION_CACHE_BYTES', 2*1024**3))}
+
+def enable(directory=None, max_bytes=None):
+    """
+    Turns on the compiled function cache.
+
+    :param directory: the directory to keep the cached functions in. Defaults to ~/.opendeep/function_cache.
+    :type directory: String
+
+    :param max_bytes: the size the cache directory is kept under, by evicting the least recently used functions
+    :type max_bytes: Integer
+    """
+    directory = directory or os.path.join(os.path.expanduser('~'), '.opendeep', 'function_cache')
+    file_ops.mkdir_p(directory)
+    _settings['directory'] = os.path.realpath(directory)
+    if max_bytes is not None:
+        _settings['max_bytes'] = max_bytes
+
+def disable():
+    """
+    Turns off the compiled function cache.
+    """
+    _settings['directory'] = None
+
+def is_enabled():
+    return _settings['directory'] is not None
+
+def is_supported():
+    """
+    :return: whether this theano can swap the shared variables of a compiled function (Function.copy with swap, and
+    Function.get_shared - theano 0.8 or newer), which loading a cached function needs
+    :rtype: Boolean
+    """
+    if not hasattr(Function, 'get_shared') or not hasattr(Function, 'copy'):
+        return False
+    try:
+        return 'swap' in inspect.getargspec(Function.copy).args
+    except TypeError:
+        return False
+
+def _as_list(variables):
+    if variables is None:
+        return []
+    if isinstance(variables, (list, tuple)):
+        return list(variables)
+    return [variables]
+
+def _pairs(mapping):
+    if mapping is None:
+        return []
+    if hasattr(mapping, 'items'):
+        return list(mapping.items())
+    return list(mapping)
+
+def _graph_shared(inputs, outputs, updates, givens):
+    """
+    :return: the shared variables in the graph, in a deterministic traversal order
+    :rtype: List(SharedVariable)
+    """
+    roots = _as_list(outputs) + [value for _, value in updates] + [key for key, _ in updates] + \
+        [value for _, value in givens]
+    shared = []
+    for variable in graph.inputs([root for root in roots if isinstance(root, theano.Variable)]):
+        if isinstance(variable, SharedVariable) and variable not in shared:
+            shared.append(variable)
+    return shared
+
+def _constant_data(constant):
+    """
+    :return: the dtype, shape, and hash of the constant's data - debugprint truncates big constants, so the graph
+    printout alone can't tell them apart
+    :rtype: Tuple
+    """
+    data = constant.data
+    try:
+        array = numpy.ascontiguousarray(data)
+    except Exception:
+        return repr(data)
+    if array.dtype == object:
+        return repr(data)
+    return str(array.dtype), array.shape, hashlib.sha1(array.tobytes()).hexdigest()
+
+def _key(inputs, outputs, updates, givens, shared, kwargs):
+    """
+    :return: the hash of everything that goes into compiling the function
+    :rtype: String
+    """
+    out = StringIO()
+    roots = [root for root in _as_list(outputs) + [value for _, value in updates] + [value for _, value in givens]
+             if isinstance(root, theano.Variable)]
+    if len(roots) > 0:
+        theano.printing.debugprint(roots, file=out, ids='CHAR', print_type=True)
+    key = hashlib.sha1(out.getvalue())
+    # the leaves of the graph in traversal order - the same for the same graph structure
+    leaves = graph.inputs(roots)
+    key.update(repr([_constant_data(variable) for variable in leaves if isinstance(variable, graph.Constant)]))
+    # which leaf each input is (debugprint only shows the structure and the names), so graphs that only differ in
+    # the order of their inputs get different entries
+    input_variables = [getattr(i, 'variable', i) for i in _as_list(inputs)]
+    key.update(repr([leaves.index(i) if i in leaves else None for i in input_variables]))
+    key.update(repr([leaves.index(v) if v in leaves else None for v in shared]))
+    key.update(repr([(getattr(i, 'name', None), str(getattr(i, 'type', i))) for i in _as_list(inputs)]))
+    key.update(repr([(shared.index(k) if k in shared else None, str(k.type)) for k, _ in updates]))
+    key.update(repr([(str(k.type), getattr(k, 'name', None)) for k, _ in givens]))
+    key.update(repr([(v.name, str(v.type), numpy.shape(v.get_value(borrow=True))) for v in shared]))
+    key.update(repr(sorted(kwargs.items())))
+    key.update(repr([(flag, str(getattr(theano.config, flag, None))) for flag in _FLAGS]))
+    key.update(repr((theano.__version__, _CACHE_VERSION)))
+    return key.hexdigest()
+
+def _placeholder(variable):
+    """
+    :return: a tiny shared variable with the same type as the given one, to stand in for it in a pickled function
+    """
+    value = variable.get_value(borrow=True)
+    shape = tuple(1 for _ in numpy.shape(value))
+    return theano.shared(numpy.zeros(shape, dtype=variable.dtype), name=variable.name,
+                         broadcastable=variable.broadcastable)
+
+def compile_function(inputs, outputs=None, updates=None, givens=None, **kwargs):
+    """
+    Compiles a theano function like theano.function, loading it from the cache when the same graph was compiled
+    before (and storing it in the cache otherwise). Falls back to a plain theano.function when the cache is off or
+    the function can't be cached.
+
+    :return: the compiled function
+    :rtype: theano.compile.function_module.Function
+    """
+    mode = kwargs.get('mode')
+    if not is_enabled() or not is_supported() or kwargs.get('profile') or \
+            not (mode is None or isinstance(mode, basestring)):
+        return theano.function(inputs, outputs=outputs, updates=updates, givens=givens, **kwargs)
+
+    update_pairs = _pairs(updates)
+    given_pairs = _pairs(givens)
+    try:
+        shared = _graph_shared(inputs, outputs, update_pairs, given_pairs)
+        key = _key(inputs, outputs, update_pairs, given_pairs, shared, kwargs)
+    except Exception:
+        log.exception("Couldn't hash the graph for the function cache, compiling normally.")
+        return theano.function(inputs, outputs=outputs, updates=updates, givens=givens, **kwargs)
+    path = os.path.join(_settings['directory'], key + '.pkl')
+
+    f = _load(path, shared)
+    if f is not None:
+        log.debug("Loaded function %s from the function cache", str(kwargs.get('name')))
+        return f
+
+    t = time.time()
+    f = theano.function(inputs, outputs=outputs, updates=updates, givens=givens, **kwargs)
+    log.debug("Compiling function %s took %s", str(kwargs.get('name')), make_time_units_string(time.time() - t))
+    _store(path, f, shared)
+    return f
+
+def _load(path, shared):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            entry = cPickle.load(f)
+        function = entry['function']
+        cached_shared = function.get_shared()
+        swap = dict((cached, shared[index]) for cached, index in zip(cached_shared, entry['shared_order']))
+        function = function.copy(swap=swap)
+        # mark it as recently used for the LRU eviction
+        os.utime(path, None)
+        return function
+    except Exception:
+        log.exception("Couldn't load the cached function %s, compiling it again.", path)
+        return None
+
+def _store(path, function, shared):
+    tmp_path = path + '.tmp%d' % os.getpid()
+    try:
+        function_shared = function.get_shared()
+        shared_order = [shared.index(variable) for variable in function_shared]
+        # swap the real shared variables (i.e. the model parameters) for tiny placeholders, so their values aren't
+        # pickled along with the function
+        swap = dict((variable, _placeholder(variable)) for variable in function_shared)
+        light = function.copy(swap=swap)
+        with open(tmp_path, 'wb') as f:
+            cPickle.dump({'function': light, 'shared_order': shared_order}, f, protocol=cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+    except Exception:
+        log.exception("Couldn't store the function in the function cache.")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _evict()
+
+def _evict():
+    """
+    Deletes the least recently used functions until the cache is under its size limit.
+    """
+    directory = _settings['directory']
+    try:
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith('.pkl'):
+                stat = os.stat(os.path.join(directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= _settings['max_bytes']:
+                break
+            os.remove(os.path.join(directory, name))
+            total -= size
+            log.debug("Evicted %s from the function cache", name)
+    except OSError:
+        log.exception("Couldn't clean up the function cache %s", directory)
+
+# turn the cache on from the environment
+if os.environ.get('OPENDEEP_FUNCTION_CACHE'):
+    enable(os.environ['OPENDEEP_FUNCTION_CACHE'])
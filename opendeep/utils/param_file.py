@@ -0,0 +1,163 @@
+"""
+.. module:: param_file
+
+A fast file format for model parameters (.params). A file is a small JSON manifest (the name, shape, dtype, and byte
+offset of each parameter) followed by one contiguous binary blob of the raw parameter values:
+
+    'ODPARAMS' | manifest length (8 bytes, little endian) | JSON manifest | padding | raw values
+
+Each parameter starts on an aligned offset, so it can be memory-mapped straight out of the file. Loading only reads
+the manifest up front - parameters are read (or paged in) by name when they are used, instead of unpickling the
+whole file.
+"""
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import json
+import struct
+from collections import OrderedDict
+# third party libraries
+import numpy
+
+log = logging.getLogger(__name__)
+
+_MAGIC   = 'ODPARAMS'
+_VERSION = 1
+# byte alignment of the blob and of each parameter in it
+_ALIGN   = 64
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+def save_param_file(path, names, values):
+    """
+    Writes the parameter values to a .params file.
+
+    :param path: the filesystem path to write to
+    :type path: String
+
+    :param names: the (unique) name of each parameter
+    :type names: List(String)
+
+    :param values: the value of each parameter
+    :type values: List(array)
+    """
+    if len(names) != len(values):
+        log.error("Got %d names for %d parameter values!", len(names), len(values))
+        raise AssertionError("Got %d names for %d parameter values!" % (len(names), len(values)))
+    if len(set(names)) != len(names):
+        log.error("Parameter names need to be unique, found %s", str(names))
+        raise AssertionError("Parameter names need to be unique, found %s" % str(names))
+
+    values = [numpy.ascontiguousarray(value) for value in values]
+    params = []
+    offset = 0
+    for name, value in zip(names, values):
+        offset = _aligned(offset)
+        params.append({'name': name,
+                       'shape': list(value.shape),
+                       'dtype': value.dtype.str,
+                       'offset': offset,
+                       'nbytes': value.nbytes})
+        offset += value.nbytes
+    manifest = json.dumps({'version': _VERSION, 'params': params})
+    data_start = _aligned(len(_MAGIC) + 8 + len(manifest))
+
+    with open(path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(struct.pack('<Q', len(manifest)))
+        f.write(manifest)
+        for param, value in zip(params, values):
+            f.seek(data_start + param['offset'])
+            f.write(value.data)
+        # make sure the file covers the full blob even if the last parameters are empty
+        f.truncate(data_start + offset)
+
+def read_manifest(path):
+    """
+    Reads the manifest of a .params file.
+
+    :param path: the filesystem path to the .params file
+    :type path: String
+
+    :return: the manifest entry (name, shape, dtype, offset, nbytes) for each parameter by name, and the byte offset
+    of the blob in the file
+    :rtype: Tuple(OrderedDict, Integer)
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(_MAGIC))
+        if magic != _MAGIC:
+            log.error("%s isn't a .params file!", str(path))
+            raise AssertionError("%s isn't a .params file!" % str(path))
+        (length,) = struct.unpack('<Q', f.read(8))
+        manifest = json.loads(f.read(length))
+    if manifest.get('version') != _VERSION:
+        log.error("Params file %s has version %s, expected %s", str(path), str(manifest.get('version')), str(_VERSION))
+        raise AssertionError("Unsupported params file version %s" % str(manifest.get('version')))
+    params = OrderedDict((param['name'], param) for param in manifest['params'])
+    return params, _aligned(len(_MAGIC) + 8 + length)
+
+def load_param_file(path, names=None, mmap=True):
+    """
+    Loads parameter values from a .params file.
+
+    :param path: the filesystem path to the .params file
+    :type path: String
+
+    :param names: the names of the parameters to load. Defaults to all of them.
+    :type names: List(String)
+
+    :param mmap: whether to memory-map the values (copy-on-write) instead of reading them into memory. Mapped pages
+    are only read from disk when they are used, and are shared between processes loading the same file.
+    :type mmap: Boolean
+
+    :return: the values by parameter name, in the order of names (or of the file)
+    :rtype: OrderedDict
+    """
+    params, data_start = read_manifest(path)
+    if names is None:
+        names = list(params.keys())
+    missing = [name for name in names if name not in params]
+    if len(missing) > 0:
+        log.error("Params file %s is missing the parameters %s", str(path), str(missing))
+        raise KeyError("Params file %s is missing the parameters %s" % (str(path), str(missing)))
+
+    values = OrderedDict()
+    with open(path, 'rb') as f:
+        for name in names:
+            param = params[name]
+            dtype = numpy.dtype(str(param['dtype']))
+            shape = tuple(param['shape'])
+            if param['nbytes'] == 0:
+                values[name] = numpy.zeros(shape, dtype=dtype)
+            elif mmap:
+                values[name] = numpy.memmap(f, dtype=dtype, mode='c', offset=data_start + param['offset'],
+                                            shape=shape)
+            else:
+                f.seek(data_start + param['offset'])
+                values[name] = numpy.fromfile(f, dtype=dtype, count=int(numpy.prod(shape))).reshape(shape)
+    return values
+
+def param_names(params):
+    """
+    Makes unique names for a list of shared variables - their own names where they are unique, with the position
+    appended otherwise (and just the position for unnamed ones).
+
+    :param params: the shared variables
+    :type params: List(shared variable)
+
+    :return: a unique name for each one
+    :rtype: List(String)
+    """
+    names = [param.name for param in params]
+    counts = {}
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    return [name if name is not None and counts[name] == 1 else '%s_%d' % (name or 'param', i)
+            for i, name in enumerate(names)]
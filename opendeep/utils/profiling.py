@@ -0,0 +1,288 @@
+"""
+.. module:: profiling
+
+Op-level profiling of the compiled theano functions, to see which ops dominate training (i.e. the convolutions vs.
+the elementwise ops of cross_channel_normalization_bc01 vs. the dots in AlexNet) before deciding what to optimize.
+
+While profiling is on, opendeep.function() compiles every function with its own theano ProfileStats. report()
+aggregates all of them into one report - the calls and time of every function, and the time, calls, and output memory
+of every op (both by op instance and by op type) - and save_report() writes it out as JSON and text.
+
+Profiling is off by default. Turn it on for the whole process with the OPENDEEP_PROFILE environment variable or by
+calling enable() before the model is built, so its functions (f_predict, the monitors) are profiled as well as the
+optimizer's - the profiles are collected until reset(). To profile only one part of a program, start() and stop() (or
+the profiled() context manager) collect the profiles of the functions compiled in between into their own list,
+without turning profiling on for anything else. The SGD optimizers do this with their 'profile' option, and save the
+report next to the checkpoints after training. The model's monitor functions were usually compiled before that, so
+the optimizers run profiled copies of them (see profiled_copy()). The model's f_predict isn't called during training,
+so it is only in the report when profiling is on for the whole process.
+Only the calls made in this process are profiled (not the ones in forked worker processes). The output memory
+needs theano to record the output shapes (the profile_memory theano flag).
+"""
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import os
+import inspect
+import json
+from contextlib import contextmanager
+# third party libraries
+import numpy
+from theano.compile.profiling import ProfileStats
+from theano.compile.function_module import Function
+# internal imports
+from opendeep.utils.misc import make_time_units_string
+
+log = logging.getLogger(__name__)
+
+_settings = {'enabled': bool(os.environ.get('OPENDEEP_PROFILE'))}
+# the ProfileStats of every function compiled while profiling was on for the whole process
+_profiles = []
+# the lists collecting the profiles of the functions compiled between start() and stop()
+_collectors = []
+
+def enable():
+    """
+    Turns on profiling for every function compiled from now on.
+    """
+    _settings['enabled'] = True
+
+def disable():
+    """
+    Turns off profiling for the functions compiled from now on (the ones already compiled keep profiling).
+    """
+    _settings['enabled'] = False
+
+def is_enabled():
+    """
+    :return: whether profiling is on for the whole process
+    :rtype: Boolean
+    """
+    return _settings['enabled']
+
+def is_active():
+    """
+    :return: whether the functions compiled now get profiled - globally or between a start() and stop()
+    :rtype: Boolean
+    """
+    return _settings['enabled'] or len(_collectors) > 0
+
+def reset():
+    """
+    Forgets the profiles collected for the whole process so far.
+    """
+    del _profiles[:]
+
+def get_profiles():
+    """
+    :return: the profiles collected for the whole process since the last reset()
+    :rtype: List(ProfileStats)
+    """
+    return list(_profiles)
+
+def start(profiles):
+    """
+    Profiles the functions compiled from now on until stop(), collecting their profiles into the given list. This
+    doesn't turn on profiling for the whole process.
+
+    :param profiles: the list to collect the profiles into
+    :type profiles: List
+    """
+    _collectors.append(profiles)
+
+def stop(profiles):
+    """
+    Stops collecting profiles into the list given to start().
+
+    :param profiles: the list given to start()
+    :type profiles: List
+    """
+    for i, collector in enumerate(_collectors):
+        if collector is profiles:
+            del _collectors[i]
+            return
+
+@contextmanager
+def profiled(profiles=None):
+    """
+    Profiles the functions compiled inside the with block.
+
+    :param profiles: the list to collect the profiles into. Defaults to a new one.
+    :type profiles: List
+
+    :return: the list of collected profiles (as the with statement's target)
+    :rtype: List(ProfileStats)
+    """
+    profiles = [] if profiles is None else profiles
+    start(profiles)
+    try:
+        yield profiles
+    finally:
+        stop(profiles)
+
+def new_profile(name=None):
+    """
+    :param name: the name of the function being compiled
+    :type name: String
+
+    :return: the ProfileStats to compile the function with, collected for the report
+    :rtype: theano.compile.profiling.ProfileStats
+    """
+    # don't let theano print every profile at exit, the report has them
+    profile = ProfileStats(atexit_print=False, message=name or 'unnamed function')
+    if _settings['enabled']:
+        _profiles.append(profile)
+    for collector in _collectors:
+        collector.append(profile)
+    return profile
+
+def profiled_copy(fn, name=None):
+    """
+    Copies a function that was compiled without profiling (i.e. a model's monitor function compiled before start()),
+    compiling the copy with a new profile that is collected like the ones from new_profile(). The copy shares the
+    function's shared variables, and theano doesn't optimize the graph again.
+
+    :param fn: the compiled function
+    :type fn: theano.compile.function_module.Function
+
+    :param name: the name for the profile. Defaults to the function's name.
+    :type name: String
+
+    :return: the profiled copy, or fn itself if it is already profiled, isn't a compiled theano function, or theano
+    can't copy functions with a new profile (before 0.8)
+    :rtype: theano.compile.function_module.Function
+    """
+    if not isinstance(fn, Function) or getattr(fn, 'profile', None):
+        return fn
+    name = name or getattr(fn, 'name', None)
+    try:
+        supported = 'profile' in inspect.getargspec(Function.copy).args
+    except (AttributeError, TypeError):
+        supported = False
+    if not supported:
+        log.warning("This theano can't copy functions with a new profile, %s won't be profiled.", str(name))
+        return fn
+    return fn.copy(profile=new_profile(name))
+
+def _node(key):
+    # newer theano versions key the apply nodes by (fgraph, node)
+    return key[1] if isinstance(key, tuple) else key
+
+def _output_bytes(profile, node):
+    """
+    :return: the bytes of the node's outputs from the last call, if theano recorded their shapes
+    :rtype: Integer
+    """
+    shapes = getattr(profile, 'variable_shape', None) or {}
+    total = 0
+    for output in node.outputs:
+        shape = shapes.get(output)
+        dtype = getattr(output, 'dtype', None)
+        if isinstance(shape, (tuple, list)) and dtype is not None:
+            total += int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize
+    return total
+
+def _add(table, key, seconds, calls, nbytes):
+    entry = table.setdefault(key, {'time': 0., 'calls': 0, 'nodes': 0, 'output_bytes': 0})
+    entry['time'] += seconds
+    entry['calls'] += calls
+    entry['nodes'] += 1
+    entry['output_bytes'] = max(entry['output_bytes'], nbytes)
+
+def _rows(table, total_time, key_name):
+    rows = []
+    for key, entry in table.items():
+        row = {key_name: key}
+        row.update(entry)
+        row['time_fraction'] = entry['time'] / total_time if total_time > 0 else 0.
+        rows.append(row)
+    return sorted(rows, key=lambda row: row['time'], reverse=True)
+
+def report(profiles=None):
+    """
+    Aggregates the profiles into one report.
+
+    :param profiles: the profiles to aggregate. Defaults to the ones collected for the whole process.
+    :type profiles: List(ProfileStats)
+
+    :return: the functions ('functions'), the ops by instance ('ops') and by type ('op_types') - each sorted by
+    time, with their calls, number of apply nodes, largest output memory in bytes, and share of the total op time -
+    and the total op time ('op_time')
+    :rtype: Dictionary
+    """
+    profiles = _profiles if profiles is None else profiles
+    functions = []
+    ops = {}
+    op_types = {}
+    for profile in profiles:
+        functions.append({'function': profile.message,
+                          'calls': int(profile.fct_callcount),
+                          'time': float(profile.fct_call_time),
+                          'compile_time': float(getattr(profile, 'compile_time', 0.))})
+        for key, seconds in profile.apply_time.items():
+            node = _node(key)
+            calls = int(profile.apply_callcount.get(key, 0))
+            nbytes = _output_bytes(profile, node)
+            _add(ops, str(node.op), float(seconds), calls, nbytes)
+            _add(op_types, type(node.op).__name__, float(seconds), calls, nbytes)
+    op_time = sum(entry['time'] for entry in ops.values())
+    return {'functions': sorted(functions, key=lambda function: function['time'], reverse=True),
+            'ops': _rows(ops, op_time, 'op'),
+            'op_types': _rows(op_types, op_time, 'op_type'),
+            'op_time': op_time}
+
+def format_report(profile_report, n_ops=30):
+    """
+    :param profile_report: a report from report()
+    :type profile_report: Dictionary
+
+    :param n_ops: the number of the slowest ops (and op types) to list
+    :type n_ops: Integer
+
+    :return: the report as readable text tables
+    :rtype: String
+    """
+    lines = ['Functions (%d):' % len(profile_report['functions']),
+             '  %10s %8s %12s  %s' % ('time (s)', 'calls', 'compile (s)', 'function')]
+    for function in profile_report['functions']:
+        lines.append('  %10.3f %8d %12.3f  %s' % (function['time'], function['calls'], function['compile_time'],
+                                                  function['function']))
+    lines.append('')
+    lines.append('Total time in ops: %s' % make_time_units_string(profile_report['op_time']))
+    for title, rows, key in [('Op types', profile_report['op_types'], 'op_type'),
+                             ('Ops', profile_report['ops'], 'op')]:
+        lines.append('')
+        lines.append('%s (%d, slowest %d):' % (title, len(rows), min(n_ops, len(rows))))
+        lines.append('  %6s %10s %10s %6s %12s  %s' % ('%', 'time (s)', 'calls', 'nodes', 'out bytes', key))
+        for row in rows[:n_ops]:
+            lines.append('  %5.1f%% %10.3f %10d %6d %12d  %s' % (100. * row['time_fraction'], row['time'],
+                                                                 row['calls'], row['nodes'], row['output_bytes'],
+                                                                 row[key]))
+    return '\n'.join(lines) + '\n'
+
+def save_report(path, profiles=None):
+    """
+    Writes the aggregated report to path + '.json' and path + '.txt'.
+
+    :param path: the path to write the report to, without an extension
+    :type path: String
+
+    :param profiles: the profiles to aggregate. Defaults to the ones collected for the whole process.
+    :type profiles: List(ProfileStats)
+
+    :return: the report
+    :rtype: Dictionary
+    """
+    profile_report = report(profiles)
+    with open(path + '.json', 'w') as f:
+        json.dump(profile_report, f, indent=2)
+    with open(path + '.txt', 'w') as f:
+        f.write(format_report(profile_report))
+    log.info("Saved the profile of %d functions to %s.json and %s.txt", len(profile_report['functions']), path, path)
+    return profile_report
@@ -0,0 +1,101 @@
+"""
+.. module:: shared_memory
+
+Helpers for numpy arrays that live in shared memory, so processes forked with multiprocessing can read and write
+the same buffers without pickling them.
+"""
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import ctypes
+import multiprocessing
+import time
+# third party libraries
+import numpy
+
+log = logging.getLogger(__name__)
+
+def shared_ndarray(shape, dtype):
+    """
+    Allocates a zero-filled numpy array backed by shared memory. Processes forked after the array is created see
+    (and can modify) the same memory.
+
+    :param shape: the shape of the array
+    :type shape: Tuple
+
+    :param dtype: the numpy dtype of the array
+    :type dtype: String or numpy.dtype
+
+    :return: the shared numpy array
+    :rtype: numpy.ndarray
+    """
+    dtype = numpy.dtype(dtype)
+    shape = tuple(int(dim) for dim in shape)
+    size = int(numpy.prod(shape))
+    # RawArray has no lock - synchronization is up to the caller.
+    buf = multiprocessing.RawArray(ctypes.c_char, max(size*dtype.itemsize, 1))
+    # the returned array keeps a reference to buf through its base, so the memory stays alive with the array.
+    return numpy.frombuffer(buf, dtype=dtype, count=size).reshape(shape)
+
+def shared_copy(array):
+    """
+    Copies an array into a new shared memory numpy array.
+
+    :param array: the array to copy
+    :type array: numpy.ndarray
+
+    :return: the shared numpy array with the same shape, dtype, and values
+    :rtype: numpy.ndarray
+    """
+    array = numpy.asarray(array)
+    shared = shared_ndarray(array.shape, array.dtype)
+    shared[...] = array
+    return shared
+
+class Barrier(object):
+    """
+    A reusable barrier for processes forked after it is created (multiprocessing has no Barrier in Python 2).
+    Every call to wait() blocks until all the parties have called it.
+    """
+    def __init__(self, parties):
+        """
+        :param parties: the number of processes that have to call wait() before any of them continue
+        :type parties: Integer
+        """
+        self.parties = parties
+        self._condition = multiprocessing.Condition()
+        # the processes waiting so far, and the number of times the barrier has opened
+        self._count = multiprocessing.RawValue(ctypes.c_int, 0)
+        self._generation = multiprocessing.RawValue(ctypes.c_int, 0)
+
+    def wait(self, timeout=None):
+        """
+        Blocks until all the parties are waiting.
+
+        :param timeout: the seconds to wait before giving up (i.e. because another process died)
+        :type timeout: Float
+
+        :raises: RuntimeError if the timeout passes before the barrier opens
+        """
+        with self._condition:
+            generation = self._generation.value
+            self._count.value += 1
+            if self._count.value == self.parties:
+                self._count.value = 0
+                self._generation.value += 1
+                self._condition.notify_all()
+                return
+            deadline = None if timeout is None else time.time() + timeout
+            while self._generation.value == generation:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    self._count.value -= 1
+                    log.error("Timed out after %s seconds waiting on the barrier", str(timeout))
+                    raise RuntimeError("Timed out after %s seconds waiting on the barrier" % str(timeout))
+                self._condition.wait(remaining)
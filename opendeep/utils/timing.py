@@ -0,0 +1,171 @@
+"""
+.. module:: timing
+
+Low-overhead wall-clock timers for breaking a training epoch down into its phases (waiting on the data iterator,
+the training function, the monitors, evaluation, checkpointing, ...). Each phase keeps every duration it was given,
+so the percentiles show whether a phase is uniformly slow or only slow now and then (i.e. the iterator stalling).
+"""
+__authors__ = "Markus Beissinger"
+__copyright__ = "Copyright 2015, Vitruvian Science"
+__credits__ = ["Markus Beissinger"]
+__license__ = "Apache"
+__maintainer__ = "OpenDeep"
+__email__ = "opendeep-dev@googlegroups.com"
+
+# standard libraries
+import logging
+import time
+from contextlib import contextmanager
+# third party libraries
+import numpy
+from theano.compat.python2x import OrderedDict  # use this compatibility OrderedDict
+# internal imports
+from opendeep.utils.misc import make_time_units_string
+
+log = logging.getLogger(__name__)
+
+# the percentiles reported for every phase
+PERCENTILES = [50, 90, 99]
+
+def phase_stats(durations, percentiles=PERCENTILES):
+    """
+    :param durations: the seconds each occurrence of a phase took
+    :type durations: List(Float)
+
+    :return: the total, count, mean, max, and percentiles (as 'p50', 'p90', ...) of the durations
+    :rtype: Dictionary
+    """
+    durations = numpy.asarray(durations, dtype='float64')
+    stats = {'total': float(numpy.sum(durations)),
+             'count': len(durations),
+             'mean': float(numpy.mean(durations)) if len(durations) > 0 else 0.,
+             'max': float(numpy.max(durations)) if len(durations) > 0 else 0.}
+    for percentile in percentiles:
+        stats['p%d' % percentile] = float(numpy.percentile(durations, percentile)) if len(durations) > 0 else 0.
+    return stats
+
+class PhaseTimer(object):
+    """
+    Accumulates the durations of named phases. Per-batch phases are given their durations directly with add(), so
+    a batch only costs a few calls to time.time(); coarse phases can use the phase() context manager. A phase can be
+    nested in a parent phase (i.e. waiting on the data inside training), and is then reported as a share of its
+    parent instead of the whole.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the durations and the example count, i.e. at the start of every epoch.
+        """
+        self.durations = OrderedDict()
+        self.parents = {}
+        self.examples = 0
+
+    def add(self, phase, seconds, parent=None):
+        """
+        :param phase: the name of the phase
+        :type phase: String
+
+        :param seconds: how long this occurrence of the phase took
+        :type seconds: Float
+
+        :param parent: the name of the phase this one happens inside of, if any
+        :type parent: String
+        """
+        if phase not in self.durations:
+            self.durations[phase] = []
+            if parent is not None:
+                self.parents[phase] = parent
+        self.durations[phase].append(seconds)
+
+    @contextmanager
+    def phase(self, name, parent=None):
+        """
+        Times the body of a with statement as one occurrence of the phase.
+
+        :param name: the name of the phase
+        :type name: String
+
+        :param parent: the name of the phase this one happens inside of, if any
+        :type parent: String
+        """
+        t = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - t, parent)
+
+    def total(self, phase):
+        """
+        :return: the seconds spent in the phase so far
+        :rtype: Float
+        """
+        return float(sum(self.durations.get(phase, [])))
+
+    def summary(self):
+        """
+        :return: the phase_stats() of every phase, in the order the phases first happened - with the name of the
+        parent phase under 'parent' for the nested ones
+        :rtype: OrderedDict
+        """
+        summary = OrderedDict()
+        for phase, durations in self.durations.items():
+            summary[phase] = phase_stats(durations)
+            if phase in self.parents:
+                summary[phase]['parent'] = self.parents[phase]
+        return summary
+
+def format_phases(phases, total=None):
+    """
+    :param phases: phase statistics from PhaseTimer.summary()
+    :type phases: Dictionary
+
+    :param total: the seconds to give each top-level phase's share of (i.e. the whole epoch). Nested phases are given
+    as a share of their parent phase, so the shares at each level add up to at most 100%.
+    :type total: Float
+
+    :return: a one-line readable breakdown of the phases
+    :rtype: String
+    """
+    parts = []
+    for phase, stats in phases.items():
+        part = '%s %s' % (phase, make_time_units_string(stats['total']))
+        parent = stats.get('parent')
+        if parent is not None:
+            if parent in phases and phases[parent]['total'] > 0:
+                part += ' (%.1f%% of %s)' % (100. * stats['total'] / phases[parent]['total'], parent)
+        elif total:
+            part += ' (%.1f%%)' % (100. * stats['total'] / total)
+        if stats['count'] > 1:
+            part += ' [%d calls, %s]' % (stats['count'],
+                                        ', '.join('p%d %s' % (percentile,
+                                                              make_time_units_string(stats['p%d' % percentile]))
+                                                  for percentile in PERCENTILES))
+        parts.append(part)
+    return ', '.join(parts)
+
+def epoch_percentiles(epoch_timings):
+    """
+    Summarizes the per-epoch timings of a training run.
+
+    :param epoch_timings: the timings for every epoch, each with the phase statistics under 'phases'
+    :type epoch_timings: List(Dictionary)
+
+    :return: the phase_stats() over the epochs of each phase's total time per epoch, plus the examples/sec
+    :rtype: OrderedDict
+    """
+    totals = OrderedDict()
+    parents = {}
+    for timing in epoch_timings:
+        for phase, stats in timing['phases'].items():
+            if phase not in totals:
+                totals[phase] = []
+            totals[phase].append(stats['total'])
+            if 'parent' in stats:
+                parents[phase] = stats['parent']
+    summary = OrderedDict((phase, phase_stats(values)) for phase, values in totals.items())
+    for phase, parent in parents.items():
+        summary[phase]['parent'] = parent
+    summary['examples_per_sec'] = phase_stats([timing['examples_per_sec'] for timing in epoch_timings])
+    return summary